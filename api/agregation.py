@@ -0,0 +1,74 @@
+# Fichier: agregation.py
+# Agrégation vectorisée (NumPy) de l'historique de plusieurs capteurs par intervalles de temps
+
+import math
+import re
+
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+
+AGREGATIONS = ("avg", "sum", "min", "max", "p95")
+
+# Unités acceptées dans group_by (ex: "30s", "5m", "1h", "1d")
+UNITES = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def analyser_duree(texte):
+    """Convertit une durée comme "5m" en secondes. Lève ValueError si elle est invalide."""
+    correspondance = re.fullmatch(r"(\d+)([smhd])", texte or "")
+    if correspondance is None or int(correspondance.group(1)) == 0:
+        raise ValueError(f"Durée invalide: {texte}")
+    return int(correspondance.group(1)) * UNITES[correspondance.group(2)]
+
+def agreger_par_intervalle(capteurs, timestamps, valeurs, pas, agregation):
+    """Agrège des séries de plusieurs capteurs par intervalles de pas secondes.
+
+    capteurs, timestamps et valeurs sont des tableaux de même longueur (un
+    élément par point). La valeur d'un capteur dans un intervalle est la
+    moyenne de ses points; l'agrégation s'applique ensuite entre capteurs,
+    si bien que "sum" additionne les capteurs et non leurs lectures.
+
+    Retourne une liste de (debut_intervalle, valeur, nombre_capteurs).
+    """
+    if len(timestamps) == 0:
+        return []
+
+    intervalles = np.floor(timestamps / pas).astype(np.int64)
+
+    # Moyenne par (capteur, intervalle), avec une clé entière triée par intervalle puis capteur
+    premier = intervalles.min()
+    nombre_capteurs = int(capteurs.max()) + 1
+    cles = (intervalles - premier) * nombre_capteurs + capteurs
+    cles_uniques, inverse = np.unique(cles, return_inverse=True)
+    moyennes = np.bincount(inverse, weights=valeurs) / np.bincount(inverse)
+    intervalles_capteur = cles_uniques // nombre_capteurs + premier
+
+    # Agrégation entre capteurs
+    debuts_groupes = np.flatnonzero(np.r_[True, intervalles_capteur[1:] != intervalles_capteur[:-1]])
+    nombres = np.diff(np.r_[debuts_groupes, len(intervalles_capteur)])
+
+    if agregation == "sum":
+        resultats = np.add.reduceat(moyennes, debuts_groupes)
+    elif agregation == "avg":
+        resultats = np.add.reduceat(moyennes, debuts_groupes) / nombres
+    elif agregation == "min":
+        resultats = np.minimum.reduceat(moyennes, debuts_groupes)
+    elif agregation == "max":
+        resultats = np.maximum.reduceat(moyennes, debuts_groupes)
+    elif agregation == "p95":
+        # Rang le plus proche, après tri des valeurs à l'intérieur de chaque intervalle
+        ordre = np.lexsort((moyennes, intervalles_capteur))
+        moyennes_triees = moyennes[ordre]
+        rangs = np.ceil(0.95 * nombres).astype(np.int64) - 1
+        resultats = moyennes_triees[debuts_groupes + rangs]
+    else:
+        raise ValueError(f"Agrégation inconnue: {agregation}")
+
+    return [
+        (intervalle * pas, valeur, nombre)
+        for intervalle, valeur, nombre in zip(intervalles_capteur[debuts_groupes].tolist(), resultats.tolist(),
+                                              nombres.tolist())
+        if not math.isnan(valeur)
+    ]
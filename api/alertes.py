@@ -0,0 +1,160 @@
+# Fichier: alertes.py
+# Moteur d'alertes évalué à la réception des messages: règles à seuil et détecteurs EWMA
+
+import math
+import operator
+import threading
+import time
+from collections import deque
+
+OPERATEURS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne
+}
+
+class RegleCompilee:
+    """Règle déclarative prête à être évaluée sur un payload.
+
+    Une règle compare un champ à une valeur fixe ("valeur") ou à un autre champ
+    du même élément ("champ_reference"). Avec "pour_chaque", elle est évaluée
+    sur chaque élément d'une liste du payload (ex: les salles d'un bâtiment).
+    L'alerte est déclenchée lorsque la condition est vraie depuis "duree" secondes.
+    """
+
+    def __init__(self, regle):
+        if regle.get("operateur") not in OPERATEURS:
+            raise ValueError(f"Règle {regle.get('nom')}: opérateur inconnu {regle.get('operateur')}")
+        if ("valeur" in regle) == ("champ_reference" in regle):
+            raise ValueError(f"Règle {regle.get('nom')}: 'valeur' ou 'champ_reference' attendu")
+
+        self.nom = regle["nom"]
+        self.duree = regle.get("duree", 0)
+        self.gravite = regle.get("gravite", "avertissement")
+        self.champ = regle["champ"]
+        self.liste = regle.get("pour_chaque")
+
+        comparer = OPERATEURS[regle["operateur"]]
+        champ = self.champ
+        if "valeur" in regle:
+            valeur = regle["valeur"]
+            def predicat(element):
+                mesure = element.get(champ)
+                return mesure is not None and comparer(mesure, valeur)
+        else:
+            reference = regle["champ_reference"]
+            def predicat(element):
+                mesure, seuil = element.get(champ), element.get(reference)
+                return mesure is not None and seuil is not None and comparer(mesure, seuil)
+        self.predicat = predicat
+
+    def elements(self, payload):
+        """Retourne les (identifiant d'élément, élément) sur lesquels évaluer la règle."""
+        if self.liste is None:
+            return ((None, payload),)
+        return ((element.get("nom", indice), element) for indice, element in enumerate(payload.get(self.liste, [])))
+
+class MoteurAlertes:
+    """Évalue les règles et les détecteurs d'anomalies d'une catégorie à chaque lecture.
+
+    Les règles sont compilées une fois et rangées par catégorie: le coût par
+    message est proportionnel au nombre de règles et de champs surveillés de sa
+    catégorie. Les détecteurs suivent, par capteur et par champ, une moyenne et
+    une variance à décroissance exponentielle (EWMA) et signalent les valeurs
+    dont le score z dépasse seuil_z.
+
+    evaluer() est appelée depuis le seul thread MQTT; le journal des alertes
+    est partagé avec les routes et protégé par son propre verrou.
+    """
+
+    def __init__(self, regles, detecteurs, alpha=0.1, seuil_z=4.0, echauffement=20, taille_journal=1000):
+        self.regles = {}
+        for regle in regles:
+            self.regles.setdefault(regle["categorie"], []).append(RegleCompilee(regle))
+        self.detecteurs = detecteurs
+        self.alpha = alpha
+        self.seuil_z = seuil_z
+        self.echauffement = echauffement
+
+        # Conditions en cours: {(regle, capteur, element): debut}, et celles ayant déclenché une alerte
+        self.conditions = {}
+        self.actives = set()
+        # État EWMA: {(categorie, capteur, champ): [moyenne, variance, nombre]}
+        self.ewma = {}
+
+        self.journal = deque(maxlen=taille_journal)
+        self.verrou_journal = threading.Lock()
+        self.nombre_alertes = 0
+
+    def evaluer(self, categorie, capteur_id, payload):
+        """Évalue une lecture et retourne la liste des alertes produites."""
+        alertes = []
+        timestamp = payload.get("timestamp") or time.time()
+
+        for regle in self.regles.get(categorie, ()):
+            for element_id, element in regle.elements(payload):
+                cle = (regle.nom, capteur_id, element_id)
+                if regle.predicat(element):
+                    debut = self.conditions.setdefault(cle, timestamp)
+                    if cle not in self.actives and timestamp - debut >= regle.duree:
+                        self.actives.add(cle)
+                        alertes.append(self._alerte("regle", regle.nom, "declenchee", categorie, capteur_id,
+                                                    element_id, element.get(regle.champ), timestamp, regle.gravite))
+                elif self.conditions.pop(cle, None) is not None and cle in self.actives:
+                    self.actives.discard(cle)
+                    alertes.append(self._alerte("regle", regle.nom, "resolue", categorie, capteur_id,
+                                                element_id, element.get(regle.champ), timestamp, regle.gravite))
+
+        for champ in self.detecteurs.get(categorie, ()):
+            valeur = payload.get(champ)
+            if not isinstance(valeur, (int, float)) or isinstance(valeur, bool):
+                continue
+            cle = (categorie, capteur_id, champ)
+            etat = self.ewma.get(cle)
+            if etat is None:
+                self.ewma[cle] = [valeur, 0.0, 1]
+                continue
+
+            moyenne, variance, nombre = etat
+            ecart = valeur - moyenne
+            if nombre >= self.echauffement and variance > 0:
+                z = ecart / math.sqrt(variance)
+                if abs(z) > self.seuil_z:
+                    alerte = self._alerte("anomalie", f"anomalie_{champ}", "declenchee", categorie, capteur_id,
+                                          None, valeur, timestamp, "avertissement")
+                    alerte.update({"z": round(z, 2), "moyenne": moyenne, "ecart_type": math.sqrt(variance)})
+                    alertes.append(alerte)
+
+            increment = self.alpha * ecart
+            etat[0] = moyenne + increment
+            etat[1] = (1 - self.alpha) * (variance + ecart * increment)
+            etat[2] = nombre + 1
+
+        if alertes:
+            with self.verrou_journal:
+                self.journal.extend(alertes)
+                self.nombre_alertes += len(alertes)
+        return alertes
+
+    def _alerte(self, type_alerte, nom, etat, categorie, capteur_id, element_id, valeur, timestamp, gravite):
+        alerte = {
+            "type": type_alerte,
+            "nom": nom,
+            "etat": etat,
+            "categorie": categorie,
+            "capteur_id": capteur_id,
+            "valeur": valeur,
+            "timestamp": timestamp,
+            "gravite": gravite
+        }
+        if element_id is not None:
+            alerte["element"] = element_id
+        return alerte
+
+    def dernieres(self, limite=100):
+        """Retourne les dernières alertes du journal, de la plus récente à la plus ancienne."""
+        with self.verrou_journal:
+            return list(self.journal)[-limite:][::-1] if limite > 0 else []
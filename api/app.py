@@ -6,17 +6,34 @@ API REST pour accéder aux données des capteurs IoT.
 Ce script s'abonne aux topics MQTT, stocke les données et les expose via une API REST.
 """
 
+import csv
+import io
 import json
+import sys
 import time
 import uuid
+from array import array
+from collections import OrderedDict, deque
 import threading
 import logging
 from datetime import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO
 import paho.mqtt.client as mqtt_client
 from config import *
+from categories import (CATEGORIES, CHAMPS_HISTORIQUE, CLASSEMENTS, SUFFIXE_LOT, trouver_categorie,
+                        sous_dictionnaire, extraire_point_historique)
+from instantane import ecrire_instantane, charger_instantane
+from archive import ArchiveFroide
+import agregation
+from classements import Classement
+from statistiques import StatistiquesCapteurs
+from alertes import MoteurAlertes
+from fraicheur import SuiviFraicheur
+from metriques import Registre, VerrouInstrumente, BORNES_REQUETES, BORNES_LATENCES
+from tracage import SuiviSequences
+from profilage import SessionProfilage, MODES as MODES_PROFILAGE
 
 # Configuration du logging
 logging.basicConfig(
@@ -54,8 +71,338 @@ historique_donnees = {
     }
 }
 
+# Métriques exposées par /metrics. Les compteurs et histogrammes sont agrégés par thread:
+# les incrémenter ne prend aucun verrou partagé.
+registre_metriques = Registre()
+messages_recus = registre_metriques.compteur(
+    "iot_messages_recus_total", "Messages MQTT reçus, par préfixe de topic", ("prefixe",))
+erreurs_decodage = registre_metriques.compteur(
+    "iot_erreurs_decodage_json_total", "Messages MQTT dont le JSON est invalide")
+erreurs_traitement = registre_metriques.compteur(
+    "iot_erreurs_traitement_total", "Messages MQTT dont le traitement a échoué")
+duree_traitement = registre_metriques.histogramme(
+    "iot_traitement_message_secondes", "Durée de traitement d'un message MQTT", ("prefixe",))
+attente_verrou = registre_metriques.histogramme(
+    "iot_verrou_attente_secondes", "Attente avant l'acquisition d'un verrou", ("verrou",))
+detention_verrou = registre_metriques.histogramme(
+    "iot_verrou_detention_secondes", "Durée de détention d'un verrou", ("verrou",))
+emissions_socketio = registre_metriques.compteur(
+    "iot_socketio_emissions_total", "Événements Socket.IO émis", ("evenement",))
+duree_requetes = registre_metriques.histogramme(
+    "iot_http_requete_secondes", "Durée des requêtes HTTP, par route", ("route", "methode"), BORNES_REQUETES)
+requetes_http = registre_metriques.compteur(
+    "iot_http_requetes_total", "Requêtes HTTP, par route et code de statut", ("route", "code"))
+latences_pipeline = registre_metriques.histogramme(
+    "iot_latence_secondes", "Latence des lectures par étape: publication_reception (simulateur vers API) "
+    "et reception_emission (traitement par l'API jusqu'à l'événement Socket.IO)", ("etape", "categorie"),
+    BORNES_LATENCES)
+anomalies_sequence = registre_metriques.compteur(
+    "iot_sequences_anomalies_total", "Lectures perdues, arrivées en désordre, doublons et redémarrages de "
+    "simulateur détectés par les numéros de séquence", ("categorie", "type"))
+duree_nettoyage = registre_metriques.histogramme(
+    "iot_nettoyage_secondes", "Durée des nettoyages de l'historique: totale et sous le verrou des données",
+    ("etape",), BORNES_REQUETES)
+
+# Début (heure time.time()) et durées du dernier nettoyage, exposés par /metrics
+dernier_nettoyage = {"debut": 0.0, "verrou": 0.0, "total": 0.0}
+
 # Verrou pour protéger l'accès aux données
-verrou_donnees = threading.Lock()
+verrou_donnees = VerrouInstrumente("donnees", attente_verrou, detention_verrou)
+
+# Identifiants de session des clients Socket.IO connectés
+clients_socketio = set()
+
+# Backend de persistance de l'historique (None: historique uniquement en mémoire).
+# Lorsqu'il est actif, historique_donnees ne conserve que le tier chaud (DUREE_TIER_CHAUD).
+backend_historique = None
+
+# Classements des capteurs par métrique, protégés par verrou_donnees
+classements = {
+    categorie: {metrique: Classement() for metrique in metriques}
+    for categorie, metriques in CLASSEMENTS.items()
+}
+
+# Sketches de quantiles des champs numériques de l'historique, protégés par verrou_donnees
+statistiques_capteurs = StatistiquesCapteurs(
+    {categorie: [nom for nom, type_champ in champs if type_champ != "BOOLEAN"]
+     for categorie, champs in CHAMPS_HISTORIQUE.items()},
+    PAS_STATISTIQUES, NOMBRE_INTERVALLES_STATISTIQUES, TAILLE_SKETCH
+)
+
+# Moteur d'alertes, règles compilées au démarrage
+moteur_alertes = MoteurAlertes(REGLES_ALERTES, DETECTEURS_EWMA, ALPHA_EWMA, SEUIL_Z_EWMA, ECHAUFFEMENT_EWMA,
+                               TAILLE_JOURNAL_ALERTES)
+
+# Dernière réception et échéances des capteurs (détection des capteurs périmés), protégé par verrou_donnees
+suivi_fraicheur = SuiviFraicheur(INTERVALLES_ATTENDUS, TOLERANCE_FRAICHEUR)
+
+# Numéros de séquence reçus de chaque capteur (pertes et doublons), protégé par verrou_donnees
+suivi_sequences = SuiviSequences()
+
+# Session de profilage à la demande (la dernière, conservée pour son résultat) et requêtes lentes,
+# utilisées seulement lorsque PROFILAGE_ACTIF est vrai
+session_profilage = None
+verrou_profilage = threading.Lock()
+requetes_lentes = deque(maxlen=TAILLE_JOURNAL_REQUETES_LENTES)
+
+# Version des données de chaque catégorie, incrémentée à chaque modification de l'historique
+versions_donnees = {categorie: 0 for categorie in CATEGORIES}
+
+# Cache des résultats de /api/query, indexé par (requête, version des données)
+cache_requetes = OrderedDict()
+verrou_cache = threading.Lock()
+
+# Archive à froid recevant l'historique expiré (None: l'historique expiré est supprimé)
+archive_froide = None
+
+# Suivi du redémarrage à chaud: capteurs de l'instantané chargé pas encore rafraîchis
+demarrage = {
+    "debut": time.time(),
+    "capteurs_instantane": 0,
+    "capteurs_en_attente": set(),
+    "duree_instantane_complet": None  # Délai avant que tous les capteurs aient été rafraîchis
+}
+
+def creer_backend_historique():
+    """Crée le backend de persistance configuré par BACKEND_HISTORIQUE."""
+    if BACKEND_HISTORIQUE == "memoire":
+        return None
+    if BACKEND_HISTORIQUE == "sqlite":
+        from persistance_sqlite import StockageSQLite
+        return StockageSQLite(FICHIER_SQLITE, CHAMPS_HISTORIQUE, DELAI_ECRITURE_MS, TAILLE_LOT_ECRITURE)
+    if BACKEND_HISTORIQUE == "segments":
+        from persistance_segments import JournalSegments
+        return JournalSegments(REPERTOIRE_SEGMENTS, CHAMPS_HISTORIQUE, TAILLE_SEGMENT, DUREE_SEGMENT,
+                               PAS_INDEX_SEGMENT, DELAI_ECRITURE_MS)
+    raise ValueError(f"Backend d'historique inconnu: {BACKEND_HISTORIQUE}")
+
+def marquer_rafraichi(categorie, capteur_id):
+    """Note qu'un capteur de l'instantané a reçu une valeur depuis le démarrage (verrou acquis)."""
+    en_attente = demarrage["capteurs_en_attente"]
+    if en_attente:
+        en_attente.discard((categorie, capteur_id))
+        if not en_attente:
+            demarrage["duree_instantane_complet"] = time.time() - demarrage["debut"]
+            logger.info(f"Données de tous les capteurs rafraîchies {demarrage['duree_instantane_complet']:.1f} s "
+                        f"après le démarrage")
+
+def indexer_classements(categorie, capteur_id, payload):
+    """Met à jour les classements de la catégorie avec la lecture d'un capteur (verrou acquis)."""
+    for metrique, classement in classements.get(categorie, {}).items():
+        valeur = payload.get(metrique)
+        if isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+            classement.mettre_a_jour(capteur_id, valeur)
+        else:
+            classement.retirer(capteur_id)
+
+def enregistrer_lecture(categorie, capteur_id, payload, recu=None, retenu=False):
+    """Enregistre une lecture dans les données courantes et l'historique.
+    
+    recu est l'instant de réception (par défaut: maintenant). Retourne True si
+    le capteur était périmé. Doit être appelée avec verrou_donnees acquis.
+    
+    Une lecture retenue (renvoyée par le broker) ne prouve pas que le capteur
+    publie encore: elle ne repousse pas son échéance de fraîcheur. Un capteur
+    qu'elle fait découvrir dispose, comme ceux de l'instantané, du délai
+    habituel à partir du démarrage.
+    """
+    sous_dictionnaire(donnees_capteurs, categorie)[capteur_id] = payload
+    indexer_classements(categorie, capteur_id, payload)
+    marquer_rafraichi(categorie, capteur_id)
+    if not retenu:
+        retabli = suivi_fraicheur.recevoir(categorie, capteur_id, time.time() if recu is None else recu)
+    else:
+        retabli = False
+        if suivi_fraicheur.derniere_reception(categorie, capteur_id) is None:
+            suivi_fraicheur.recevoir(categorie, capteur_id, demarrage["debut"])
+    
+    # Ajouter à l'historique
+    historique = sous_dictionnaire(historique_donnees, categorie)
+    if capteur_id not in historique:
+        historique[capteur_id] = []
+    point = extraire_point_historique(categorie, payload)
+    historique[capteur_id].append(point)
+    versions_donnees[categorie] += 1
+    statistiques_capteurs.ajouter(categorie, capteur_id, point)
+    
+    if backend_historique is not None:
+        backend_historique.ajouter(categorie, capteur_id, point)
+    return retabli
+
+def lire_historique(categorie, capteur_id, debut=None, fin=None):
+    """Retourne les points d'historique d'un capteur entre debut et fin (inclus).
+    
+    Les points récents sont lus dans le tier chaud en mémoire; le backend de
+    persistance complète la période antérieure au plus ancien point en mémoire.
+    Retourne None si le capteur est inconnu.
+    """
+    with verrou_donnees:
+        points = sous_dictionnaire(historique_donnees, categorie).get(capteur_id)
+        if points is not None:
+            points = list(points)
+    
+    # Plus ancien point du tier chaud: le backend couvre la période antérieure
+    premier = min((d["timestamp"] for d in points), default=None) if points else None
+    
+    if points is not None:
+        if debut is not None:
+            points = [d for d in points if d["timestamp"] >= debut]
+        if fin is not None:
+            points = [d for d in points if d["timestamp"] <= fin]
+    
+    if backend_historique is None or (premier is not None and debut is not None and debut >= premier):
+        return points
+    
+    anciens = backend_historique.lire(categorie, capteur_id, debut, fin)
+    if premier is not None:
+        anciens = [d for d in anciens if d["timestamp"] < premier]
+    if not anciens:
+        return points
+    return anciens + (points or [])
+
+def iterer_historique(categorie, capteur_id, debut=None, fin=None):
+    """Itère sur les points d'historique d'un capteur entre debut et fin (inclus).
+    
+    Contrairement à lire_historique, le tier chaud est copié par blocs de
+    TAILLE_BLOC_FLUX points, chacun sous une acquisition courte du verrou.
+    """
+    with verrou_donnees:
+        # La liste est remplacée (jamais filtrée sur place) par le nettoyage: la référence reste valide
+        points = sous_dictionnaire(historique_donnees, categorie).get(capteur_id, [])
+        premier = points[0]["timestamp"] if points else None
+    
+    if backend_historique is not None and not (premier is not None and debut is not None and debut >= premier):
+        for point in backend_historique.lire(categorie, capteur_id, debut, fin):
+            if premier is None or point["timestamp"] < premier:
+                yield point
+    
+    position = 0
+    while True:
+        with verrou_donnees:
+            bloc = points[position:position + TAILLE_BLOC_FLUX]
+        if not bloc:
+            return
+        position += len(bloc)
+        for point in bloc:
+            if (debut is None or point["timestamp"] >= debut) and (fin is None or point["timestamp"] <= fin):
+                yield point
+
+ERREUR_BORNES = "debut et fin doivent être des timestamps"
+
+def bornes_requete():
+    """Retourne les bornes debut et fin des paramètres de requête (None si absentes).
+
+    Retourne None si l'une d'elles n'est pas un timestamp.
+    """
+    debut = request.args.get('debut', None)
+    fin = request.args.get('fin', None)
+    try:
+        return (float(debut) if debut else None), (float(fin) if fin else None)
+    except ValueError:
+        return None
+
+def reponse_historique(categorie, capteur_id, message_erreur):
+    """Construit la réponse d'une route /historique."""
+    bornes = bornes_requete()
+    if bornes is None:
+        return jsonify({"erreur": ERREUR_BORNES}), 400
+    donnees = lire_historique(categorie, capteur_id, *bornes)
+    if donnees is None:
+        return jsonify({"erreur": message_erreur}), 404
+    return jsonify(donnees)
+
+def executer_profile(fonction, *arguments):
+    """Exécute fonction, sous le cProfile de la session de profilage s'il y en a une."""
+    session = session_profilage
+    if session is None:
+        return fonction(*arguments)
+    return session.executer(fonction, *arguments)
+
+def emettre(evenement, donnees):
+    """Émet un événement Socket.IO et le compte."""
+    emissions_socketio.incrementer(evenement)
+    socketio.emit(evenement, donnees)
+
+def traiter_message(topic, contenu, retenu=False):
+    """Décode un message MQTT (individuel ou lot) et l'applique aux données des capteurs.
+    
+    Un message retenu (renvoyé par le broker à l'abonnement) n'est appliqué que
+    s'il est plus récent que la valeur courante, issue par exemple de l'instantané;
+    il ne rafraîchit pas le capteur et n'est pas soumis aux alertes, déjà évaluées
+    à sa première réception.
+    
+    Les lectures non retenues portant "seq" et "t_publication" alimentent le
+    suivi des séquences et les latences de chaque étape du pipeline.
+    """
+    recu = time.time()
+    debut = time.perf_counter()
+    
+    # Décoder le message JSON
+    payload = json.loads(contenu.decode())
+    
+    categorie, capteur_id = trouver_categorie(topic)
+    if categorie is None:
+        return
+    
+    if capteur_id == SUFFIXE_LOT:
+        # Lot de lectures: toutes sont appliquées sous une seule acquisition du verrou
+        lectures = [(lecture["id"], lecture["donnees"]) for lecture in payload.get("lectures", [])]
+    else:
+        lectures = [(capteur_id, payload)]
+    
+    retablis = []
+    anomalies = []
+    with verrou_donnees:
+        if retenu:
+            courantes = sous_dictionnaire(donnees_capteurs, categorie)
+            nouvelles = []
+            for capteur_id, donnees in lectures:
+                if capteur_id in courantes and donnees.get("timestamp", 0) <= courantes[capteur_id].get("timestamp", 0):
+                    # Valeur déjà connue: elle est confirmée, mais pas réenregistrée
+                    marquer_rafraichi(categorie, capteur_id)
+                else:
+                    nouvelles.append((capteur_id, donnees))
+            lectures = nouvelles
+        for capteur_id, donnees in lectures:
+            if enregistrer_lecture(categorie, capteur_id, donnees, recu, retenu):
+                retablis.append(capteur_id)
+            # Un message retenu est une redélivrance du broker: il n'entre pas dans le suivi des séquences
+            if not retenu and "seq" in donnees:
+                anomalie = suivi_sequences.observer(categorie, capteur_id, donnees["seq"])
+                if anomalie is not None:
+                    anomalies.append(anomalie)
+    
+    for type_anomalie, nombre in anomalies:
+        anomalies_sequence.incrementer(categorie, type_anomalie, valeur=nombre)
+    
+    # Émettre les événements WebSocket en dehors du verrou
+    for capteur_id in retablis:
+        emettre("capteur_retabli", {"categorie": categorie, "capteur_id": capteur_id, "timestamp": recu})
+    evenement = CATEGORIES[categorie]["evenement"]
+    for capteur_id, donnees in lectures:
+        emettre(evenement, donnees)
+        if not retenu and "t_publication" in donnees:
+            latences_pipeline.observer(max(0.0, recu - donnees["t_publication"]), "publication_reception", categorie)
+            latences_pipeline.observer(time.perf_counter() - debut, "reception_emission", categorie)
+        if not retenu:
+            for alerte in moteur_alertes.evaluer(categorie, capteur_id, donnees):
+                emettre("alerte", alerte)
+
+def au_message(client, userdata, msg):
+    """Callback appelé à la réception d'un message MQTT."""
+    debut = time.perf_counter()
+    # Deux premiers niveaux du topic (ex: iot/parking): un nombre borné de séries
+    prefixe = "/".join(msg.topic.split("/", 2)[:2])
+    messages_recus.incrementer(prefixe)
+    try:
+        executer_profile(traiter_message, msg.topic, msg.payload, msg.retain)
+    except json.JSONDecodeError:
+        erreurs_decodage.incrementer()
+        logger.error(f"Erreur de décodage JSON pour le message sur le topic {msg.topic}")
+    except Exception as e:
+        erreurs_traitement.incrementer()
+        logger.error(f"Erreur lors du traitement du message MQTT: {e}")
+    duree_traitement.observer(time.perf_counter() - debut, prefixe)
 
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
@@ -72,127 +419,6 @@ def connecter_mqtt():
         else:
             logger.error(f"Échec de connexion au broker MQTT, code retour {rc}")
     
-    def au_message(client, userdata, msg):
-        """Callback appelé à la réception d'un message MQTT."""
-        try:
-            # Décoder le message JSON
-            payload = json.loads(msg.payload.decode())
-            topic = msg.topic
-            
-            # Traiter le message selon le topic
-            if topic.startswith("iot/parking/"):
-                with verrou_donnees:
-                    parking_id = topic.split("/")[-1]
-                    donnees_capteurs["parking"][parking_id] = payload
-                    
-                    # Ajouter à l'historique
-                    if parking_id not in historique_donnees["parking"]:
-                        historique_donnees["parking"][parking_id] = []
-                    historique_donnees["parking"][parking_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "places_disponibles": payload.get("places_disponibles", 0)
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_parking', payload)
-            
-            elif topic.startswith("iot/batiments/"):
-                with verrou_donnees:
-                    batiment_id = topic.split("/")[-1]
-                    donnees_capteurs["batiments"][batiment_id] = payload
-                    
-                    # Ajouter à l'historique (occupation totale)
-                    if batiment_id not in historique_donnees["batiments"]:
-                        historique_donnees["batiments"][batiment_id] = []
-                    
-                    # Calculer l'occupation totale
-                    occupation_totale = 0
-                    for salle in payload.get("salles", []):
-                        occupation_totale += salle.get("occupation_actuelle", 0)
-                    
-                    historique_donnees["batiments"][batiment_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "occupation_totale": occupation_totale
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_batiment', payload)
-            
-            elif topic.startswith("iot/wifi/"):
-                with verrou_donnees:
-                    wifi_id = topic.split("/")[-1]
-                    donnees_capteurs["wifi"][wifi_id] = payload
-                    
-                    # Ajouter à l'historique
-                    if wifi_id not in historique_donnees["wifi"]:
-                        historique_donnees["wifi"][wifi_id] = []
-                    historique_donnees["wifi"][wifi_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "puissance_signal": payload.get("puissance_signal", 0),
-                        "utilisateurs_connectes": payload.get("utilisateurs_connectes", 0)
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_wifi', payload)
-            
-            elif topic.startswith("iot/meteo/"):
-                with verrou_donnees:
-                    meteo_id = topic.split("/")[-1]
-                    donnees_capteurs["meteo"][meteo_id] = payload
-                    
-                    # Ajouter à l'historique
-                    if meteo_id not in historique_donnees["meteo"]:
-                        historique_donnees["meteo"][meteo_id] = []
-                    historique_donnees["meteo"][meteo_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "temperature": payload.get("temperature", 0),
-                        "humidite": payload.get("humidite", 0)
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_meteo', payload)
-            
-            elif topic.startswith("iot/transport/position/bus/"):
-                with verrou_donnees:
-                    bus_id = topic.split("/")[-1]
-                    donnees_capteurs["transport"]["bus"][bus_id] = payload
-                    
-                    # Ajouter à l'historique (position uniquement)
-                    if bus_id not in historique_donnees["transport"].get("bus", {}):
-                        historique_donnees["transport"]["bus"][bus_id] = []
-                    historique_donnees["transport"]["bus"][bus_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "latitude": payload.get("latitude", 0),
-                        "longitude": payload.get("longitude", 0),
-                        "passagers": payload.get("passagers", 0)
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_transport_bus', payload)
-            
-            elif topic.startswith("iot/transport/position/taxi/"):
-                with verrou_donnees:
-                    taxi_id = topic.split("/")[-1]
-                    donnees_capteurs["transport"]["taxi"][taxi_id] = payload
-                    
-                    # Ajouter à l'historique (position uniquement)
-                    if taxi_id not in historique_donnees["transport"].get("taxi", {}):
-                        historique_donnees["transport"]["taxi"][taxi_id] = []
-                    historique_donnees["transport"]["taxi"][taxi_id].append({
-                        "timestamp": payload.get("timestamp", time.time()),
-                        "latitude": payload.get("latitude", 0),
-                        "longitude": payload.get("longitude", 0),
-                        "disponible": payload.get("disponible", False)
-                    })
-                    
-                    # Émettre un événement WebSocket
-                    socketio.emit('update_transport_taxi', payload)
-            
-        except json.JSONDecodeError:
-            logger.error(f"Erreur de décodage JSON pour le message sur le topic {msg.topic}")
-        except Exception as e:
-            logger.error(f"Erreur lors du traitement du message MQTT: {e}")
-    
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
@@ -206,56 +432,59 @@ def connecter_mqtt():
         logger.error(f"Erreur lors de la connexion au broker MQTT: {e}")
         return None
 
+def nettoyer_une_fois(temps_actuel):
+    """Supprime les points d'historique expirés à l'instant temps_actuel.
+    
+    Les points expirés sont transmis à l'archive à froid lorsqu'elle est active.
+    """
+    # Avec un backend de persistance, la mémoire ne conserve que le tier chaud
+    duree_memoire = DUREE_CONSERVATION if backend_historique is None else DUREE_TIER_CHAUD
+    seuil_temps = temps_actuel - duree_memoire
+    
+    # Sans backend, les points retirés de la mémoire sont définitivement expirés
+    archiver_memoire = archive_froide is not None and backend_historique is None
+    expires = []
+    
+    debut = time.perf_counter()
+    with verrou_donnees:
+        acquis = time.perf_counter()
+        for categorie in CATEGORIES:
+            historique = sous_dictionnaire(historique_donnees, categorie)
+            for capteur_id in list(historique.keys()):
+                if archiver_memoire:
+                    anciens = [d for d in historique[capteur_id] if d["timestamp"] < seuil_temps]
+                    if anciens:
+                        expires.append((categorie, capteur_id, anciens))
+                historique[capteur_id] = [
+                    d for d in historique[capteur_id]
+                    if d["timestamp"] >= seuil_temps
+                ]
+            versions_donnees[categorie] += 1
+        statistiques_capteurs.purger(temps_actuel - DUREE_CONSERVATION)
+    duree_verrou = time.perf_counter() - acquis
+    
+    for categorie, capteur_id, points in expires:
+        archive_froide.archiver(categorie, capteur_id, points)
+    
+    if backend_historique is not None:
+        rappel = archive_froide.archiver if archive_froide is not None else None
+        backend_historique.purger(temps_actuel - DUREE_CONSERVATION, rappel)
+    
+    if archive_froide is not None:
+        nombre = archive_froide.ecrire()
+        if nombre:
+            logger.info(f"{nombre} points d'historique archivés")
+    
+    duree_totale = time.perf_counter() - debut
+    duree_nettoyage.observer(duree_verrou, "verrou")
+    duree_nettoyage.observer(duree_totale, "total")
+    dernier_nettoyage.update(debut=temps_actuel, verrou=duree_verrou, total=duree_totale)
+
 def nettoyer_donnees_anciennes():
     """Nettoie les données plus anciennes que DUREE_CONSERVATION."""
     while True:
         try:
-            temps_actuel = time.time()
-            seuil_temps = temps_actuel - DUREE_CONSERVATION
-            
-            with verrou_donnees:
-                # Nettoyage des données historiques pour le parking
-                for parking_id in list(historique_donnees["parking"].keys()):
-                    historique_donnees["parking"][parking_id] = [
-                        d for d in historique_donnees["parking"][parking_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-                
-                # Nettoyage des données historiques pour les bâtiments
-                for batiment_id in list(historique_donnees["batiments"].keys()):
-                    historique_donnees["batiments"][batiment_id] = [
-                        d for d in historique_donnees["batiments"][batiment_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-                
-                # Nettoyage des données historiques pour le WiFi
-                for wifi_id in list(historique_donnees["wifi"].keys()):
-                    historique_donnees["wifi"][wifi_id] = [
-                        d for d in historique_donnees["wifi"][wifi_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-                
-                # Nettoyage des données historiques pour la météo
-                for meteo_id in list(historique_donnees["meteo"].keys()):
-                    historique_donnees["meteo"][meteo_id] = [
-                        d for d in historique_donnees["meteo"][meteo_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-                
-                # Nettoyage des données historiques pour les bus
-                for bus_id in list(historique_donnees["transport"]["bus"].keys()):
-                    historique_donnees["transport"]["bus"][bus_id] = [
-                        d for d in historique_donnees["transport"]["bus"][bus_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-                
-                # Nettoyage des données historiques pour les taxis
-                for taxi_id in list(historique_donnees["transport"]["taxi"].keys()):
-                    historique_donnees["transport"]["taxi"][taxi_id] = [
-                        d for d in historique_donnees["transport"]["taxi"][taxi_id]
-                        if d["timestamp"] >= seuil_temps
-                    ]
-            
+            executer_profile(nettoyer_une_fois, time.time())
             logger.info("Nettoyage des données anciennes effectué")
             
         except Exception as e:
@@ -264,200 +493,682 @@ def nettoyer_donnees_anciennes():
         # Attendre jusqu'au prochain nettoyage
         time.sleep(PERIODE_NETTOYAGE)
 
+def charger_donnees_instantane():
+    """Recharge les dernières valeurs des capteurs depuis l'instantané, avant l'abonnement MQTT."""
+    demarrage["debut"] = time.time()
+    if not FICHIER_INSTANTANE:
+        return
+    debut = time.perf_counter()
+    timestamp, donnees = charger_instantane(FICHIER_INSTANTANE)
+    if timestamp is None:
+        return
+    
+    with verrou_donnees:
+        for categorie, capteurs in donnees.items():
+            if categorie in CATEGORIES:
+                sous_dictionnaire(donnees_capteurs, categorie).update(capteurs)
+                for capteur_id, payload in capteurs.items():
+                    indexer_classements(categorie, capteur_id, payload)
+                    # Un capteur de l'instantané dispose du délai habituel pour publier de nouveau
+                    suivi_fraicheur.recevoir(categorie, capteur_id, demarrage["debut"])
+                demarrage["capteurs_en_attente"].update((categorie, capteur_id) for capteur_id in capteurs)
+        demarrage["capteurs_instantane"] = len(demarrage["capteurs_en_attente"])
+    
+    logger.info(f"Instantané chargé: {demarrage['capteurs_instantane']} capteurs, "
+                f"datant de {time.time() - timestamp:.0f} s, en {time.perf_counter() - debut:.3f} s")
+
+def verifier_fraicheur(instant):
+    """Marque périmés les capteurs sans réception depuis leur échéance et émet un événement pour chacun.
+    
+    Retourne la plus proche échéance restante (None si aucune).
+    """
+    with verrou_donnees:
+        perimes = suivi_fraicheur.expirer(instant)
+        prochaine = suivi_fraicheur.prochaine_echeance()
+    
+    for categorie, capteur_id, derniere_reception in perimes:
+        emettre("capteur_perime", {
+            "categorie": categorie,
+            "capteur_id": capteur_id,
+            "derniere_reception": derniere_reception,
+            "delai": suivi_fraicheur.delai(categorie)
+        })
+    if perimes:
+        logger.warning(f"{len(perimes)} capteur(s) sans nouvelle donnée, marqué(s) périmé(s)")
+    return prochaine
+
+def surveiller_fraicheur():
+    """Vérifie les échéances des capteurs à mesure qu'elles arrivent."""
+    while True:
+        attente = PERIODE_FRAICHEUR_MAX
+        try:
+            prochaine = verifier_fraicheur(time.time())
+            if prochaine is not None:
+                attente = min(attente, max(0.0, prochaine - time.time()))
+        except Exception as e:
+            logger.error(f"Erreur lors de la vérification des capteurs périmés: {e}")
+        time.sleep(attente)
+
+def avec_fraicheur(categorie, capteur_id, payload):
+    """Retourne une copie du payload complétée de l'indicateur perime (verrou acquis)."""
+    return {**payload, "perime": suivi_fraicheur.est_perime(categorie, capteur_id)}
+
+def donnees_categorie(categorie):
+    """Retourne les dernières données de tous les capteurs d'une catégorie (verrou acquis)."""
+    return {
+        capteur_id: avec_fraicheur(categorie, capteur_id, payload)
+        for capteur_id, payload in sous_dictionnaire(donnees_capteurs, categorie).items()
+    }
+
+def sauvegarder_instantane():
+    """Écrit l'instantané des dernières valeurs des capteurs."""
+    # Copie superficielle sous le verrou: les payloads sont remplacés, jamais modifiés
+    with verrou_donnees:
+        donnees = {categorie: dict(sous_dictionnaire(donnees_capteurs, categorie)) for categorie in CATEGORIES}
+    return ecrire_instantane(FICHIER_INSTANTANE, donnees)
+
+def sauvegarder_instantanes():
+    """Écrit périodiquement l'instantané des dernières valeurs des capteurs."""
+    while True:
+        time.sleep(PERIODE_INSTANTANE)
+        try:
+            sauvegarder_instantane()
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture de l'instantané: {e}")
+
+def reponse_classement(categorie):
+    """Construit la réponse d'une route /top: les k premiers capteurs selon ?metric= et ?ordre=."""
+    metriques = CLASSEMENTS[categorie]
+    metrique = request.args.get('metric', next(iter(metriques)))
+    if metrique not in metriques:
+        return jsonify({"erreur": f"Métrique non classée: {metrique}", "metriques": list(metriques)}), 400
+    ordre = request.args.get('ordre', metriques[metrique])
+    if ordre not in ("asc", "desc"):
+        return jsonify({"erreur": f"Ordre inconnu: {ordre}"}), 400
+    try:
+        k = max(0, int(request.args.get('k', 10)))
+    except ValueError:
+        return jsonify({"erreur": "k doit être un entier"}), 400
+    
+    with verrou_donnees:
+        donnees = sous_dictionnaire(donnees_capteurs, categorie)
+        premiers = [
+            {"id": capteur_id, "valeur": valeur,
+             "donnees": avec_fraicheur(categorie, capteur_id, donnees[capteur_id])}
+            for capteur_id, valeur in classements[categorie][metrique].premiers(k, ordre == "desc")
+        ]
+    return jsonify({"metric": metrique, "ordre": ordre, "classement": premiers})
+
+def mesurer_historique():
+    """Retourne, par catégorie, le nombre de points d'historique en mémoire et leur taille estimée (octets).
+    
+    La taille d'un point est estimée sur un point représentatif de la catégorie
+    (dictionnaire et valeurs), plus la référence dans la liste de son capteur.
+    """
+    with verrou_donnees:
+        mesures = {}
+        for categorie in CATEGORIES:
+            historique = sous_dictionnaire(historique_donnees, categorie)
+            points = sum(len(liste) for liste in historique.values())
+            exemple = next((liste[-1] for liste in historique.values() if liste), None)
+            octets_point = 0 if exemple is None else (
+                sys.getsizeof(exemple) + sum(sys.getsizeof(valeur) for valeur in exemple.values()) + 8)
+            octets_listes = sum(sys.getsizeof(liste) - 8 * len(liste) for liste in historique.values())
+            mesures[categorie] = (points, points * octets_point + octets_listes)
+    return mesures
+
+registre_metriques.jauge(
+    "iot_historique_points", "Points d'historique en mémoire, par catégorie",
+    lambda: {(categorie,): points for categorie, (points, _) in mesurer_historique().items()}, ("categorie",))
+registre_metriques.jauge(
+    "iot_historique_octets_estimes", "Taille estimée de l'historique en mémoire, par catégorie",
+    lambda: {(categorie,): octets for categorie, (_, octets) in mesurer_historique().items()}, ("categorie",))
+registre_metriques.jauge(
+    "iot_socketio_clients_connectes", "Clients Socket.IO connectés", lambda: len(clients_socketio))
+registre_metriques.jauge(
+    "iot_capteurs_perimes", "Capteurs sans donnée depuis leur échéance", lambda: len(suivi_fraicheur.perimes))
+registre_metriques.jauge(
+    "iot_nettoyage_dernier_debut_secondes", "Heure de début (epoch) du dernier nettoyage de l'historique",
+    lambda: dernier_nettoyage["debut"])
+registre_metriques.jauge(
+    "iot_nettoyage_derniere_duree_secondes", "Durée du dernier nettoyage: totale et sous le verrou des données",
+    lambda: {(etape,): dernier_nettoyage[etape] for etape in ("verrou", "total")}, ("etape",))
+
+@socketio.on("connect")
+def au_connexion_client(*arguments):
+    """Enregistre un client Socket.IO connecté."""
+    clients_socketio.add(request.sid)
+
+@socketio.on("disconnect")
+def au_deconnexion_client(*arguments):
+    """Oublie un client Socket.IO déconnecté."""
+    clients_socketio.discard(request.sid)
+
+@app.before_request
+def debuter_mesure_requete():
+    """Note l'instant de début de la requête."""
+    g.debut_requete = time.perf_counter()
+
+@app.after_request
+def mesurer_requete(reponse):
+    """Enregistre la durée de la requête, étiquetée par sa route (et non son URL, de cardinalité non bornée)."""
+    debut = g.get("debut_requete")
+    if debut is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "inconnue"
+        duree_requetes.observer(time.perf_counter() - debut, route, request.method)
+        requetes_http.incrementer(route, str(reponse.status_code))
+    return reponse
+
 # Routes de l'API REST
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Retourne les métriques de l'API au format d'exposition texte de Prometheus."""
+    return Response(registre_metriques.exposer(), content_type=registre_metriques.TYPE_CONTENU)
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Retourne le statut de l'API."""
+    with verrou_donnees:
+        etat_demarrage = {
+            "capteurs_instantane": demarrage["capteurs_instantane"],
+            "capteurs_en_attente": len(demarrage["capteurs_en_attente"]),
+            "duree_instantane_complet": demarrage["duree_instantane_complet"]
+        }
+        comptes = suivi_fraicheur.compter()
     return jsonify({
         "status": "en ligne",
-        "timestamp": time.time()
+        "timestamp": time.time(),
+        "demarrage": etat_demarrage,
+        "capteurs": {
+            "total": sum(compte["total"] for compte in comptes.values()),
+            "perimes": sum(compte["perimes"] for compte in comptes.values()),
+            "categories": comptes
+        }
     })
 
+@app.route('/api/alertes', methods=['GET'])
+def get_alertes():
+    """Retourne les dernières alertes (paramètre limite, 100 par défaut)."""
+    try:
+        limite = int(request.args.get('limite', 100))
+    except ValueError:
+        return jsonify({"erreur": "limite doit être un entier"}), 400
+    return jsonify({
+        "total": moteur_alertes.nombre_alertes,
+        "alertes": moteur_alertes.dernieres(limite)
+    })
+
+@app.route('/api/tracage', methods=['GET'])
+def get_tracage():
+    """Retourne les compteurs de séquence (perdus, doublons, désordres, redémarrages).
+
+    Par catégorie, ou par capteur avec le paramètre category.
+    """
+    categorie = request.args.get('category', None)
+    if categorie is not None and categorie not in CATEGORIES:
+        return jsonify({"erreur": f"Catégorie inconnue: {categorie}"}), 400
+    with verrou_donnees:
+        if categorie is None:
+            resultat = {"categories": suivi_sequences.totaux()}
+        else:
+            resultat = {"category": categorie, "capteurs": suivi_sequences.resumer(categorie)}
+    return jsonify(resultat)
+
 @app.route('/api/parking', methods=['GET'])
 def get_parking():
     """Retourne les données de tous les parkings."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["parking"])
+        return jsonify(donnees_categorie("parking"))
 
 @app.route('/api/parking/<id>', methods=['GET'])
 def get_parking_by_id(id):
     """Retourne les données d'un parking spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["parking"]:
-            return jsonify(donnees_capteurs["parking"][id])
+            return jsonify(avec_fraicheur("parking", id, donnees_capteurs["parking"][id]))
         else:
             return jsonify({"erreur": "Parking non trouvé"}), 404
 
 @app.route('/api/parking/<id>/historique', methods=['GET'])
 def get_parking_history(id):
     """Retourne l'historique des données d'un parking spécifique."""
-    with verrou_donnees:
-        if id in historique_donnees["parking"]:
-            # Filtrer selon les paramètres de requête
-            debut = request.args.get('debut', None)
-            fin = request.args.get('fin', None)
-            
-            donnees = historique_donnees["parking"][id]
-            
-            if debut:
-                debut = float(debut)
-                donnees = [d for d in donnees if d["timestamp"] >= debut]
-            
-            if fin:
-                fin = float(fin)
-                donnees = [d for d in donnees if d["timestamp"] <= fin]
-            
-            return jsonify(donnees)
-        else:
-            return jsonify({"erreur": "Historique du parking non trouvé"}), 404
+    return reponse_historique("parking", id, "Historique du parking non trouvé")
+
+@app.route('/api/parking/top', methods=['GET'])
+def get_parking_top():
+    """Retourne les parkings classés selon une métrique (par défaut: le moins de places disponibles)."""
+    return reponse_classement("parking")
 
 @app.route('/api/batiments', methods=['GET'])
 def get_batiments():
     """Retourne les données de tous les bâtiments."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["batiments"])
+        return jsonify(donnees_categorie("batiments"))
 
 @app.route('/api/batiments/<id>', methods=['GET'])
 def get_batiment_by_id(id):
     """Retourne les données d'un bâtiment spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["batiments"]:
-            return jsonify(donnees_capteurs["batiments"][id])
+            return jsonify(avec_fraicheur("batiments", id, donnees_capteurs["batiments"][id]))
         else:
             return jsonify({"erreur": "Bâtiment non trouvé"}), 404
 
 @app.route('/api/batiments/<id>/historique', methods=['GET'])
 def get_batiment_history(id):
     """Retourne l'historique des données d'un bâtiment spécifique."""
-    with verrou_donnees:
-        if id in historique_donnees["batiments"]:
-            # Filtrer selon les paramètres de requête
-            debut = request.args.get('debut', None)
-            fin = request.args.get('fin', None)
-            
-            donnees = historique_donnees["batiments"][id]
-            
-            if debut:
-                debut = float(debut)
-                donnees = [d for d in donnees if d["timestamp"] >= debut]
-            
-            if fin:
-                fin = float(fin)
-                donnees = [d for d in donnees if d["timestamp"] <= fin]
-            
-            return jsonify(donnees)
-        else:
-            return jsonify({"erreur": "Historique du bâtiment non trouvé"}), 404
+    return reponse_historique("batiments", id, "Historique du bâtiment non trouvé")
 
 @app.route('/api/wifi', methods=['GET'])
 def get_wifi():
     """Retourne les données de tous les points d'accès WiFi."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["wifi"])
+        return jsonify(donnees_categorie("wifi"))
 
 @app.route('/api/wifi/<id>', methods=['GET'])
 def get_wifi_by_id(id):
     """Retourne les données d'un point d'accès WiFi spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["wifi"]:
-            return jsonify(donnees_capteurs["wifi"][id])
+            return jsonify(avec_fraicheur("wifi", id, donnees_capteurs["wifi"][id]))
         else:
             return jsonify({"erreur": "Point d'accès WiFi non trouvé"}), 404
 
 @app.route('/api/wifi/<id>/historique', methods=['GET'])
 def get_wifi_history(id):
     """Retourne l'historique des données d'un point d'accès WiFi spécifique."""
-    with verrou_donnees:
-        if id in historique_donnees["wifi"]:
-            # Filtrer selon les paramètres de requête
-            debut = request.args.get('debut', None)
-            fin = request.args.get('fin', None)
-            
-            donnees = historique_donnees["wifi"][id]
-            
-            if debut:
-                debut = float(debut)
-                donnees = [d for d in donnees if d["timestamp"] >= debut]
-            
-            if fin:
-                fin = float(fin)
-                donnees = [d for d in donnees if d["timestamp"] <= fin]
-            
-            return jsonify(donnees)
-        else:
-            return jsonify({"erreur": "Historique du point d'accès WiFi non trouvé"}), 404
+    return reponse_historique("wifi", id, "Historique du point d'accès WiFi non trouvé")
+
+@app.route('/api/wifi/top', methods=['GET'])
+def get_wifi_top():
+    """Retourne les points d'accès WiFi classés selon une métrique (par défaut: les plus congestionnés)."""
+    return reponse_classement("wifi")
 
 @app.route('/api/meteo', methods=['GET'])
 def get_meteo():
     """Retourne les données de toutes les stations météo."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["meteo"])
+        return jsonify(donnees_categorie("meteo"))
 
 @app.route('/api/meteo/<id>', methods=['GET'])
 def get_meteo_by_id(id):
     """Retourne les données d'une station météo spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["meteo"]:
-            return jsonify(donnees_capteurs["meteo"][id])
+            return jsonify(avec_fraicheur("meteo", id, donnees_capteurs["meteo"][id]))
         else:
             return jsonify({"erreur": "Station météo non trouvée"}), 404
 
 @app.route('/api/meteo/<id>/historique', methods=['GET'])
 def get_meteo_history(id):
     """Retourne l'historique des données d'une station météo spécifique."""
-    with verrou_donnees:
-        if id in historique_donnees["meteo"]:
-            # Filtrer selon les paramètres de requête
-            debut = request.args.get('debut', None)
-            fin = request.args.get('fin', None)
-            
-            donnees = historique_donnees["meteo"][id]
-            
-            if debut:
-                debut = float(debut)
-                donnees = [d for d in donnees if d["timestamp"] >= debut]
-            
-            if fin:
-                fin = float(fin)
-                donnees = [d for d in donnees if d["timestamp"] <= fin]
-            
-            return jsonify(donnees)
-        else:
-            return jsonify({"erreur": "Historique de la station météo non trouvé"}), 404
+    return reponse_historique("meteo", id, "Historique de la station météo non trouvé")
 
 @app.route('/api/transport/bus', methods=['GET'])
 def get_bus():
     """Retourne les données de tous les bus."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["transport"]["bus"])
+        return jsonify(donnees_categorie("bus"))
 
 @app.route('/api/transport/bus/<id>', methods=['GET'])
 def get_bus_by_id(id):
     """Retourne les données d'un bus spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["transport"]["bus"]:
-            return jsonify(donnees_capteurs["transport"]["bus"][id])
+            return jsonify(avec_fraicheur("bus", id, donnees_capteurs["transport"]["bus"][id]))
         else:
             return jsonify({"erreur": "Bus non trouvé"}), 404
 
+@app.route('/api/transport/bus/top', methods=['GET'])
+def get_bus_top():
+    """Retourne les bus classés selon une métrique (par défaut: les plus occupés)."""
+    return reponse_classement("bus")
+
 @app.route('/api/transport/taxi', methods=['GET'])
 def get_taxi():
     """Retourne les données de tous les taxis."""
     with verrou_donnees:
-        return jsonify(donnees_capteurs["transport"]["taxi"])
+        return jsonify(donnees_categorie("taxi"))
 
 @app.route('/api/transport/taxi/<id>', methods=['GET'])
 def get_taxi_by_id(id):
     """Retourne les données d'un taxi spécifique."""
     with verrou_donnees:
         if id in donnees_capteurs["transport"]["taxi"]:
-            return jsonify(donnees_capteurs["transport"]["taxi"][id])
+            return jsonify(avec_fraicheur("taxi", id, donnees_capteurs["transport"]["taxi"][id]))
         else:
             return jsonify({"erreur": "Taxi non trouvé"}), 404
 
+def parametre_capteurs():
+    """Retourne l'ensemble des identifiants du paramètre ids (séparés par des virgules), ou None."""
+    ids = request.args.get('ids', None)
+    return set(ids.split(",")) if ids else None
+
+@app.route('/api/export', methods=['GET'])
+def get_export():
+    """Exporte en flux (NDJSON ou CSV) l'historique de capteurs d'une catégorie entre debut et fin."""
+    categorie = request.args.get('category', None)
+    if categorie not in CATEGORIES:
+        return jsonify({"erreur": f"Catégorie inconnue: {categorie}"}), 400
+    format_export = request.args.get('format', 'ndjson')
+    if format_export not in ("ndjson", "csv"):
+        return jsonify({"erreur": f"Format d'export inconnu: {format_export}"}), 400
+    bornes = bornes_requete()
+    if bornes is None:
+        return jsonify({"erreur": ERREUR_BORNES}), 400
+    debut, fin = bornes
+    
+    capteurs = parametre_capteurs()
+    if capteurs is None:
+        with verrou_donnees:
+            capteurs = set(sous_dictionnaire(historique_donnees, categorie))
+        if backend_historique is not None:
+            capteurs.update(backend_historique.identifiants(categorie))
+    
+    colonnes = ["capteur_id", "timestamp"] + [nom for nom, _ in CHAMPS_HISTORIQUE[categorie]]
+    
+    def serialiser(lignes):
+        if format_export == "ndjson":
+            return "".join(json.dumps(ligne, ensure_ascii=False) + "\n" for ligne in lignes)
+        sortie = io.StringIO()
+        csv.writer(sortie).writerows([ligne[colonne] for colonne in colonnes] for ligne in lignes)
+        return sortie.getvalue()
+    
+    def generer():
+        if format_export == "csv":
+            yield ",".join(colonnes) + "\r\n"
+        lignes = []
+        for capteur_id in sorted(capteurs):
+            for point in iterer_historique(categorie, capteur_id, debut, fin):
+                lignes.append({"capteur_id": capteur_id, **point})
+                if len(lignes) >= TAILLE_BLOC_FLUX:
+                    yield serialiser(lignes)
+                    lignes = []
+        if lignes:
+            yield serialiser(lignes)
+    
+    type_mime = "application/x-ndjson" if format_export == "ndjson" else "text/csv"
+    return Response(generer(), mimetype=type_mime, headers={
+        "Content-Disposition": f"attachment; filename=export_{categorie}.{format_export}"
+    })
+
+def evaluer_requete(categorie, champ, agregat, pas, capteurs, debut, fin):
+    """Agrège un champ de l'historique de plusieurs capteurs par intervalles de pas secondes."""
+    if capteurs is None:
+        with verrou_donnees:
+            capteurs = set(sous_dictionnaire(historique_donnees, categorie))
+        if backend_historique is not None:
+            capteurs.update(backend_historique.identifiants(categorie))
+    
+    # Colonnes accumulées sans objet Python par point, puis vues en tableaux NumPy
+    indices, timestamps, valeurs = array("q"), array("d"), array("d")
+    for indice, capteur_id in enumerate(sorted(capteurs)):
+        for point in iterer_historique(categorie, capteur_id, debut, fin):
+            indices.append(indice)
+            timestamps.append(point["timestamp"])
+            valeurs.append(point[champ])
+    
+    return agregation.agreger_par_intervalle(
+        agregation.np.frombuffer(indices, dtype=agregation.np.int64),
+        agregation.np.frombuffer(timestamps),
+        agregation.np.frombuffer(valeurs),
+        pas, agregat
+    )
+
+@app.route('/api/query', methods=['GET'])
+def get_query():
+    """Agrège côté serveur un champ de l'historique d'une catégorie, par intervalles de temps."""
+    if not agregation.NUMPY_DISPONIBLE:
+        return jsonify({"erreur": "numpy est nécessaire pour les requêtes d'agrégation"}), 501
+    categorie = request.args.get('category', None)
+    if categorie not in CATEGORIES:
+        return jsonify({"erreur": f"Catégorie inconnue: {categorie}"}), 400
+    champ = request.args.get('field', None)
+    if champ not in [nom for nom, _ in CHAMPS_HISTORIQUE[categorie]]:
+        return jsonify({"erreur": f"Champ inconnu pour {categorie}: {champ}"}), 400
+    agregat = request.args.get('agg', 'avg')
+    if agregat not in agregation.AGREGATIONS:
+        return jsonify({"erreur": f"Agrégation inconnue: {agregat}"}), 400
+    group_by = request.args.get('group_by', '5m')
+    try:
+        pas = agregation.analyser_duree(group_by)
+    except ValueError as e:
+        return jsonify({"erreur": str(e)}), 400
+    bornes = bornes_requete()
+    if bornes is None:
+        return jsonify({"erreur": ERREUR_BORNES}), 400
+    debut, fin = bornes
+    capteurs = parametre_capteurs()
+    
+    # Le résultat reste valable tant que l'historique de la catégorie n'a pas changé
+    with verrou_donnees:
+        version = versions_donnees[categorie]
+    cle = (categorie, champ, agregat, pas, frozenset(capteurs) if capteurs else None, debut, fin, version)
+    with verrou_cache:
+        resultat = cache_requetes.get(cle)
+        if resultat is not None:
+            cache_requetes.move_to_end(cle)
+    
+    if resultat is None:
+        intervalles = evaluer_requete(categorie, champ, agregat, pas, capteurs, debut, fin)
+        resultat = {
+            "category": categorie,
+            "field": champ,
+            "agg": agregat,
+            "group_by": group_by,
+            "version": version,
+            "intervalles": [
+                {"debut": debut_intervalle, "valeur": valeur, "capteurs": nombre}
+                for debut_intervalle, valeur, nombre in intervalles
+            ]
+        }
+        with verrou_cache:
+            cache_requetes[cle] = resultat
+            if len(cache_requetes) > TAILLE_CACHE_REQUETES:
+                cache_requetes.popitem(last=False)
+    
+    return jsonify(resultat)
+
+@app.route('/api/archive/query', methods=['GET'])
+def get_archive_query():
+    """Retourne en flux NDJSON les points archivés d'une catégorie entre debut et fin."""
+    if archive_froide is None:
+        return jsonify({"erreur": "Archive désactivée"}), 404
+    categorie = request.args.get('category', None)
+    if categorie not in CATEGORIES:
+        return jsonify({"erreur": f"Catégorie inconnue: {categorie}"}), 400
+    bornes = bornes_requete()
+    if bornes is None:
+        return jsonify({"erreur": ERREUR_BORNES}), 400
+    debut, fin = bornes
+    capteurs = parametre_capteurs()
+    
+    def generer():
+        lignes = []
+        for point in archive_froide.requete(categorie, debut, fin, capteurs):
+            lignes.append(json.dumps(point, ensure_ascii=False))
+            if len(lignes) >= TAILLE_BLOC_FLUX:
+                yield "\n".join(lignes) + "\n"
+                lignes = []
+        if lignes:
+            yield "\n".join(lignes) + "\n"
+    
+    return Response(generer(), mimetype="application/x-ndjson")
+
+def reponse_statistiques(categorie, capteur_id=None):
+    """Construit la réponse d'une route /stats: quantiles d'un capteur, ou de toute la catégorie."""
+    champs_numeriques = statistiques_capteurs.champs_numeriques[categorie]
+    champs = request.args.get('fields', None)
+    champs = champs.split(",") if champs else champs_numeriques
+    inconnus = [champ for champ in champs if champ not in champs_numeriques]
+    if inconnus:
+        return jsonify({"erreur": f"Champs inconnus: {', '.join(inconnus)}", "champs": champs_numeriques}), 400
+    fenetre = request.args.get('window', '1h')
+    try:
+        debut = time.time() - agregation.analyser_duree(fenetre)
+    except ValueError as e:
+        return jsonify({"erreur": str(e)}), 400
+    
+    with verrou_donnees:
+        if capteur_id is None:
+            capteurs = list(statistiques_capteurs.sketches[categorie])
+        elif capteur_id in statistiques_capteurs.sketches[categorie]:
+            capteurs = [capteur_id]
+        else:
+            return jsonify({"erreur": "Statistiques du capteur non trouvées"}), 404
+        sketches = statistiques_capteurs.copier_sketches(categorie, capteurs, champs, debut)
+    
+    # Fusion des sketches en dehors du verrou
+    resultat = {
+        "category": categorie,
+        "window": fenetre,
+        "capteurs": len(capteurs),
+        "champs": {champ: statistiques_capteurs.resumer(sketches[champ]) for champ in champs}
+    }
+    if capteur_id is not None:
+        resultat["id"] = capteur_id
+    return jsonify(resultat)
+
+# Routes /stats de chaque catégorie, déclarées avec des segments fixes pour primer sur /<id>
+for _categorie, _description in CATEGORIES.items():
+    _prefixe = "/api/" + "/".join(_description["chemin"])
+    app.add_url_rule(f"{_prefixe}/stats", f"get_{_categorie}_stats",
+                     lambda categorie=_categorie: reponse_statistiques(categorie), methods=['GET'])
+    app.add_url_rule(f"{_prefixe}/<id>/stats", f"get_{_categorie}_stats_by_id",
+                     lambda id, categorie=_categorie: reponse_statistiques(categorie, id), methods=['GET'])
+
+def debuter_profilage_requete():
+    """Active le cProfile du thread de la requête pendant une session de profilage."""
+    session = session_profilage
+    g.session_profilage = session if session is not None and session.activer() else None
+
+def terminer_profilage_requete(exception):
+    """Désactive le cProfile activé pour la requête."""
+    session = g.pop("session_profilage", None)
+    if session is not None:
+        session.desactiver()
+
+def journaliser_requete_lente(reponse):
+    """Ajoute la durée de la requête à la réponse (en-tête Server-Timing) et journalise les requêtes lentes.
+    
+    Pour une réponse en flux, la durée s'arrête à la création de la réponse, avant l'envoi du corps.
+    """
+    debut = g.get("debut_requete")
+    if debut is None:
+        return reponse
+    duree = time.perf_counter() - debut
+    reponse.headers["Server-Timing"] = f"app;dur={duree * 1000:.1f}"
+    if duree >= SEUIL_REQUETE_LENTE:
+        requetes_lentes.append({
+            "timestamp": time.time(),
+            "methode": request.method,
+            "chemin": request.full_path.rstrip("?"),
+            "route": request.url_rule.rule if request.url_rule is not None else None,
+            "code": reponse.status_code,
+            "duree": duree
+        })
+        logger.warning(f"Requête lente: {request.method} {request.full_path.rstrip('?')} en {duree * 1000:.0f} ms")
+    return reponse
+
+def get_profilage():
+    """Retourne l'état de la dernière session de profilage."""
+    session = session_profilage
+    return jsonify(session.etat() if session is not None else {"en_cours": False})
+
+def demarrer_profilage():
+    """Démarre une session de profilage (paramètres mode, duree et intervalle)."""
+    global session_profilage
+    mode = request.args.get('mode', 'echantillonnage')
+    if mode not in MODES_PROFILAGE:
+        return jsonify({"erreur": f"Mode de profilage inconnu: {mode}", "modes": list(MODES_PROFILAGE)}), 400
+    try:
+        duree = float(request.args.get('duree', 30))
+        intervalle = float(request.args.get('intervalle', INTERVALLE_ECHANTILLONNAGE))
+    except ValueError:
+        return jsonify({"erreur": "duree et intervalle doivent être des nombres"}), 400
+    if not 0 < duree <= DUREE_PROFILAGE_MAX or intervalle <= 0:
+        return jsonify({"erreur": f"duree doit être comprise entre 0 et {DUREE_PROFILAGE_MAX} s, "
+                                  f"intervalle positif"}), 400
+    
+    with verrou_profilage:
+        if session_profilage is not None and session_profilage.en_cours:
+            return jsonify({"erreur": "Une session de profilage est déjà en cours",
+                            "session": session_profilage.etat()}), 409
+        session_profilage = SessionProfilage(mode, duree, intervalle)
+    logger.info(f"Profilage démarré: {mode} pendant {duree:g} s")
+    return jsonify(session_profilage.etat()), 202
+
+def arreter_profilage():
+    """Arrête la session de profilage en cours avant son terme."""
+    session = session_profilage
+    if session is None:
+        return jsonify({"erreur": "Aucune session de profilage"}), 404
+    session.arreter()
+    return jsonify(session.etat())
+
+def get_resultat_profilage():
+    """Retourne le résultat de la dernière session de profilage.
+    
+    Échantillonnage: piles repliées (flamegraph.pl, speedscope). cProfile:
+    rapport texte (format=texte, paramètres tri et limite) ou profil binaire
+    pstats (format=prof).
+    """
+    session = session_profilage
+    if session is None:
+        return jsonify({"erreur": "Aucune session de profilage"}), 404
+    if session.en_cours:
+        return jsonify({"erreur": "Session de profilage en cours", "session": session.etat()}), 409
+    
+    if session.mode == "echantillonnage":
+        return Response(session.piles_repliees(), mimetype="text/plain")
+    format_resultat = request.args.get('format', 'texte')
+    if format_resultat == "prof":
+        return Response(session.donnees_cprofile(), mimetype="application/octet-stream",
+                        headers={"Content-Disposition": "attachment; filename=api.prof"})
+    if format_resultat != "texte":
+        return jsonify({"erreur": f"Format inconnu: {format_resultat}"}), 400
+    tri = request.args.get('tri', 'cumulative')
+    if tri not in ("cumulative", "tottime", "ncalls"):
+        return jsonify({"erreur": f"Tri inconnu: {tri}"}), 400
+    try:
+        limite = int(request.args.get('limite', 50))
+    except ValueError:
+        return jsonify({"erreur": "limite doit être un entier"}), 400
+    return Response(session.rapport_cprofile(tri, limite), mimetype="text/plain")
+
+def get_requetes_lentes():
+    """Retourne les dernières requêtes plus longues que SEUIL_REQUETE_LENTE, de la plus récente à la plus ancienne."""
+    return jsonify({"seuil": SEUIL_REQUETE_LENTE, "requetes": list(requetes_lentes)[::-1]})
+
+# Profilage à la demande: rien n'est déclaré ni instrumenté tant que PROFILAGE_ACTIF est faux
+if PROFILAGE_ACTIF:
+    app.before_request(debuter_profilage_requete)
+    app.teardown_request(terminer_profilage_requete)
+    app.after_request(journaliser_requete_lente)
+    app.add_url_rule('/admin/profilage', 'get_profilage', get_profilage, methods=['GET'])
+    app.add_url_rule('/admin/profilage/demarrer', 'demarrer_profilage', demarrer_profilage, methods=['POST'])
+    app.add_url_rule('/admin/profilage/arreter', 'arreter_profilage', arreter_profilage, methods=['POST'])
+    app.add_url_rule('/admin/profilage/resultat', 'get_resultat_profilage', get_resultat_profilage,
+                     methods=['GET'])
+    app.add_url_rule('/admin/requetes_lentes', 'get_requetes_lentes', get_requetes_lentes, methods=['GET'])
+
 def demarrer_api():
     """Fonction principale pour démarrer l'API REST."""
+    global backend_historique, archive_froide
+    
+    # Ouvrir le backend de persistance avant de recevoir les premiers messages
+    backend_historique = creer_backend_historique()
+    if backend_historique is not None:
+        logger.info(f"Historique persisté avec le backend {BACKEND_HISTORIQUE}")
+    
+    if REPERTOIRE_ARCHIVE:
+        archive_froide = ArchiveFroide(REPERTOIRE_ARCHIVE, CHAMPS_HISTORIQUE, FORMAT_ARCHIVE)
+        logger.info(f"Historique expiré archivé dans {REPERTOIRE_ARCHIVE} (format {archive_froide.format})")
+    
+    # Recharger les dernières valeurs connues avant de recevoir les messages retenus
+    charger_donnees_instantane()
+    
     # Connexion au broker MQTT
     client_mqtt = connecter_mqtt()
     if client_mqtt is None:
@@ -472,9 +1183,27 @@ def demarrer_api():
     thread_nettoyage.daemon = True
     thread_nettoyage.start()
     
+    # Démarrer le thread de détection des capteurs périmés
+    thread_fraicheur = threading.Thread(target=surveiller_fraicheur)
+    thread_fraicheur.daemon = True
+    thread_fraicheur.start()
+    
+    # Démarrer le thread d'écriture de l'instantané
+    if FICHIER_INSTANTANE:
+        thread_instantane = threading.Thread(target=sauvegarder_instantanes)
+        thread_instantane.daemon = True
+        thread_instantane.start()
+    
     # Démarrer le serveur Flask avec Socket.IO
     logger.info(f"Démarrage de l'API REST sur {API_HOST}:{API_PORT}")
-    socketio.run(app, host=API_HOST, port=API_PORT, debug=False, allow_unsafe_werkzeug=True)
+    try:
+        socketio.run(app, host=API_HOST, port=API_PORT, debug=False, allow_unsafe_werkzeug=True)
+    finally:
+        if FICHIER_INSTANTANE:
+            sauvegarder_instantane()
+        # Écrire les points encore en attente dans le backend
+        if backend_historique is not None:
+            backend_historique.fermer()
 
 if __name__ == "__main__":
     demarrer_api()
@@ -0,0 +1,187 @@
+# Fichier: archive.py
+# Archivage à froid de l'historique expiré dans des fichiers compressés en colonnes
+
+import csv
+import gzip
+import os
+import threading
+import time
+import logging
+
+# Parquet est utilisé si pyarrow est installé, sinon NumPy (npz compressé), sinon CSV compressé
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIBLE = True
+except ImportError:
+    PYARROW_DISPONIBLE = False
+
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+
+logger = logging.getLogger('api_rest')
+
+# Extension des fichiers de chaque format d'archive
+EXTENSIONS = {"parquet": ".parquet", "npz": ".npz", "csv": ".csv.gz"}
+
+# Types NumPy / Arrow des champs et conversion depuis le CSV selon leur type déclaré dans CHAMPS_HISTORIQUE
+TYPES_NUMPY = {"REAL": "f8", "INTEGER": "i8", "BOOLEAN": "?"}
+TYPES_ARROW = {"REAL": "float64", "INTEGER": "int64", "BOOLEAN": "bool"}
+CONVERSIONS = {"REAL": float, "INTEGER": int, "BOOLEAN": lambda valeur: valeur == "True"}
+
+def format_disponible():
+    """Retourne le meilleur format d'archive disponible."""
+    if PYARROW_DISPONIBLE:
+        return "parquet"
+    if NUMPY_DISPONIBLE:
+        return "npz"
+    return "csv"
+
+def format_fichier(nom):
+    """Retourne le format d'un fichier d'archive d'après son extension (None si inconnu)."""
+    for format_archive, extension in EXTENSIONS.items():
+        if nom.endswith(extension):
+            return format_archive
+    return None
+
+def jour_utc(timestamp):
+    """Retourne la partition (jour UTC, "AAAA-MM-JJ") d'un timestamp."""
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+class ArchiveFroide:
+    """Archive de l'historique expiré, partitionnée par catégorie et par jour UTC.
+
+    Chaque écriture ajoute un fichier (une partie) dans le répertoire de sa
+    partition: <repertoire>/<categorie>/<AAAA-MM-JJ>/partie-<n>.<extension>.
+    Les colonnes sont capteur_id, timestamp puis les champs de la catégorie.
+    """
+
+    def __init__(self, repertoire, champs_historique, format_archive=None):
+        self.repertoire = repertoire
+        self.champs_historique = champs_historique
+        self.format = format_archive or format_disponible()
+        self.extension = EXTENSIONS[self.format]
+
+        # Points en attente d'écriture, par (categorie, jour)
+        self.en_attente = {}
+        self.verrou = threading.Lock()
+
+    def archiver(self, categorie, capteur_id, points):
+        """Met en attente d'archivage des points d'historique d'un capteur."""
+        with self.verrou:
+            for point in points:
+                self.en_attente.setdefault((categorie, jour_utc(point["timestamp"])), []).append((capteur_id, point))
+
+    def ecrire(self):
+        """Écrit les points en attente, une nouvelle partie par partition. Retourne le nombre de points."""
+        with self.verrou:
+            partitions, self.en_attente = self.en_attente, {}
+
+        nombre = 0
+        for (categorie, jour), lignes in partitions.items():
+            repertoire = os.path.join(self.repertoire, categorie, jour)
+            os.makedirs(repertoire, exist_ok=True)
+            parties = [nom for nom in os.listdir(repertoire) if nom.endswith(self.extension)]
+            chemin = os.path.join(repertoire, f"partie-{len(parties):05d}{self.extension}")
+
+            colonnes = self._colonnes(categorie, lignes)
+            # Écriture dans un fichier temporaire puis renommage: une requête ne lit jamais une partie incomplète
+            chemin_temporaire = chemin + ".tmp"
+            getattr(self, f"_ecrire_{self.format}")(chemin_temporaire, categorie, colonnes)
+            os.replace(chemin_temporaire, chemin)
+            nombre += len(lignes)
+        return nombre
+
+    def _colonnes(self, categorie, lignes):
+        """Transpose les lignes (capteur_id, point) en colonnes."""
+        colonnes = {
+            "capteur_id": [capteur_id for capteur_id, _ in lignes],
+            "timestamp": [point["timestamp"] for _, point in lignes]
+        }
+        for nom, _ in self.champs_historique[categorie]:
+            colonnes[nom] = [point[nom] for _, point in lignes]
+        return colonnes
+
+    def _ecrire_parquet(self, chemin, categorie, colonnes):
+        schema = pyarrow.schema(
+            [("capteur_id", "string"), ("timestamp", "float64")] +
+            [(nom, TYPES_ARROW[type_champ]) for nom, type_champ in self.champs_historique[categorie]]
+        )
+        with open(chemin, "wb") as fichier:
+            pq.write_table(pyarrow.table(colonnes, schema=schema), fichier, compression="zstd")
+
+    def _ecrire_npz(self, chemin, categorie, colonnes):
+        tableaux = {
+            "capteur_id": np.array(colonnes["capteur_id"], dtype=str),
+            "timestamp": np.array(colonnes["timestamp"], dtype="f8")
+        }
+        for nom, type_champ in self.champs_historique[categorie]:
+            tableaux[nom] = np.array(colonnes[nom], dtype=TYPES_NUMPY[type_champ])
+        with open(chemin, "wb") as fichier:
+            np.savez_compressed(fichier, **tableaux)
+
+    def _ecrire_csv(self, chemin, categorie, colonnes):
+        with gzip.open(chemin, "wt", newline="", encoding="utf-8") as fichier:
+            ecrivain = csv.writer(fichier)
+            ecrivain.writerow(colonnes.keys())
+            ecrivain.writerows(zip(*colonnes.values()))
+
+    def partitions(self, categorie, debut=None, fin=None):
+        """Retourne les répertoires des partitions d'une catégorie chevauchant [debut, fin]."""
+        repertoire = os.path.join(self.repertoire, categorie)
+        if not os.path.isdir(repertoire):
+            return []
+        premier_jour = jour_utc(debut) if debut is not None else None
+        dernier_jour = jour_utc(fin) if fin is not None else None
+        return [
+            os.path.join(repertoire, jour) for jour in sorted(os.listdir(repertoire))
+            if (premier_jour is None or jour >= premier_jour) and (dernier_jour is None or jour <= dernier_jour)
+        ]
+
+    def requete(self, categorie, debut=None, fin=None, capteurs=None):
+        """Itère sur les points archivés (dictionnaires avec capteur_id) d'une catégorie.
+
+        Seules les partitions chevauchant [debut, fin] sont lues, une partie à la fois.
+        capteurs restreint le résultat à un ensemble d'identifiants.
+        """
+        champs = self.champs_historique[categorie]
+        for partition in self.partitions(categorie, debut, fin):
+            for nom in sorted(os.listdir(partition)):
+                format_partie = format_fichier(nom)
+                if format_partie is None:
+                    continue
+                lecture = getattr(self, f"_lire_{format_partie}")
+                for point in lecture(os.path.join(partition, nom), champs):
+                    timestamp = point["timestamp"]
+                    if debut is not None and timestamp < debut:
+                        continue
+                    if fin is not None and timestamp > fin:
+                        continue
+                    if capteurs is not None and point["capteur_id"] not in capteurs:
+                        continue
+                    yield point
+
+    def _lire_parquet(self, chemin, champs):
+        if not PYARROW_DISPONIBLE:
+            raise RuntimeError(f"pyarrow est nécessaire pour lire {chemin}")
+        for lot in pq.ParquetFile(chemin).iter_batches():
+            yield from lot.to_pylist()
+
+    def _lire_npz(self, chemin, champs):
+        if not NUMPY_DISPONIBLE:
+            raise RuntimeError(f"numpy est nécessaire pour lire {chemin}")
+        with np.load(chemin) as tableaux:
+            colonnes = {nom: tableaux[nom].tolist() for nom in tableaux.files}
+        noms = list(colonnes)
+        for valeurs in zip(*colonnes.values()):
+            yield dict(zip(noms, valeurs))
+
+    def _lire_csv(self, chemin, champs):
+        conversions = {"capteur_id": str, "timestamp": float}
+        conversions.update((nom, CONVERSIONS[type_champ]) for nom, type_champ in champs)
+        with gzip.open(chemin, "rt", newline="", encoding="utf-8") as fichier:
+            for ligne in csv.DictReader(fichier):
+                yield {nom: conversions[nom](valeur) for nom, valeur in ligne.items()}
@@ -0,0 +1,129 @@
+# Fichier: categories.py
+# Description des catégories de capteurs gérées par l'API
+
+import time
+
+# Pour chaque catégorie: préfixe du topic MQTT, emplacement dans les dictionnaires
+# de données (donnees_capteurs / historique_donnees) et événement WebSocket émis
+CATEGORIES = {
+    "parking": {
+        "prefixe": "iot/parking/",
+        "chemin": ("parking",),
+        "evenement": "update_parking"
+    },
+    "batiments": {
+        "prefixe": "iot/batiments/",
+        "chemin": ("batiments",),
+        "evenement": "update_batiment"
+    },
+    "wifi": {
+        "prefixe": "iot/wifi/",
+        "chemin": ("wifi",),
+        "evenement": "update_wifi"
+    },
+    "meteo": {
+        "prefixe": "iot/meteo/",
+        "chemin": ("meteo",),
+        "evenement": "update_meteo"
+    },
+    "bus": {
+        "prefixe": "iot/transport/position/bus/",
+        "chemin": ("transport", "bus"),
+        "evenement": "update_transport_bus"
+    },
+    "taxi": {
+        "prefixe": "iot/transport/position/taxi/",
+        "chemin": ("transport", "taxi"),
+        "evenement": "update_transport_taxi"
+    }
+}
+
+# Dernier segment des topics transportant un lot de lectures
+SUFFIXE_LOT = "batch"
+
+# Champs des points d'historique de chaque catégorie (hors timestamp) et leur type:
+# "REAL", "INTEGER" ou "BOOLEAN". Utilisé par les backends de persistance.
+CHAMPS_HISTORIQUE = {
+    "parking": [("places_disponibles", "INTEGER")],
+    "batiments": [("occupation_totale", "INTEGER")],
+    "wifi": [("puissance_signal", "INTEGER"), ("utilisateurs_connectes", "INTEGER"), ("niveau_congestion", "INTEGER")],
+    "meteo": [("temperature", "REAL"), ("humidite", "REAL")],
+    "bus": [("latitude", "REAL"), ("longitude", "REAL"), ("passagers", "INTEGER")],
+    "taxi": [("latitude", "REAL"), ("longitude", "REAL"), ("disponible", "BOOLEAN")]
+}
+
+# Métriques des payloads classées en continu (/api/<categorie>/top) et ordre par défaut
+# du classement: "desc" pour les plus fortes valeurs d'abord, "asc" pour les plus faibles
+CLASSEMENTS = {
+    "parking": {"places_disponibles": "asc"},
+    "wifi": {"niveau_congestion": "desc", "utilisateurs_connectes": "desc"},
+    "bus": {"taux_occupation": "desc", "passagers": "desc"}
+}
+
+def trouver_categorie(topic):
+    """Retourne la catégorie et l'identifiant du capteur correspondant à un topic.
+
+    Retourne (None, None) si le topic ne correspond à aucune catégorie connue.
+    """
+    for categorie, description in CATEGORIES.items():
+        if topic.startswith(description["prefixe"]):
+            return categorie, topic.split("/")[-1]
+    return None, None
+
+def sous_dictionnaire(racine, categorie):
+    """Retourne le sous-dictionnaire d'une catégorie dans donnees_capteurs ou historique_donnees."""
+    for cle in CATEGORIES[categorie]["chemin"]:
+        racine = racine[cle]
+    return racine
+
+def extraire_point_historique(categorie, payload):
+    """Construit le point d'historique conservé pour une lecture."""
+    timestamp = payload.get("timestamp", time.time())
+
+    if categorie == "parking":
+        return {
+            "timestamp": timestamp,
+            "places_disponibles": payload.get("places_disponibles", 0)
+        }
+
+    if categorie == "batiments":
+        # Calculer l'occupation totale
+        occupation_totale = 0
+        for salle in payload.get("salles", []):
+            occupation_totale += salle.get("occupation_actuelle", 0)
+        return {
+            "timestamp": timestamp,
+            "occupation_totale": occupation_totale
+        }
+
+    if categorie == "wifi":
+        return {
+            "timestamp": timestamp,
+            "puissance_signal": payload.get("puissance_signal", 0),
+            "utilisateurs_connectes": payload.get("utilisateurs_connectes", 0),
+            "niveau_congestion": payload.get("niveau_congestion", 0)
+        }
+
+    if categorie == "meteo":
+        return {
+            "timestamp": timestamp,
+            "temperature": payload.get("temperature", 0),
+            "humidite": payload.get("humidite", 0)
+        }
+
+    if categorie == "bus":
+        # Position uniquement
+        return {
+            "timestamp": timestamp,
+            "latitude": payload.get("latitude", 0),
+            "longitude": payload.get("longitude", 0),
+            "passagers": payload.get("passagers", 0)
+        }
+
+    # Taxi: position uniquement
+    return {
+        "timestamp": timestamp,
+        "latitude": payload.get("latitude", 0),
+        "longitude": payload.get("longitude", 0),
+        "disponible": payload.get("disponible", False)
+    }
@@ -0,0 +1,41 @@
+# Fichier: classements.py
+# Classements des capteurs selon une métrique, maintenus à chaque message
+
+from bisect import bisect_left, insort
+
+class Classement:
+    """Capteurs triés selon la valeur courante d'une métrique.
+
+    La liste triée de (valeur, capteur_id) est mise à jour par recherche
+    dichotomique: la position est trouvée en O(log n) et les k premiers
+    (ou derniers) capteurs sont lus sans parcourir la catégorie.
+    """
+
+    def __init__(self):
+        self.tries = []
+        self.valeurs = {}
+
+    def __len__(self):
+        return len(self.tries)
+
+    def retirer(self, capteur_id):
+        """Retire un capteur du classement s'il y figure."""
+        valeur = self.valeurs.pop(capteur_id, None)
+        if valeur is not None:
+            del self.tries[bisect_left(self.tries, (valeur, capteur_id))]
+
+    def mettre_a_jour(self, capteur_id, valeur):
+        """Enregistre la nouvelle valeur d'un capteur."""
+        if self.valeurs.get(capteur_id) == valeur:
+            return
+        self.retirer(capteur_id)
+        self.valeurs[capteur_id] = valeur
+        insort(self.tries, (valeur, capteur_id))
+
+    def premiers(self, k, decroissant=True):
+        """Retourne les k capteurs de plus forte (ou plus faible) valeur: [(capteur_id, valeur)]."""
+        if decroissant:
+            selection = reversed(self.tries[-k:]) if k > 0 else []
+        else:
+            selection = self.tries[:k]
+        return [(capteur_id, valeur) for valeur, capteur_id in selection]
@@ -1,9 +1,17 @@
 # Fichier: config.py
 # Configuration pour l'API REST
 
+import os
+
+# Variables d'environnement surchargeant le broker, le port d'écoute et la période de nettoyage (bancs de charge)
+VARIABLE_BROKER_ADRESSE = "API_BROKER_ADRESSE"
+VARIABLE_BROKER_PORT = "API_BROKER_PORT"
+VARIABLE_API_PORT = "API_PORT"
+VARIABLE_PERIODE_NETTOYAGE = "API_PERIODE_NETTOYAGE"
+
 # Configuration du broker MQTT
-BROKER_ADRESSE = "localhost"
-BROKER_PORT = 1883
+BROKER_ADRESSE = os.environ.get(VARIABLE_BROKER_ADRESSE, "localhost")
+BROKER_PORT = int(os.environ.get(VARIABLE_BROKER_PORT, 1883))
 CLIENT_ID_BASE = "api_rest_"
 
 # Topics MQTT à surveiller
@@ -17,10 +25,89 @@ TOPICS = [
 
 # Configuration de l'API REST
 API_HOST = "0.0.0.0"
-API_PORT = 5000
+API_PORT = int(os.environ.get(VARIABLE_API_PORT, 5000))
 
 # Période de nettoyage des données anciennes (en secondes)
-PERIODE_NETTOYAGE = 3600  # 1 heure
+PERIODE_NETTOYAGE = int(os.environ.get(VARIABLE_PERIODE_NETTOYAGE, 3600))  # 1 heure
 
 # Durée de conservation des données (en secondes)
 DUREE_CONSERVATION = 86400  # 24 heures
+
+# Instantané des dernières valeurs, rechargé au démarrage (None pour désactiver)
+FICHIER_INSTANTANE = "instantane.json.gz"
+PERIODE_INSTANTANE = 30   # Période d'écriture de l'instantané (en secondes)
+
+# Persistance de l'historique: "memoire" (aucune persistance), "sqlite" ou "segments"
+BACKEND_HISTORIQUE = "memoire"
+FICHIER_SQLITE = "historique.db"
+DELAI_ECRITURE_MS = 500       # Les écritures en attente sont validées au moins toutes les N ms...
+TAILLE_LOT_ECRITURE = 1000    # ... ou dès que M lignes sont en attente
+DUREE_TIER_CHAUD = 3600       # Historique gardé en mémoire lorsqu'un backend persistant est actif
+
+# Journal de segments (BACKEND_HISTORIQUE = "segments")
+REPERTOIRE_SEGMENTS = "segments"
+TAILLE_SEGMENT = 64 * 1024 * 1024   # Taille maximale d'un segment (octets)
+DUREE_SEGMENT = 3600                # Un segment couvre au plus cette durée: granularité de la rétention
+PAS_INDEX_SEGMENT = 1024            # Enregistrements par bloc de l'index temporel épars
+
+# Archive à froid de l'historique expiré, partitionnée par catégorie et par jour (None pour désactiver)
+REPERTOIRE_ARCHIVE = "archives"
+FORMAT_ARCHIVE = None   # "parquet", "npz" ou "csv"; None = meilleur format disponible
+
+# Nombre de lignes regroupées dans chaque bloc des réponses en flux
+TAILLE_BLOC_FLUX = 1000
+
+# Nombre de résultats de /api/query conservés en cache (invalidés à chaque nouvelle donnée)
+TAILLE_CACHE_REQUETES = 128
+
+# Sketches de quantiles par capteur (/stats): durée d'un intervalle, nombre d'intervalles conservés
+# et taille des sketches (erreur de rang de l'ordre de 1 / TAILLE_SKETCH)
+PAS_STATISTIQUES = 3600
+NOMBRE_INTERVALLES_STATISTIQUES = 24
+TAILLE_SKETCH = 64
+
+# Règles d'alerte évaluées à la réception des messages. Chaque règle compare un champ du payload
+# (ou de chaque élément de la liste "pour_chaque") à une "valeur" fixe ou à un "champ_reference",
+# et déclenche une alerte lorsque la condition est vraie depuis "duree" secondes.
+REGLES_ALERTES = [
+    {"nom": "parking_complet", "categorie": "parking", "champ": "places_disponibles",
+     "operateur": "<=", "valeur": 0, "gravite": "avertissement"},
+    {"nom": "point_acces_hors_ligne", "categorie": "wifi", "champ": "est_en_ligne",
+     "operateur": "==", "valeur": False, "duree": 60, "gravite": "critique"},
+    {"nom": "salle_sur_capacite", "categorie": "batiments", "pour_chaque": "salles", "champ": "occupation_actuelle",
+     "operateur": ">", "champ_reference": "capacite", "gravite": "critique"},
+    {"nom": "temperature_elevee", "categorie": "meteo", "champ": "temperature",
+     "operateur": ">", "valeur": 35, "duree": 600, "gravite": "avertissement"}
+]
+
+# Détection d'anomalies: champs suivis par moyenne/variance EWMA, par capteur et par catégorie
+DETECTEURS_EWMA = {
+    "meteo": ["temperature", "humidite"],
+    "wifi": ["utilisateurs_connectes"],
+    "parking": ["places_disponibles"]
+}
+ALPHA_EWMA = 0.1            # Poids de la dernière valeur dans la moyenne et la variance
+SEUIL_Z_EWMA = 4.0          # Écart (en écarts-types) au-delà duquel une valeur est anormale
+ECHAUFFEMENT_EWMA = 20      # Valeurs observées avant de signaler des anomalies
+TAILLE_JOURNAL_ALERTES = 1000
+
+# Détection des capteurs périmés: intervalle de publication attendu par catégorie (en secondes,
+# repris des INTERVALLE_* de la configuration des capteurs) et nombre d'intervalles manqués tolérés
+INTERVALLES_ATTENDUS = {
+    "parking": 60,
+    "batiments": 60,
+    "wifi": 30,
+    "meteo": 120,
+    "bus": 15,
+    "taxi": 15
+}
+TOLERANCE_FRAICHEUR = 3
+PERIODE_FRAICHEUR_MAX = 5   # Attente maximale entre deux vérifications des échéances (en secondes)
+
+# Profilage à la demande (routes /admin/profilage) et journal des requêtes lentes.
+# Désactivé par défaut: les routes ne sont alors pas déclarées et aucun point d'entrée n'est instrumenté.
+PROFILAGE_ACTIF = False
+DUREE_PROFILAGE_MAX = 300             # Durée maximale d'une session de profilage (en secondes)
+INTERVALLE_ECHANTILLONNAGE = 0.01     # Période de relevé des piles en mode échantillonnage (en secondes)
+SEUIL_REQUETE_LENTE = 0.5             # Les requêtes plus longues sont journalisées (en secondes)
+TAILLE_JOURNAL_REQUETES_LENTES = 200
@@ -0,0 +1,90 @@
+# Fichier: fraicheur.py
+# Détection des capteurs qui ont cessé de publier: index de dernière réception et tas d'échéances
+
+import heapq
+
+class SuiviFraicheur:
+    """Dernière réception de chaque capteur et échéance au-delà de laquelle il est périmé.
+
+    L'échéance d'un capteur est sa dernière réception plus tolerance fois
+    l'intervalle de publication attendu de sa catégorie. Les échéances sont
+    rangées dans un tas-min: une réception coûte O(log n) et expirer() ne lit
+    que les échéances dépassées, sans parcourir tous les capteurs.
+
+    Une réception n'ajoute qu'une nouvelle entrée au tas; l'entrée précédente
+    du capteur, devenue obsolète, est ignorée lorsqu'elle en sort. Les nombres
+    de capteurs suivis et périmés sont tenus à jour par catégorie, pour que
+    compter() ne parcoure pas les capteurs.
+    """
+
+    def __init__(self, intervalles, tolerance=3):
+        self.intervalles = intervalles
+        self.tolerance = tolerance
+        self.echeances = []
+        # {(categorie, capteur_id): (derniere_reception, echeance)}
+        self.receptions = {}
+        self.perimes = set()
+        self.comptes = {categorie: {"total": 0, "perimes": 0} for categorie in intervalles}
+
+    def __len__(self):
+        return len(self.receptions)
+
+    def delai(self, categorie):
+        """Délai sans réception au-delà duquel un capteur de la catégorie est périmé."""
+        return self.intervalles[categorie] * self.tolerance
+
+    def recevoir(self, categorie, capteur_id, instant):
+        """Enregistre une réception. Retourne True si le capteur était périmé."""
+        cle = (categorie, capteur_id)
+        echeance = instant + self.delai(categorie)
+        if cle not in self.receptions:
+            self.comptes[categorie]["total"] += 1
+        self.receptions[cle] = (instant, echeance)
+        heapq.heappush(self.echeances, (echeance, categorie, capteur_id))
+        # Avant une éventuelle reconstruction du tas, qui ignore les capteurs périmés
+        retabli = cle in self.perimes
+        if retabli:
+            self.perimes.discard(cle)
+            self.comptes[categorie]["perimes"] -= 1
+
+        # Le tas ne garde au plus qu'une entrée obsolète par réception récente; le reconstruire
+        # lorsqu'elles dominent borne sa taille même pour des capteurs très bavards
+        if len(self.echeances) > 4 * len(self.receptions) + 64:
+            self.echeances = [(e, c, i) for (c, i), (_, e) in self.receptions.items() if (c, i) not in self.perimes]
+            heapq.heapify(self.echeances)
+        return retabli
+
+    def expirer(self, instant):
+        """Marque périmés les capteurs dont l'échéance est dépassée à instant.
+
+        Retourne la liste des capteurs nouvellement périmés: [(categorie, capteur_id, derniere_reception)].
+        """
+        nouveaux = []
+        while self.echeances and self.echeances[0][0] <= instant:
+            echeance, categorie, capteur_id = heapq.heappop(self.echeances)
+            cle = (categorie, capteur_id)
+            reception = self.receptions.get(cle)
+            # Entrée obsolète: le capteur a été reçu depuis
+            if reception is None or reception[1] != echeance or cle in self.perimes:
+                continue
+            self.perimes.add(cle)
+            self.comptes[categorie]["perimes"] += 1
+            nouveaux.append((categorie, capteur_id, reception[0]))
+        return nouveaux
+
+    def prochaine_echeance(self):
+        """Retourne la plus proche échéance connue (None si aucune)."""
+        return self.echeances[0][0] if self.echeances else None
+
+    def est_perime(self, categorie, capteur_id):
+        """Indique si un capteur est actuellement périmé."""
+        return (categorie, capteur_id) in self.perimes
+
+    def derniere_reception(self, categorie, capteur_id):
+        """Retourne l'instant de la dernière réception d'un capteur (None s'il est inconnu)."""
+        reception = self.receptions.get((categorie, capteur_id))
+        return reception[0] if reception else None
+
+    def compter(self):
+        """Retourne, par catégorie, le nombre de capteurs suivis et de capteurs périmés."""
+        return {categorie: dict(compte) for categorie, compte in self.comptes.items()}
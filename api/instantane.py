@@ -0,0 +1,39 @@
+# Fichier: instantane.py
+# Instantané des dernières valeurs des capteurs, pour un redémarrage à chaud de l'API
+
+import gzip
+import json
+import os
+import time
+
+VERSION_INSTANTANE = 1
+
+def ecrire_instantane(chemin, donnees):
+    """Écrit atomiquement l'instantané {categorie: {capteur_id: payload}}.
+
+    Le fichier est écrit à côté de sa destination puis renommé: un arrêt brutal
+    laisse toujours l'instantané précédent intact.
+    """
+    contenu = json.dumps(
+        {"version": VERSION_INSTANTANE, "timestamp": time.time(), "donnees": donnees},
+        ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+    chemin_temporaire = f"{chemin}.tmp"
+    with gzip.open(chemin_temporaire, "wb", compresslevel=1) as fichier:
+        fichier.write(contenu)
+    os.replace(chemin_temporaire, chemin)
+    return len(contenu)
+
+def charger_instantane(chemin):
+    """Retourne (timestamp, donnees) de l'instantané, ou (None, {}) s'il est absent ou illisible."""
+    if not os.path.exists(chemin):
+        return None, {}
+    try:
+        with gzip.open(chemin, "rb") as fichier:
+            instantane = json.loads(fichier.read())
+    except (OSError, ValueError):
+        return None, {}
+    if instantane.get("version") != VERSION_INSTANTANE:
+        return None, {}
+    return instantane["timestamp"], instantane["donnees"]
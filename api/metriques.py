@@ -0,0 +1,240 @@
+# Fichier: metriques.py
+# Métriques de l'API (compteurs, histogrammes, jauges) au format d'exposition texte de Prometheus
+
+import threading
+import time
+from bisect import bisect_left
+
+# Bornes des histogrammes de durée (en secondes)
+BORNES_RAPIDES = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                  0.05, 0.1, 0.25, 0.5, 1.0)
+BORNES_REQUETES = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BORNES_LATENCES = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+# Au-delà de ce nombre de fragments, ceux des threads terminés sont repliés à l'enregistrement d'un nouveau
+FRAGMENTS_MAX = 64
+
+def formater_valeur(valeur):
+    """Formate une valeur numérique pour l'exposition texte."""
+    if isinstance(valeur, float):
+        if valeur != valeur:
+            return "NaN"
+        if valeur in (float("inf"), float("-inf")):
+            return "+Inf" if valeur > 0 else "-Inf"
+        return repr(valeur)
+    return str(valeur)
+
+def echapper(valeur):
+    """Échappe une valeur d'étiquette (barre oblique inverse, guillemet, retour à la ligne)."""
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def formater_etiquettes(noms, valeurs, supplement=""):
+    """Formate les étiquettes d'un échantillon: {nom="valeur",...}."""
+    paires = [f'{nom}="{echapper(valeur)}"' for nom, valeur in zip(noms, valeurs)]
+    if supplement:
+        paires.append(supplement)
+    return "{" + ",".join(paires) + "}" if paires else ""
+
+class _MetriqueParThread:
+    """Métrique dont chaque thread écrit son propre fragment, sans verrou.
+
+    Un fragment n'est modifié que par son thread: l'écriture n'a besoin
+    d'aucune synchronisation. La lecture (au moment de l'exposition) additionne
+    les fragments; ceux des threads terminés sont repliés dans un cumul.
+    """
+
+    type_metrique = None
+
+    def __init__(self, nom, aide, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.etiquettes = tuple(etiquettes)
+        self._local = threading.local()
+        self._fragments = []
+        self._retires = {}
+        self._verrou = threading.Lock()
+
+    def _fragment(self):
+        try:
+            return self._local.fragment
+        except AttributeError:
+            fragment = self._local.fragment = {}
+            with self._verrou:
+                if len(self._fragments) >= FRAGMENTS_MAX:
+                    self._replier()
+                self._fragments.append((threading.current_thread(), fragment))
+            return fragment
+
+    def _replier(self):
+        # Doit être appelée avec self._verrou acquis
+        actifs = []
+        for thread, fragment in self._fragments:
+            if thread.is_alive():
+                actifs.append((thread, fragment))
+            else:
+                self._fusionner(self._retires, fragment)
+        self._fragments = actifs
+
+    def _fusionner(self, cible, fragment):
+        raise NotImplementedError
+
+    def valeurs(self):
+        """Retourne les valeurs agrégées de tous les threads: {etiquettes: valeur}."""
+        with self._verrou:
+            self._replier()
+            total = {}
+            self._fusionner(total, self._retires)
+            for _, fragment in self._fragments:
+                # Copie atomique: le thread propriétaire peut écrire pendant la lecture
+                self._fusionner(total, dict(fragment))
+        return total
+
+class Compteur(_MetriqueParThread):
+    """Compteur monotone, éventuellement étiqueté."""
+
+    type_metrique = "counter"
+
+    def incrementer(self, *etiquettes, valeur=1):
+        """Ajoute valeur au compteur des étiquettes données."""
+        fragment = self._fragment()
+        fragment[etiquettes] = fragment.get(etiquettes, 0) + valeur
+
+    def _fusionner(self, cible, fragment):
+        for etiquettes, valeur in fragment.items():
+            cible[etiquettes] = cible.get(etiquettes, 0) + valeur
+
+    def exposer(self):
+        return [f"{self.nom}{formater_etiquettes(self.etiquettes, etiquettes)} {formater_valeur(valeur)}"
+                for etiquettes, valeur in sorted(self.valeurs().items())]
+
+class Histogramme(_MetriqueParThread):
+    """Histogramme à bornes fixes: nombre d'observations par intervalle et somme."""
+
+    type_metrique = "histogram"
+
+    def __init__(self, nom, aide, etiquettes=(), bornes=BORNES_RAPIDES):
+        super().__init__(nom, aide, etiquettes)
+        self.bornes = tuple(bornes)
+
+    def observer(self, valeur, *etiquettes):
+        """Enregistre une observation."""
+        fragment = self._fragment()
+        comptes = fragment.get(etiquettes)
+        if comptes is None:
+            # Un compte par borne, un pour +Inf, puis la somme des observations
+            comptes = fragment[etiquettes] = [0] * (len(self.bornes) + 1) + [0.0]
+        comptes[bisect_left(self.bornes, valeur)] += 1
+        comptes[-1] += valeur
+
+    def _fusionner(self, cible, fragment):
+        for etiquettes, comptes in fragment.items():
+            comptes = list(comptes)
+            existants = cible.get(etiquettes)
+            if existants is None:
+                cible[etiquettes] = comptes
+            else:
+                cible[etiquettes] = [a + b for a, b in zip(existants, comptes)]
+
+    def exposer(self):
+        lignes = []
+        for etiquettes, comptes in sorted(self.valeurs().items()):
+            cumul = 0
+            for borne, compte in zip(self.bornes + (float("inf"),), comptes):
+                cumul += compte
+                le = f'le="{formater_valeur(float(borne))}"'
+                lignes.append(f"{self.nom}_bucket{formater_etiquettes(self.etiquettes, etiquettes, le)} {cumul}")
+            suffixe = formater_etiquettes(self.etiquettes, etiquettes)
+            lignes.append(f"{self.nom}_sum{suffixe} {formater_valeur(comptes[-1])}")
+            lignes.append(f"{self.nom}_count{suffixe} {cumul}")
+        return lignes
+
+class Jauge:
+    """Valeur instantanée, calculée à la lecture par une fonction.
+
+    La fonction retourne un nombre, ou {etiquettes: valeur} si la jauge est étiquetée.
+    """
+
+    type_metrique = "gauge"
+
+    def __init__(self, nom, aide, fonction, etiquettes=()):
+        self.nom = nom
+        self.aide = aide
+        self.fonction = fonction
+        self.etiquettes = tuple(etiquettes)
+
+    def exposer(self):
+        valeurs = self.fonction()
+        if not self.etiquettes:
+            valeurs = {(): valeurs}
+        return [f"{self.nom}{formater_etiquettes(self.etiquettes, etiquettes)} {formater_valeur(valeur)}"
+                for etiquettes, valeur in sorted(valeurs.items())]
+
+class Registre:
+    """Ensemble des métriques exposées par /metrics."""
+
+    TYPE_CONTENU = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metriques = []
+
+    def compteur(self, nom, aide, etiquettes=()):
+        return self._ajouter(Compteur(nom, aide, etiquettes))
+
+    def histogramme(self, nom, aide, etiquettes=(), bornes=BORNES_RAPIDES):
+        return self._ajouter(Histogramme(nom, aide, etiquettes, bornes))
+
+    def jauge(self, nom, aide, fonction, etiquettes=()):
+        return self._ajouter(Jauge(nom, aide, fonction, etiquettes))
+
+    def _ajouter(self, metrique):
+        self.metriques.append(metrique)
+        return metrique
+
+    def exposer(self):
+        """Retourne toutes les métriques au format d'exposition texte."""
+        lignes = []
+        for metrique in self.metriques:
+            lignes.append(f"# HELP {metrique.nom} {metrique.aide}")
+            lignes.append(f"# TYPE {metrique.nom} {metrique.type_metrique}")
+            lignes.extend(metrique.exposer())
+        return "\n".join(lignes) + "\n"
+
+class VerrouInstrumente:
+    """Verrou mesurant le temps d'attente et de détention de chaque acquisition.
+
+    S'utilise comme threading.Lock (with, acquire, release). Les durées sont
+    enregistrées dans deux histogrammes étiquetés par le nom du verrou.
+    """
+
+    def __init__(self, nom, attente, detention):
+        self.nom = nom
+        self._verrou = threading.Lock()
+        self._attente = attente
+        self._detention = detention
+        self._acquis = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        debut = time.perf_counter()
+        if not self._verrou.acquire(blocking, timeout):
+            return False
+        acquis = time.perf_counter()
+        # Seul le détenteur du verrou écrit l'instant d'acquisition
+        self._acquis = acquis
+        self._attente.observer(acquis - debut, self.nom)
+        return True
+
+    def release(self):
+        duree = time.perf_counter() - self._acquis
+        self._verrou.release()
+        self._detention.observer(duree, self.nom)
+
+    def locked(self):
+        return self._verrou.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exception):
+        self.release()
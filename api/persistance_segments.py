@@ -0,0 +1,504 @@
+# Fichier: persistance_segments.py
+# Backend de persistance de l'historique dans des segments binaires mappés en mémoire
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import logging
+import zlib
+from contextlib import contextmanager
+
+# NumPy permet de filtrer les enregistrements directement dans la projection mémoire
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+
+logger = logging.getLogger('api_rest')
+
+# En-tête d'un segment: signature, nombre d'enregistrements, timestamps min/max, scellé, empreinte des champs
+EN_TETE = struct.Struct("<8sQddBI")
+SIGNATURE = b"IOTSEG02"
+SIGNATURE_V1 = b"IOTSEG01"  # Sans empreinte des champs
+TAILLE_EN_TETE = 64
+
+# Bornes (timestamp min, timestamp max) d'un bloc de l'index temporel épars
+FORMAT_INDEX = struct.Struct("<dd")
+
+# Codage binaire (struct, NumPy) et conversion des champs selon leur type
+CODAGES = {"REAL": ("d", "<f8", float), "INTEGER": ("q", "<i8", int), "BOOLEAN": ("?", "?", bool)}
+
+def empreinte_champs(champs):
+    """Empreinte (CRC32) de la liste des champs d'une catégorie, qui détermine le format des enregistrements."""
+    return zlib.crc32(";".join(f"{nom}:{type_champ}" for nom, type_champ in champs).encode())
+
+def formats_enregistrement(champs):
+    """Retourne le format struct et le type NumPy (None sans NumPy) des enregistrements d'une catégorie."""
+    format_enregistrement = struct.Struct("<dI" + "".join(CODAGES[type_champ][0] for _, type_champ in champs))
+    type_numpy = None
+    if NUMPY_DISPONIBLE:
+        type_numpy = np.dtype([("timestamp", "<f8"), ("capteur", "<u4")] +
+                              [(nom, CODAGES[type_champ][1]) for nom, type_champ in champs])
+    return format_enregistrement, type_numpy
+
+class Segment:
+    """Fichier de taille fixe contenant des enregistrements de largeur fixe.
+
+    Les enregistrements sont ajoutés à la suite; l'en-tête (nombre, bornes
+    temporelles) est mis à jour après chaque ajout, si bien qu'un arrêt brutal
+    perd au plus l'enregistrement en cours. Un index épars conserve les bornes
+    temporelles de chaque bloc de pas_index enregistrements (fichier .idx).
+    L'en-tête porte l'empreinte des champs: un segment écrit avec d'autres
+    champs est refusé à l'ouverture.
+
+    Les lectures se font hors du verrou du journal: la projection en écriture
+    remplacée au scellement n'est fermée, et le fichier réduit, qu'une fois
+    qu'aucun lecteur ne l'utilise plus.
+    """
+
+    def __init__(self, chemin, format_enregistrement, type_numpy, pas_index, empreinte, capacite_octets=None):
+        self.chemin = chemin
+        self.chemin_index = chemin[:-len(".seg")] + ".idx"
+        self.numero = int(os.path.basename(chemin)[:-len(".seg")])
+        self.format = format_enregistrement
+        self.type_numpy = type_numpy
+        self.pas_index = pas_index
+        self.empreinte = empreinte
+        self._verrou_projection = threading.Lock()
+        self._lecteurs = 0
+        self._a_liberer = None  # (projection, fichier, taille utile) remplacés au scellement
+
+        if capacite_octets is not None:
+            # Nouveau segment: fichier préalloué (creux) à la capacité demandée
+            with open(chemin, "wb") as fichier:
+                fichier.truncate(capacite_octets)
+            self.nombre, self.t_min, self.t_max, self.scelle = 0, float("inf"), float("-inf"), False
+        else:
+            with open(chemin, "rb") as fichier:
+                signature, self.nombre, self.t_min, self.t_max, scelle, empreinte = EN_TETE.unpack(
+                    fichier.read(EN_TETE.size))
+            if signature == SIGNATURE_V1:
+                raise ValueError(f"{chemin}: segment d'une version antérieure, sans description de ses champs")
+            if signature != SIGNATURE:
+                raise ValueError(f"{chemin} n'est pas un segment d'historique")
+            if empreinte != self.empreinte:
+                raise ValueError(f"{chemin}: segment écrit avec d'autres champs que ceux de la catégorie")
+            self.scelle = bool(scelle)
+
+        self.fichier = open(chemin, "rb" if self.scelle else "r+b")
+        self.memoire = mmap.mmap(self.fichier.fileno(), 0,
+                                 access=mmap.ACCESS_READ if self.scelle else mmap.ACCESS_WRITE)
+        self.capacite = (len(self.memoire) - TAILLE_EN_TETE) // self.format.size
+        self._charger_index()
+
+    def _charger_index(self):
+        """Lit l'index épars et complète les blocs manquants à partir des enregistrements."""
+        self.blocs = []
+        if os.path.exists(self.chemin_index):
+            with open(self.chemin_index, "rb") as fichier:
+                contenu = fichier.read()
+            self.blocs = [list(bornes) for bornes in FORMAT_INDEX.iter_unpack(
+                contenu[:len(contenu) - len(contenu) % FORMAT_INDEX.size])]
+
+        # Les blocs complets au-delà de l'index (arrêt brutal) et le bloc en cours sont recalculés
+        blocs_complets = self.nombre // self.pas_index
+        del self.blocs[blocs_complets:]
+        with open(self.chemin_index, "ab") as fichier:
+            fichier.truncate(len(self.blocs) * FORMAT_INDEX.size)
+            for bloc in range(len(self.blocs), -(-self.nombre // self.pas_index)):
+                timestamps = [enregistrement[0] for enregistrement in self._lire_bloc(bloc)]
+                self.blocs.append([min(timestamps), max(timestamps)])
+                if bloc < blocs_complets:
+                    fichier.write(FORMAT_INDEX.pack(*self.blocs[bloc]))
+
+    def plein(self):
+        return self.nombre >= self.capacite
+
+    def ajouter(self, enregistrement, timestamp):
+        """Ajoute un enregistrement (tuple de valeurs) à la fin du segment."""
+        self.format.pack_into(self.memoire, TAILLE_EN_TETE + self.nombre * self.format.size, *enregistrement)
+
+        if self.nombre % self.pas_index == 0:
+            self.blocs.append([timestamp, timestamp])
+        else:
+            bloc = self.blocs[-1]
+            bloc[0] = min(bloc[0], timestamp)
+            bloc[1] = max(bloc[1], timestamp)
+
+        self.nombre += 1
+        self.t_min = min(self.t_min, timestamp)
+        self.t_max = max(self.t_max, timestamp)
+        self._ecrire_en_tete()
+
+        if self.nombre % self.pas_index == 0:
+            with open(self.chemin_index, "ab") as fichier:
+                fichier.write(FORMAT_INDEX.pack(*self.blocs[-1]))
+
+    def _ecrire_en_tete(self):
+        EN_TETE.pack_into(self.memoire, 0, SIGNATURE, self.nombre, self.t_min, self.t_max, self.scelle, self.empreinte)
+
+    def sceller(self):
+        """Marque le segment comme terminé et réduit le fichier à sa taille utile."""
+        self.scelle = True
+        self._ecrire_en_tete()
+        self.memoire.flush()
+
+        # Projection en lecture seule limitée à la partie utile, qui survit à la réduction du fichier
+        taille = TAILLE_EN_TETE + self.nombre * self.format.size
+        fichier = open(self.chemin, "rb")
+        memoire = mmap.mmap(fichier.fileno(), taille, access=mmap.ACCESS_READ)
+        with self._verrou_projection:
+            self._a_liberer = (self.memoire, self.fichier, taille)
+            self.fichier, self.memoire = fichier, memoire
+            self.capacite = self.nombre
+            if self._lecteurs == 0:
+                self._liberer()
+
+    def _liberer(self):
+        """Ferme l'ancienne projection en écriture puis réduit le fichier (verrou de projection acquis)."""
+        if self._a_liberer is None:
+            return
+        memoire, fichier, taille = self._a_liberer
+        try:
+            memoire.close()
+        except BufferError:
+            return  # Une vue NumPy la référence encore: nouvel essai à la sortie du prochain lecteur
+        fichier.close()
+        self._a_liberer = None
+        try:
+            os.truncate(self.chemin, taille)
+        except FileNotFoundError:
+            pass  # Segment supprimé entre-temps
+
+    @contextmanager
+    def _lecture(self):
+        """Fournit la projection courante, qui reste ouverte jusqu'à la sortie du bloc."""
+        with self._verrou_projection:
+            self._lecteurs += 1
+            memoire = self.memoire
+        try:
+            yield memoire
+        finally:
+            with self._verrou_projection:
+                self._lecteurs -= 1
+                if self._lecteurs == 0:
+                    self._liberer()
+
+    def _lire_bloc(self, bloc):
+        debut = bloc * self.pas_index
+        fin = min(debut + self.pas_index, self.nombre)
+        with self._lecture() as memoire:
+            return self.format.iter_unpack(
+                memoire[TAILLE_EN_TETE + debut * self.format.size:TAILLE_EN_TETE + fin * self.format.size])
+
+    def parcourir(self, debut=None, fin=None):
+        """Itère sur les enregistrements des blocs chevauchant l'intervalle [debut, fin]."""
+        for bloc, (t_min, t_max) in enumerate(list(self.blocs)):
+            if (debut is not None and t_max < debut) or (fin is not None and t_min > fin):
+                continue
+            yield from self._lire_bloc(bloc)
+
+    def _plages(self, debut, fin):
+        """Retourne les plages contiguës d'enregistrements dont les blocs chevauchent [debut, fin]."""
+        nombre = self.nombre
+        plages = []
+        for bloc, (t_min, t_max) in enumerate(list(self.blocs)):
+            if (debut is not None and t_max < debut) or (fin is not None and t_min > fin):
+                continue
+            premier, dernier = bloc * self.pas_index, min((bloc + 1) * self.pas_index, nombre)
+            if premier >= dernier:
+                continue  # Bloc commencé après la lecture de self.nombre
+            if plages and plages[-1][1] == premier:
+                plages[-1][1] = dernier
+            else:
+                plages.append([premier, dernier])
+        return plages
+
+    def filtrer(self, indice, debut=None, fin=None):
+        """Retourne les enregistrements du capteur indice avec debut <= timestamp <= fin."""
+        if not NUMPY_DISPONIBLE:
+            return [
+                e for e in self.parcourir(debut, fin)
+                if e[1] == indice and (debut is None or e[0] >= debut) and (fin is None or e[0] <= fin)
+            ]
+
+        resultat = []
+        with self._lecture() as memoire:
+            for premier, dernier in self._plages(debut, fin):
+                # Vue sans copie sur la projection mémoire
+                enregistrements = np.frombuffer(memoire, dtype=self.type_numpy, count=dernier - premier,
+                                                offset=TAILLE_EN_TETE + premier * self.format.size)
+                masque = enregistrements["capteur"] == indice
+                if debut is not None:
+                    masque &= enregistrements["timestamp"] >= debut
+                if fin is not None:
+                    masque &= enregistrements["timestamp"] <= fin
+                resultat.extend(enregistrements[masque].tolist())
+                # La vue ne doit pas survivre à la lecture, sinon la projection ne peut être fermée
+                del enregistrements
+        return resultat
+
+    def vider(self):
+        if not self.scelle:
+            with self._lecture() as memoire:
+                memoire.flush()
+
+    def fermer(self):
+        """Ferme la projection et le fichier du segment (aucun lecteur ne doit être en cours)."""
+        with self._verrou_projection:
+            self._liberer()
+            self.memoire.close()
+            self.fichier.close()
+
+    def supprimer(self):
+        """Supprime les fichiers du segment (les projections en cours restent lisibles)."""
+        os.remove(self.chemin)
+        if os.path.exists(self.chemin_index):
+            os.remove(self.chemin_index)
+
+class JournalSegments:
+    """Historique des capteurs dans des journaux de segments, un répertoire par catégorie.
+
+    Chaque enregistrement a une largeur fixe: timestamp, indice du capteur (la
+    correspondance est conservée dans identifiants.txt) puis les champs de la
+    catégorie. Un segment est scellé lorsqu'il est plein ou qu'il couvre plus de
+    duree_segment secondes; la rétention supprime les segments entiers.
+
+    Les champs de chaque catégorie sont décrits dans champs.json: si la
+    configuration les change, les segments existants sont réécrits au nouveau
+    format (0 pour un champ ajouté) à l'ouverture.
+    """
+
+    def __init__(self, repertoire, champs_historique, taille_segment=64 * 1024 * 1024,
+                 duree_segment=3600, pas_index=1024, delai_ms=500):
+        self.repertoire = repertoire
+        self.champs_historique = champs_historique
+        self.taille_segment = taille_segment
+        self.duree_segment = duree_segment
+        self.pas_index = pas_index
+        self.delai = delai_ms / 1000
+        self.verrou = threading.Lock()
+
+        debut = time.perf_counter()
+        self.journaux = {categorie: self._ouvrir(categorie, champs) for categorie, champs in champs_historique.items()}
+        nombre = sum(segment.nombre for journal in self.journaux.values() for segment in journal["segments"])
+        logger.info(f"Journal de segments ouvert: {nombre} enregistrements en {time.perf_counter() - debut:.3f} s")
+
+        # Les pages modifiées sont écrites périodiquement sur disque
+        self.actif = True
+        self.thread_ecriture = threading.Thread(target=self._vider_en_continu)
+        self.thread_ecriture.daemon = True
+        self.thread_ecriture.start()
+
+    def _ouvrir(self, categorie, champs):
+        """Ouvre les segments existants d'une catégorie."""
+        repertoire = os.path.join(self.repertoire, categorie)
+        os.makedirs(repertoire, exist_ok=True)
+
+        chemin_identifiants = os.path.join(repertoire, "identifiants.txt")
+        noms = []
+        if os.path.exists(chemin_identifiants):
+            with open(chemin_identifiants, encoding="utf-8") as fichier:
+                noms = fichier.read().splitlines()
+
+        empreinte = empreinte_champs(champs)
+        format_enregistrement, type_numpy = formats_enregistrement(champs)
+        self._verifier_champs(repertoire, champs)
+        segments = [
+            Segment(os.path.join(repertoire, nom), format_enregistrement, type_numpy, self.pas_index, empreinte)
+            for nom in sorted(os.listdir(repertoire)) if nom.endswith(".seg")
+        ]
+        # Seul le dernier segment peut être encore ouvert en écriture
+        for segment in segments[:-1]:
+            if not segment.scelle:
+                segment.sceller()
+
+        return {
+            "format": format_enregistrement,
+            "type_numpy": type_numpy,
+            "empreinte": empreinte,
+            "conversions": [CODAGES[type_champ][2] for _, type_champ in champs],
+            "noms_champs": ["timestamp"] + [nom for nom, _ in champs],
+            "repertoire": repertoire,
+            "segments": segments,
+            "noms": noms,
+            "identifiants": {nom: indice for indice, nom in enumerate(noms)},
+            "fichier_identifiants": open(chemin_identifiants, "a", encoding="utf-8")
+        }
+
+    def _verifier_champs(self, repertoire, champs):
+        """Compare les champs décrits dans champs.json à ceux de la catégorie et migre les segments si besoin."""
+        chemin_champs = os.path.join(repertoire, "champs.json")
+        anciens = None
+        if os.path.exists(chemin_champs):
+            with open(chemin_champs, encoding="utf-8") as fichier:
+                anciens = [tuple(champ) for champ in json.load(fichier)]
+        # Une migration interrompue reprend depuis les segments d'origine
+        if anciens is not None and (anciens != list(champs) or os.path.isdir(os.path.join(repertoire, "migration"))):
+            self._migrer(repertoire, anciens, champs)
+        elif anciens is None and any(nom.endswith(".seg") for nom in os.listdir(repertoire)):
+            raise ValueError(f"{repertoire}: segments d'une version antérieure, sans champs.json décrivant "
+                             f"leurs champs; les déplacer ou les supprimer")
+
+        if anciens != list(champs):
+            with open(chemin_champs + ".tmp", "w", encoding="utf-8") as fichier:
+                json.dump(champs, fichier)
+            os.replace(chemin_champs + ".tmp", chemin_champs)
+
+    def _migrer(self, repertoire, anciens, champs):
+        """Réécrit les segments d'une catégorie au format de ses nouveaux champs.
+
+        Les segments d'origine sont d'abord déplacés dans migration/, supprimé à la fin.
+        """
+        migration = os.path.join(repertoire, "migration")
+        if not os.path.isdir(migration):
+            os.makedirs(migration)
+            for nom in os.listdir(repertoire):
+                if nom.endswith((".seg", ".idx")):
+                    os.replace(os.path.join(repertoire, nom), os.path.join(migration, nom))
+        else:
+            # Reprise: les segments déjà réécrits sont refaits
+            for nom in os.listdir(repertoire):
+                if nom.endswith((".seg", ".idx")):
+                    os.remove(os.path.join(repertoire, nom))
+
+        ancien_format, _ = formats_enregistrement(anciens)
+        nouveau_format, _ = formats_enregistrement(champs)
+        positions = {nom: indice + 2 for indice, (nom, _) in enumerate(anciens)}
+        # Position de chaque nouveau champ dans les anciens enregistrements (None: champ ajouté, valeur 0)
+        sources = [(positions.get(nom), CODAGES[type_champ][2]) for nom, type_champ in champs]
+
+        nombre = 0
+        for nom in sorted(os.listdir(migration)):
+            if not nom.endswith(".seg"):
+                continue
+            ancien = Segment(os.path.join(migration, nom), ancien_format, None, self.pas_index,
+                             empreinte_champs(anciens))
+            enregistrements = list(ancien.parcourir())
+            nouveau = Segment(os.path.join(repertoire, nom), nouveau_format, None, self.pas_index,
+                              empreinte_champs(champs),
+                              capacite_octets=max(self.taille_segment,
+                                                  TAILLE_EN_TETE + len(enregistrements) * nouveau_format.size))
+            for enregistrement in enregistrements:
+                valeurs = tuple(conversion(0 if position is None else enregistrement[position])
+                                for position, conversion in sources)
+                nouveau.ajouter(enregistrement[:2] + valeurs, enregistrement[0])
+            if ancien.scelle:
+                nouveau.sceller()
+            ancien.fermer()
+            nouveau.fermer()
+            nombre += len(enregistrements)
+
+        shutil.rmtree(migration)
+        logger.warning(f"Segments de {os.path.basename(repertoire)} migrés vers les champs "
+                       f"{', '.join(nom for nom, _ in champs)}: {nombre} enregistrements réécrits")
+
+    def _segment_actif(self, journal, timestamp):
+        """Retourne le segment où écrire, en scellant et créant un segment si nécessaire."""
+        segments = journal["segments"]
+        if segments and not segments[-1].scelle:
+            segment = segments[-1]
+            if not segment.plein() and (segment.nombre == 0 or timestamp - segment.t_min < self.duree_segment):
+                return segment
+            segment.sceller()
+
+        numero = segments[-1].numero + 1 if segments else 0
+        segment = Segment(os.path.join(journal["repertoire"], f"{numero:010d}.seg"),
+                          journal["format"], journal["type_numpy"], self.pas_index, journal["empreinte"],
+                          capacite_octets=self.taille_segment)
+        segments.append(segment)
+        return segment
+
+    def ajouter(self, categorie, capteur_id, point):
+        """Ajoute un point d'historique au journal de sa catégorie."""
+        journal = self.journaux[categorie]
+        timestamp = float(point["timestamp"])
+        valeurs = tuple(conversion(point[nom]) for conversion, nom in zip(journal["conversions"], journal["noms_champs"][1:]))
+
+        with self.verrou:
+            indice = journal["identifiants"].get(capteur_id)
+            if indice is None:
+                # L'identifiant est écrit avant tout enregistrement qui y fait référence
+                indice = len(journal["noms"])
+                journal["noms"].append(capteur_id)
+                journal["identifiants"][capteur_id] = indice
+                journal["fichier_identifiants"].write(capteur_id + "\n")
+                journal["fichier_identifiants"].flush()
+
+            self._segment_actif(journal, timestamp).ajouter((timestamp, indice) + valeurs, timestamp)
+
+    def _convertir(self, journal, enregistrements):
+        noms_champs = journal["noms_champs"]
+        return [dict(zip(noms_champs, (enregistrement[0],) + enregistrement[2:])) for enregistrement in enregistrements]
+
+    def lire(self, categorie, capteur_id, debut=None, fin=None):
+        """Retourne les points d'un capteur avec debut <= timestamp <= fin, triés par date."""
+        journal = self.journaux[categorie]
+        with self.verrou:
+            indice = journal["identifiants"].get(capteur_id)
+            segments = list(journal["segments"])
+        if indice is None:
+            return []
+
+        enregistrements = []
+        for segment in segments:
+            if (debut is not None and segment.t_max < debut) or (fin is not None and segment.t_min > fin):
+                continue
+            enregistrements.extend(segment.filtrer(indice, debut, fin))
+        enregistrements.sort(key=lambda e: e[0])
+        return self._convertir(journal, enregistrements)
+
+    def identifiants(self, categorie):
+        """Retourne les identifiants des capteurs connus du journal."""
+        with self.verrou:
+            return list(self.journaux[categorie]["noms"])
+
+    def purger(self, seuil, rappel=None):
+        """Supprime les segments scellés dont tous les points sont antérieurs à seuil.
+
+        Si rappel est fourni, il est appelé avec (categorie, capteur_id, points)
+        pour chaque capteur des segments supprimés.
+        """
+        for categorie, journal in self.journaux.items():
+            with self.verrou:
+                expires = [s for s in journal["segments"] if s.scelle and s.t_max < seuil]
+                journal["segments"] = [s for s in journal["segments"] if s not in expires]
+                noms = list(journal["noms"])
+
+            for segment in expires:
+                if rappel is not None:
+                    par_capteur = {}
+                    for enregistrement in segment.parcourir():
+                        par_capteur.setdefault(enregistrement[1], []).append(enregistrement)
+                    for indice, enregistrements in par_capteur.items():
+                        enregistrements.sort(key=lambda e: e[0])
+                        rappel(categorie, noms[indice], self._convertir(journal, enregistrements))
+                segment.supprimer()
+
+    def vider(self):
+        """Écrit sur disque les pages modifiées des segments actifs."""
+        with self.verrou:
+            segments = [journal["segments"][-1] for journal in self.journaux.values() if journal["segments"]]
+        for segment in segments:
+            segment.vider()
+
+    def _vider_en_continu(self):
+        while self.actif:
+            time.sleep(self.delai)
+            try:
+                self.vider()
+            except (OSError, ValueError) as e:
+                logger.error(f"Erreur lors de l'écriture du journal de segments: {e}")
+
+    def fermer(self):
+        """Écrit les pages modifiées et arrête le thread d'écriture."""
+        self.actif = False
+        self.thread_ecriture.join()
+        self.vider()
+        for journal in self.journaux.values():
+            journal["fichier_identifiants"].close()
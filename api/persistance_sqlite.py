@@ -0,0 +1,204 @@
+# Fichier: persistance_sqlite.py
+# Backend de persistance de l'historique dans une base SQLite en mode WAL
+
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger('api_rest')
+
+def type_sql(type_champ):
+    """Type de colonne SQLite d'un champ d'historique (les booléens sont stockés en entiers)."""
+    return "INTEGER" if type_champ == "BOOLEAN" else type_champ
+
+class StockageSQLite:
+    """Historique des capteurs persisté dans SQLite.
+
+    Une table par catégorie, indexée sur (capteur_id, timestamp). Les insertions
+    sont accumulées en mémoire et validées par un thread d'écriture toutes les
+    delai_ms millisecondes ou dès que taille_lot lignes sont en attente.
+
+    À l'ouverture d'une base existante, les colonnes de chaque table sont
+    comparées aux champs de la catégorie: un champ ajouté devient une colonne
+    (valeur 0 pour les points déjà enregistrés), un changement de type est refusé.
+    """
+
+    def __init__(self, chemin, champs_historique, delai_ms=500, taille_lot=1000):
+        self.chemin = chemin
+        self.champs_historique = champs_historique
+        self.delai = delai_ms / 1000
+        self.taille_lot = taille_lot
+
+        # Lignes en attente d'écriture, par catégorie
+        self.en_attente = {categorie: [] for categorie in champs_historique}
+        self.nombre_en_attente = 0
+        self.condition = threading.Condition()
+
+        # Une seule connexion écrit; chaque thread lecteur a la sienne
+        self.verrou_ecriture = threading.Lock()
+        self.connexion_ecriture = self._connecter()
+        self.connexions_lecture = threading.local()
+        self._creer_tables()
+
+        self.actif = True
+        self.thread_ecriture = threading.Thread(target=self._ecrire_en_continu)
+        self.thread_ecriture.daemon = True
+        self.thread_ecriture.start()
+
+    def _connecter(self):
+        """Ouvre une connexion configurée pour le mode WAL."""
+        connexion = sqlite3.connect(self.chemin, check_same_thread=False, timeout=30)
+        connexion.execute("PRAGMA journal_mode=WAL")
+        connexion.execute("PRAGMA synchronous=NORMAL")
+        return connexion
+
+    def _creer_tables(self):
+        """Crée les tables et index de chaque catégorie s'ils n'existent pas."""
+        with self.verrou_ecriture, self.connexion_ecriture:
+            for categorie, champs in self.champs_historique.items():
+                colonnes = ", ".join(f"{nom} {type_sql(type_champ)}" for nom, type_champ in champs)
+                self.connexion_ecriture.execute(
+                    f"CREATE TABLE IF NOT EXISTS historique_{categorie} "
+                    f"(capteur_id TEXT NOT NULL, timestamp REAL NOT NULL, {colonnes})"
+                )
+                self._migrer_table(categorie, champs)
+                self.connexion_ecriture.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{categorie}_capteur_temps "
+                    f"ON historique_{categorie} (capteur_id, timestamp)"
+                )
+                # Index utilisé par la purge des données expirées
+                self.connexion_ecriture.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{categorie}_temps ON historique_{categorie} (timestamp)"
+                )
+
+    def _migrer_table(self, categorie, champs):
+        """Adapte la table d'une base existante aux champs de la catégorie (verrou d'écriture acquis)."""
+        existantes = {ligne[1]: ligne[2].upper() for ligne in
+                      self.connexion_ecriture.execute(f"PRAGMA table_info(historique_{categorie})")}
+        for nom, type_champ in champs:
+            if nom not in existantes:
+                self.connexion_ecriture.execute(
+                    f"ALTER TABLE historique_{categorie} ADD COLUMN {nom} {type_sql(type_champ)} NOT NULL DEFAULT 0"
+                )
+                logger.warning(f"Historique SQLite: colonne {nom} ajoutée à historique_{categorie} "
+                               f"(0 pour les points existants)")
+            elif existantes[nom] != type_sql(type_champ):
+                raise ValueError(f"{self.chemin}: la colonne {nom} de historique_{categorie} est de type "
+                                 f"{existantes[nom]} au lieu de {type_sql(type_champ)}; migrer ou déplacer la base")
+        retirees = set(existantes) - {"capteur_id", "timestamp"} - {nom for nom, _ in champs}
+        if retirees:
+            logger.warning(f"Historique SQLite: colonnes {', '.join(sorted(retirees))} de historique_{categorie} "
+                           f"ignorées (champs retirés)")
+
+    def ajouter(self, categorie, capteur_id, point):
+        """Met en attente l'écriture d'un point d'historique."""
+        ligne = (capteur_id, point["timestamp"]) + tuple(point[nom] for nom, _ in self.champs_historique[categorie])
+        with self.condition:
+            self.en_attente[categorie].append(ligne)
+            self.nombre_en_attente += 1
+            if self.nombre_en_attente >= self.taille_lot:
+                self.condition.notify()
+
+    def vider(self):
+        """Écrit immédiatement toutes les lignes en attente."""
+        with self.condition:
+            lots = self.en_attente
+            self.en_attente = {categorie: [] for categorie in self.champs_historique}
+            self.nombre_en_attente = 0
+
+        with self.verrou_ecriture, self.connexion_ecriture:
+            for categorie, lignes in lots.items():
+                if not lignes:
+                    continue
+                # Colonnes nommées: une table migrée peut avoir un ordre de colonnes différent
+                colonnes = ["capteur_id", "timestamp"] + [nom for nom, _ in self.champs_historique[categorie]]
+                self.connexion_ecriture.executemany(
+                    f"INSERT INTO historique_{categorie} ({', '.join(colonnes)}) "
+                    f"VALUES ({', '.join('?' * len(colonnes))})", lignes
+                )
+
+    def _ecrire_en_continu(self):
+        """Boucle du thread d'écriture (write-behind)."""
+        while self.actif:
+            with self.condition:
+                if self.nombre_en_attente < self.taille_lot:
+                    self.condition.wait(self.delai)
+            try:
+                self.vider()
+            except sqlite3.Error as e:
+                logger.error(f"Erreur lors de l'écriture de l'historique SQLite: {e}")
+                time.sleep(self.delai)
+
+    def _connexion_lecture(self):
+        """Retourne la connexion de lecture du thread courant."""
+        connexion = getattr(self.connexions_lecture, "connexion", None)
+        if connexion is None:
+            connexion = self._connecter()
+            self.connexions_lecture.connexion = connexion
+        return connexion
+
+    def _convertir(self, categorie, lignes):
+        """Convertit des lignes (timestamp, champs...) en points d'historique."""
+        champs = self.champs_historique[categorie]
+        noms = ["timestamp"] + [nom for nom, _ in champs]
+        booleens = [nom for nom, type_champ in champs if type_champ == "BOOLEAN"]
+        points = [dict(zip(noms, ligne)) for ligne in lignes]
+        for point in points:
+            for nom in booleens:
+                point[nom] = bool(point[nom])
+        return points
+
+    def lire(self, categorie, capteur_id, debut=None, fin=None):
+        """Retourne les points d'un capteur avec debut <= timestamp <= fin, triés par date."""
+        colonnes = ", ".join(["timestamp"] + [nom for nom, _ in self.champs_historique[categorie]])
+        requete = f"SELECT {colonnes} FROM historique_{categorie} WHERE capteur_id = ?"
+        parametres = [capteur_id]
+        if debut is not None:
+            requete += " AND timestamp >= ?"
+            parametres.append(debut)
+        if fin is not None:
+            requete += " AND timestamp <= ?"
+            parametres.append(fin)
+        requete += " ORDER BY timestamp"
+
+        lignes = self._connexion_lecture().execute(requete, parametres).fetchall()
+        return self._convertir(categorie, lignes)
+
+    def identifiants(self, categorie):
+        """Retourne les identifiants des capteurs ayant des points en base."""
+        curseur = self._connexion_lecture().execute(f"SELECT DISTINCT capteur_id FROM historique_{categorie}")
+        return [ligne[0] for ligne in curseur]
+
+    def purger(self, seuil, rappel=None):
+        """Supprime les points antérieurs à seuil.
+
+        Si rappel est fourni, il est appelé avec (categorie, capteur_id, points)
+        pour chaque capteur avant suppression de ses points.
+        """
+        with self.verrou_ecriture, self.connexion_ecriture:
+            for categorie, champs in self.champs_historique.items():
+                if rappel is not None:
+                    colonnes = ", ".join(["capteur_id", "timestamp"] + [nom for nom, _ in champs])
+                    curseur = self.connexion_ecriture.execute(
+                        f"SELECT {colonnes} FROM historique_{categorie} WHERE timestamp < ? "
+                        f"ORDER BY capteur_id, timestamp", (seuil,)
+                    )
+                    par_capteur = {}
+                    for ligne in curseur:
+                        par_capteur.setdefault(ligne[0], []).append(ligne[1:])
+                    for capteur_id, lignes in par_capteur.items():
+                        rappel(categorie, capteur_id, self._convertir(categorie, lignes))
+
+                self.connexion_ecriture.execute(
+                    f"DELETE FROM historique_{categorie} WHERE timestamp < ?", (seuil,)
+                )
+
+    def fermer(self):
+        """Écrit les lignes en attente et ferme la base."""
+        self.actif = False
+        with self.condition:
+            self.condition.notify()
+        self.thread_ecriture.join()
+        self.vider()
+        self.connexion_ecriture.close()
@@ -0,0 +1,177 @@
+# Fichier: profilage.py
+# Profilage à la demande de l'API en fonctionnement: échantillonnage des piles et cProfile
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+MODES = ("echantillonnage", "cprofile")
+
+# Les threads anonymes se nomment "Thread-N (fonction)": seule la fonction est gardée
+MOTIF_THREAD_ANONYME = re.compile(r"^Thread-\d+ \((.*)\)$")
+
+def nom_thread(thread):
+    """Retourne un nom de thread stable entre exécutions (ex: process_request_thread, nettoyage)."""
+    if thread is None:
+        return "inconnu"
+    correspondance = MOTIF_THREAD_ANONYME.match(thread.name)
+    return correspondance.group(1) if correspondance else thread.name
+
+def nom_cadre(code):
+    """Nom d'un cadre de pile dans les piles repliées: fonction (fichier:ligne)."""
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SessionProfilage:
+    """Session de profilage de duree secondes, arrêtée automatiquement.
+
+    - "echantillonnage": un thread relève la pile de tous les autres threads
+      toutes les intervalle secondes (sys._current_frames) et compte les piles
+      repliées, au format attendu par flamegraph.pl et speedscope;
+    - "cprofile": les points d'entrée instrumentés (requêtes HTTP, messages
+      MQTT, nettoyage) s'exécutent sous un cProfile propre à leur thread;
+      les profils sont fusionnés à la fin de la session. Depuis Python 3.12,
+      un seul profileur peut être actif à la fois dans le processus: un point
+      d'entrée qui démarre pendant qu'un autre thread est profilé s'exécute
+      sans profil et son thread est compté comme non profilé.
+    """
+
+    def __init__(self, mode, duree, intervalle=0.01):
+        if mode not in MODES:
+            raise ValueError(f"Mode de profilage inconnu: {mode}")
+        self.mode = mode
+        self.duree = duree
+        self.intervalle = intervalle
+        self.debut = time.time()
+        self.fin = None
+        self.arret = threading.Event()
+
+        self.piles = {}
+        self.echantillons = 0
+        self._local = threading.local()
+        self._profils = []
+        self._non_profiles = set()
+        self._verrou = threading.Lock()
+
+        if mode == "echantillonnage":
+            self._thread = threading.Thread(target=self._echantillonner, name="profilage", daemon=True)
+        else:
+            self._thread = threading.Thread(target=self._attendre, name="profilage", daemon=True)
+        self._thread.start()
+
+    @property
+    def en_cours(self):
+        return self.fin is None
+
+    def arreter(self):
+        """Arrête la session avant son terme et attend la fin de la collecte."""
+        self.arret.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def _attendre(self):
+        self.arret.wait(self.duree)
+        self.fin = time.time()
+
+    def _echantillonner(self):
+        propre = threading.get_ident()
+        limite = time.monotonic() + self.duree
+        while not self.arret.is_set() and time.monotonic() < limite:
+            threads = {thread.ident: thread for thread in threading.enumerate()}
+            for ident, cadre in sys._current_frames().items():
+                if ident == propre:
+                    continue
+                pile = []
+                while cadre is not None:
+                    pile.append(nom_cadre(cadre.f_code))
+                    cadre = cadre.f_back
+                pile.append(nom_thread(threads.get(ident)))
+                cle = ";".join(reversed(pile))
+                self.piles[cle] = self.piles.get(cle, 0) + 1
+            self.echantillons += 1
+            self.arret.wait(self.intervalle)
+        self.fin = time.time()
+
+    def activer(self):
+        """Active le cProfile du thread courant. Retourne False s'il n'y a rien à désactiver ensuite."""
+        # Session terminée, ou appel réentrant dont le profil est déjà actif
+        if self.mode != "cprofile" or self.fin is not None or getattr(self._local, "actif", False):
+            return False
+        profil = getattr(self._local, "profil", None)
+        nouveau = profil is None
+        if nouveau:
+            profil = self._local.profil = cProfile.Profile()
+        try:
+            profil.enable()
+        except ValueError:
+            # Python 3.12+: le profileur d'un autre thread est déjà actif
+            with self._verrou:
+                self._non_profiles.add(nom_thread(threading.current_thread()))
+            return False
+        if nouveau:
+            with self._verrou:
+                self._profils.append(profil)
+        self._local.actif = True
+        return True
+
+    def desactiver(self):
+        """Désactive le cProfile du thread courant."""
+        self._local.profil.disable()
+        self._local.actif = False
+
+    def executer(self, fonction, *arguments):
+        """Exécute fonction sous le cProfile du thread courant (tant que la session est en cours)."""
+        if not self.activer():
+            return fonction(*arguments)
+        try:
+            return fonction(*arguments)
+        finally:
+            self.desactiver()
+
+    def etat(self):
+        """Résumé de la session."""
+        return {
+            "mode": self.mode,
+            "duree": self.duree,
+            "debut": self.debut,
+            "fin": self.fin,
+            "en_cours": self.en_cours,
+            "echantillons": self.echantillons if self.mode == "echantillonnage" else None,
+            "threads_profiles": len(self._profils) if self.mode == "cprofile" else None,
+            "threads_non_profiles": sorted(self._non_profiles) if self.mode == "cprofile" else None
+        }
+
+    def piles_repliees(self):
+        """Piles repliées ("thread;cadre;...;cadre nombre"), une par ligne, les plus fréquentes d'abord."""
+        return "".join(f"{pile} {nombre}\n"
+                       for pile, nombre in sorted(self.piles.items(), key=lambda item: item[1], reverse=True))
+
+    def _statistiques(self):
+        with self._verrou:
+            profils = [profil for profil in self._profils if profil.getstats()]
+        if not profils:
+            return None
+        statistiques = pstats.Stats(profils[0])
+        for profil in profils[1:]:
+            statistiques.add(profil)
+        return statistiques
+
+    def rapport_cprofile(self, tri="cumulative", limite=50):
+        """Rapport texte pstats des fonctions les plus coûteuses, tous threads confondus."""
+        statistiques = self._statistiques()
+        if statistiques is None:
+            return "Aucun appel profilé pendant la session\n"
+        sortie = io.StringIO()
+        statistiques.stream = sortie
+        statistiques.sort_stats(tri).print_stats(limite)
+        return sortie.getvalue()
+
+    def donnees_cprofile(self):
+        """Profil fusionné au format binaire de pstats (lisible par pstats.Stats ou snakeviz)."""
+        statistiques = self._statistiques()
+        return marshal.dumps(statistiques.stats if statistiques is not None else {})
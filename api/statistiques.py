@@ -0,0 +1,173 @@
+# Fichier: statistiques.py
+# Quantiles approchés de l'historique des capteurs, en mémoire bornée (sketches KLL)
+
+import math
+import random
+
+class SketchKLL:
+    """Sketch de quantiles KLL fusionnable, de taille bornée par k.
+
+    Les valeurs sont ajoutées au niveau 0. Lorsqu'un niveau dépasse sa capacité,
+    il est trié et un élément sur deux (pair ou impair au hasard) est promu au
+    niveau supérieur, où il compte double. L'erreur de rang est de l'ordre de 1/k.
+    """
+
+    FACTEUR = 2 / 3
+
+    def __init__(self, k=64):
+        self.k = k
+        self.niveaux = [[]]
+        self.nombre = 0
+        self.somme = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def _capacite(self, niveau):
+        # Les niveaux supérieurs (poids forts) ont la plus grande capacité
+        profondeur = len(self.niveaux) - 1 - niveau
+        return max(2, int(math.ceil(self.k * self.FACTEUR ** profondeur)))
+
+    def _compacter(self):
+        for niveau, elements in enumerate(self.niveaux):
+            if len(elements) <= self._capacite(niveau):
+                continue
+            if niveau + 1 == len(self.niveaux):
+                self.niveaux.append([])
+            elements.sort()
+            # Un élément est laissé au niveau courant si leur nombre est impair
+            reste = [elements.pop()] if len(elements) % 2 else []
+            self.niveaux[niveau + 1].extend(elements[random.getrandbits(1)::2])
+            self.niveaux[niveau] = reste
+            return True
+        return False
+
+    def _depasse(self):
+        return sum(len(elements) for elements in self.niveaux) > sum(
+            self._capacite(niveau) for niveau in range(len(self.niveaux)))
+
+    def ajouter(self, valeur):
+        """Ajoute une valeur au sketch."""
+        self.niveaux[0].append(valeur)
+        self.nombre += 1
+        self.somme += valeur
+        self.minimum = min(self.minimum, valeur)
+        self.maximum = max(self.maximum, valeur)
+        # Compactage paresseux: seulement lorsque la capacité totale est dépassée
+        if len(self.niveaux[0]) > self._capacite(0):
+            while self._depasse() and self._compacter():
+                pass
+
+    def fusionner(self, autre):
+        """Ajoute à ce sketch les valeurs résumées par un autre sketch."""
+        while len(self.niveaux) < len(autre.niveaux):
+            self.niveaux.append([])
+        for niveau, elements in enumerate(autre.niveaux):
+            self.niveaux[niveau].extend(elements)
+        self.nombre += autre.nombre
+        self.somme += autre.somme
+        self.minimum = min(self.minimum, autre.minimum)
+        self.maximum = max(self.maximum, autre.maximum)
+        while self._depasse() and self._compacter():
+            pass
+
+    def copie(self):
+        """Retourne une copie indépendante du sketch."""
+        copie = SketchKLL(self.k)
+        copie.niveaux = [list(elements) for elements in self.niveaux]
+        copie.nombre, copie.somme = self.nombre, self.somme
+        copie.minimum, copie.maximum = self.minimum, self.maximum
+        return copie
+
+    def quantiles(self, rangs):
+        """Retourne les valeurs approchées des quantiles demandés (rangs entre 0 et 1)."""
+        ponderes = sorted(
+            (valeur, 1 << niveau) for niveau, elements in enumerate(self.niveaux) for valeur in elements
+        )
+        if not ponderes:
+            return [None for _ in rangs]
+        total = sum(poids for _, poids in ponderes)
+
+        resultats = []
+        for rang in rangs:
+            cible = rang * total
+            cumul = 0
+            for valeur, poids in ponderes:
+                cumul += poids
+                if cumul >= cible:
+                    break
+            resultats.append(valeur)
+        return resultats
+
+class StatistiquesCapteurs:
+    """Sketches par capteur, par champ et par intervalle de temps de pas secondes.
+
+    Seuls les nombre_intervalles derniers intervalles d'un capteur sont conservés,
+    ce qui borne la mémoire par capteur quel que soit le débit de ses messages.
+    """
+
+    RANGS = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+    def __init__(self, champs_numeriques, pas=3600, nombre_intervalles=24, k=64):
+        self.champs_numeriques = champs_numeriques
+        self.pas = pas
+        self.nombre_intervalles = nombre_intervalles
+        self.k = k
+        # {categorie: {capteur_id: {intervalle: {champ: SketchKLL}}}}
+        self.sketches = {categorie: {} for categorie in champs_numeriques}
+
+    def ajouter(self, categorie, capteur_id, point):
+        """Ajoute un point d'historique aux sketches de son capteur."""
+        intervalles = self.sketches[categorie].setdefault(capteur_id, {})
+        intervalle = int(point["timestamp"] // self.pas)
+        sketches = intervalles.get(intervalle)
+        if sketches is None:
+            sketches = intervalles[intervalle] = {champ: SketchKLL(self.k) for champ in self.champs_numeriques[categorie]}
+            # Oublier les intervalles sortis de la fenêtre conservée
+            for ancien in [i for i in intervalles if i <= intervalle - self.nombre_intervalles]:
+                del intervalles[ancien]
+        for champ, sketch in sketches.items():
+            valeur = point.get(champ)
+            if valeur is not None:
+                sketch.ajouter(valeur)
+
+    def purger(self, seuil):
+        """Supprime les intervalles entièrement antérieurs à seuil."""
+        dernier_expire = int(seuil // self.pas) - 1
+        for capteurs in self.sketches.values():
+            for capteur_id in list(capteurs):
+                intervalles = capteurs[capteur_id]
+                for intervalle in [i for i in intervalles if i <= dernier_expire]:
+                    del intervalles[intervalle]
+                if not intervalles:
+                    del capteurs[capteur_id]
+
+    def copier_sketches(self, categorie, capteurs, champs, debut):
+        """Retourne, par champ, des copies des sketches des intervalles postérieurs à debut.
+
+        La copie est rapide (sans tri ni compactage): elle se fait sous le verrou
+        des données, la fusion coûteuse (resumer) en dehors.
+        """
+        premier = int(debut // self.pas)
+        selection = {champ: [] for champ in champs}
+        for capteur_id in capteurs:
+            for intervalle, sketches in self.sketches[categorie].get(capteur_id, {}).items():
+                if intervalle >= premier:
+                    for champ in champs:
+                        selection[champ].append(sketches[champ].copie())
+        return selection
+
+    def resumer(self, sketches):
+        """Fusionne des sketches et retourne le résumé (nombre, moyenne, min, max, quantiles)."""
+        fusion = SketchKLL(self.k)
+        for sketch in sketches:
+            fusion.fusionner(sketch)
+        if fusion.nombre == 0:
+            return {"nombre": 0}
+        resume = {
+            "nombre": fusion.nombre,
+            "moyenne": fusion.somme / fusion.nombre,
+            "min": fusion.minimum,
+            "max": fusion.maximum
+        }
+        resume.update(zip(self.RANGS, fusion.quantiles(list(self.RANGS.values()))))
+        return resume
@@ -0,0 +1,39 @@
+# Fichier: test_fraicheur.py
+# Tests du suivi de fraîcheur des capteurs (python -m unittest, depuis le dossier api)
+
+import unittest
+
+from fraicheur import SuiviFraicheur
+
+class TestSuiviFraicheur(unittest.TestCase):
+
+    def test_capteur_retabli_pendant_reconstruction_garde_son_echeance(self):
+        suivi = SuiviFraicheur({"parking": 10}, tolerance=1)
+        suivi.recevoir("parking", "A", 0)
+        suivi.recevoir("parking", "B", 0)
+        self.assertEqual(sorted(c for _, c, _ in suivi.expirer(10)), ["A", "B"])
+
+        # B publie assez souvent pour que le tas soit reconstruit à la réception de A
+        instant = 10
+        while len(suivi.echeances) + 1 <= 4 * len(suivi.receptions) + 64:
+            instant += 0.001
+            suivi.recevoir("parking", "B", instant)
+        self.assertTrue(suivi.recevoir("parking", "A", instant))
+        self.assertLess(len(suivi.echeances), 4 * len(suivi.receptions) + 64)
+
+        self.assertEqual(sorted(c for _, c, _ in suivi.expirer(instant + 10)), ["A", "B"])
+
+    def test_compter_suit_receptions_et_perimes(self):
+        suivi = SuiviFraicheur({"parking": 10, "meteo": 60}, tolerance=1)
+        suivi.recevoir("parking", "A", 0)
+        suivi.recevoir("parking", "B", 0)
+        suivi.recevoir("meteo", "M", 0)
+        suivi.expirer(10)
+        self.assertEqual(suivi.compter(), {"parking": {"total": 2, "perimes": 2}, "meteo": {"total": 1, "perimes": 0}})
+
+        suivi.recevoir("parking", "A", 11)
+        suivi.recevoir("parking", "A", 12)
+        self.assertEqual(suivi.compter()["parking"], {"total": 2, "perimes": 1})
+
+if __name__ == "__main__":
+    unittest.main()
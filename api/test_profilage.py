@@ -0,0 +1,89 @@
+# Fichier: test_profilage.py
+# Tests du profilage cProfile avec plusieurs threads (python -m unittest, depuis le dossier api)
+
+import cProfile
+import threading
+import unittest
+from unittest import mock
+
+import profilage
+from profilage import SessionProfilage
+
+class ProfilUnique(cProfile.Profile):
+    """cProfile.Profile limité à un profileur actif par processus, comme depuis Python 3.12."""
+
+    verrou = threading.Lock()
+    actif = None
+
+    def enable(self, *arguments, **options):
+        with ProfilUnique.verrou:
+            if ProfilUnique.actif is not None and ProfilUnique.actif is not self:
+                raise ValueError("Another profiling tool is already active")
+            ProfilUnique.actif = self
+        super().enable(*arguments, **options)
+
+    def disable(self):
+        super().disable()
+        with ProfilUnique.verrou:
+            if ProfilUnique.actif is self:
+                ProfilUnique.actif = None
+
+class TestExecuterConcurrent(unittest.TestCase):
+
+    def executer_deux_threads(self, session):
+        """Fait entrer deux threads dans session.executer en même temps. Retourne résultats et erreurs."""
+        premier_entre, second_termine = threading.Event(), threading.Event()
+        resultats, erreurs = {}, []
+
+        def premier():
+            premier_entre.set()
+            second_termine.wait(5)
+            return "premier"
+
+        def lancer(nom, fonction):
+            try:
+                resultats[nom] = session.executer(fonction)
+            except Exception as exception:
+                erreurs.append(exception)
+            finally:
+                if nom == "second":
+                    second_termine.set()
+
+        thread_premier = threading.Thread(target=lancer, args=("premier", premier))
+        thread_premier.start()
+        self.assertTrue(premier_entre.wait(5))
+        thread_second = threading.Thread(target=lancer, args=("second", lambda: sum(range(100))))
+        thread_second.start()
+        thread_second.join(5)
+        thread_premier.join(5)
+        return resultats, erreurs
+
+    def test_second_thread_sans_profil_si_profileur_unique(self):
+        with mock.patch.object(profilage.cProfile, "Profile", ProfilUnique):
+            session = SessionProfilage("cprofile", 30)
+            try:
+                resultats, erreurs = self.executer_deux_threads(session)
+            finally:
+                session.arreter()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(resultats, {"premier": "premier", "second": 4950})
+        etat = session.etat()
+        self.assertEqual(etat["threads_profiles"], 1)
+        self.assertEqual(len(etat["threads_non_profiles"]), 1)
+        self.assertIn("premier", session.rapport_cprofile())
+
+    def test_deux_threads_profiles(self):
+        session = SessionProfilage("cprofile", 30)
+        try:
+            resultats, erreurs = self.executer_deux_threads(session)
+        finally:
+            session.arreter()
+
+        self.assertEqual(erreurs, [])
+        self.assertEqual(resultats, {"premier": "premier", "second": 4950})
+        etat = session.etat()
+        self.assertEqual(etat["threads_profiles"] + len(etat["threads_non_profiles"]), 2)
+
+if __name__ == "__main__":
+    unittest.main()
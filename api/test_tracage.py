@@ -0,0 +1,44 @@
+# Fichier: test_tracage.py
+# Tests du suivi des numéros de séquence (python -m unittest, depuis le dossier api)
+
+import unittest
+
+from tracage import SuiviSequences
+
+class TestSuiviSequences(unittest.TestCase):
+
+    def observer(self, suivi, *sequences):
+        return [suivi.observer("parking", "A", seq) for seq in sequences]
+
+    def test_message_en_retard_compte_en_desordre(self):
+        suivi = SuiviSequences()
+        self.assertEqual(self.observer(suivi, 1, 2, 5, 3, 6),
+                         [None, None, ("perte", 2), ("desordre", 1), None])
+        compteurs = suivi.resumer("parking")["A"]
+        self.assertEqual((compteurs["perdus"], compteurs["desordres"], compteurs["redemarrages"]), (1, 1, 0))
+        self.assertEqual(compteurs["dernier_seq"], 6)
+
+    def test_redelivrance_d_un_ancien_message_compte_en_doublon(self):
+        suivi = SuiviSequences()
+        self.assertEqual(self.observer(suivi, 1, 2, 3, 2, 3, 4),
+                         [None, None, None, ("doublon", 1), ("doublon", 1), None])
+        # Un message arrivé en désordre puis redélivré est un doublon
+        self.assertEqual(self.observer(suivi, 7, 5, 5), [("perte", 2), ("desordre", 1), ("doublon", 1)])
+        compteurs = suivi.resumer("parking")["A"]
+        self.assertEqual((compteurs["doublons"], compteurs["perdus"], compteurs["redemarrages"]), (3, 1, 0))
+
+    def test_redemarrage(self):
+        suivi = SuiviSequences(fenetre=10)
+        # Retour à 1, puis recul au-delà de la fenêtre de désordre
+        self.assertEqual(self.observer(suivi, 1, 2, 3, 1, 2), [None, None, None, ("redemarrage", 1), None])
+        self.assertEqual(self.observer(suivi, 50, 30), [("perte", 47), ("redemarrage", 1)])
+        self.assertEqual(suivi.totaux()["parking"]["redemarrages"], 2)
+
+    def test_numeros_manquants_bornes_a_la_fenetre(self):
+        suivi = SuiviSequences(fenetre=10)
+        self.observer(suivi, 1, 100, 200)
+        self.assertEqual(suivi.capteurs["parking"]["A"][6], set(range(191, 200)))
+        self.assertEqual(self.observer(suivi, 195, 150), [("desordre", 1), ("redemarrage", 1)])
+
+if __name__ == "__main__":
+    unittest.main()
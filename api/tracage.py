@@ -0,0 +1,88 @@
+# Fichier: tracage.py
+# Suivi des numéros de séquence des capteurs: messages perdus, dupliqués, en désordre et redémarrages des simulateurs
+
+# Retard maximal (en numéros) d'un message arrivé en désordre; au-delà, un recul est un redémarrage
+FENETRE_DESORDRE = 1000
+
+class SuiviSequences:
+    """Compteurs de séquence par capteur.
+
+    Les simulateurs numérotent les lectures de chaque capteur à partir de 1.
+    Comparé au dernier numéro reçu, un nouveau numéro est:
+    - le suivant: cas normal;
+    - plus grand: les numéros intermédiaires sont comptés perdus;
+    - égal, ou plus petit et déjà reçu: doublon (message redélivré);
+    - plus petit et manquant: arrivée en désordre (redélivrance QoS 1, rejeu
+      d'un tampon), décomptée des pertes;
+    - revenu à 1, ou plus petit de plus de FENETRE_DESORDRE: le simulateur a
+      redémarré et sa numérotation repart de zéro.
+
+    Les numéros manquants ne sont retenus que sur les FENETRE_DESORDRE derniers.
+    """
+
+    def __init__(self, fenetre=FENETRE_DESORDRE):
+        self.fenetre = fenetre
+        # {categorie: {capteur_id: [dernier, recus, perdus, doublons, redemarrages, desordres, manquants]}}
+        self.capteurs = {}
+
+    def observer(self, categorie, capteur_id, seq):
+        """Enregistre un numéro de séquence.
+
+        Retourne ("perte", n), ("doublon", 1), ("desordre", 1), ("redemarrage", 1) ou None.
+        """
+        capteurs = self.capteurs.setdefault(categorie, {})
+        compteurs = capteurs.get(capteur_id)
+        if compteurs is None:
+            capteurs[capteur_id] = [seq, 1, 0, 0, 0, 0, set()]
+            return None
+
+        compteurs[1] += 1
+        dernier, manquants = compteurs[0], compteurs[6]
+        ecart = seq - dernier
+        if ecart == 1:
+            compteurs[0] = seq
+            return None
+        if ecart > 1:
+            compteurs[0] = seq
+            compteurs[2] += ecart - 1
+            limite = seq - self.fenetre
+            if manquants and min(manquants) <= limite:
+                manquants.intersection_update(range(limite + 1, seq))
+            manquants.update(range(max(dernier + 1, limite + 1), seq))
+            return ("perte", ecart - 1)
+        if ecart == 0:
+            compteurs[3] += 1
+            return ("doublon", 1)
+        if seq <= 1 or -ecart > self.fenetre:
+            compteurs[0] = seq
+            compteurs[4] += 1
+            manquants.clear()
+            return ("redemarrage", 1)
+        if seq in manquants:
+            manquants.discard(seq)
+            compteurs[2] -= 1
+            compteurs[5] += 1
+            return ("desordre", 1)
+        compteurs[3] += 1
+        return ("doublon", 1)
+
+    def resumer(self, categorie):
+        """Retourne les compteurs de chaque capteur d'une catégorie."""
+        return {
+            capteur_id: {"dernier_seq": dernier, "recus": recus, "perdus": perdus, "doublons": doublons,
+                         "redemarrages": redemarrages, "desordres": desordres}
+            for capteur_id, (dernier, recus, perdus, doublons, redemarrages, desordres, _)
+            in self.capteurs.get(categorie, {}).items()
+        }
+
+    def totaux(self):
+        """Retourne les compteurs cumulés par catégorie."""
+        totaux = {}
+        for categorie, capteurs in self.capteurs.items():
+            somme = [0, 0, 0, 0, 0]
+            for compteurs in capteurs.values():
+                for indice in range(5):
+                    somme[indice] += compteurs[indice + 1]
+            totaux[categorie] = {"capteurs": len(capteurs), "recus": somme[0], "perdus": somme[1],
+                                 "doublons": somme[2], "redemarrages": somme[3], "desordres": somme[4]}
+        return totaux
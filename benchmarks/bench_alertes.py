@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark du moteur d'alertes de l'API: débit d'évaluation des règles et des
+détecteurs EWMA seuls, puis du traitement complet d'un message (décodage JSON,
+enregistrement, événements Socket.IO et alertes), comparé à l'objectif de
+10 000 messages/s.
+
+    python3 benchmarks/bench_alertes.py [--messages 100000] [--capteurs 1000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# L'API est importée depuis le répertoire api (avec sa propre configuration)
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE_PROJET, "api"))
+
+import app
+from config import REGLES_ALERTES, DETECTEURS_EWMA
+from alertes import MoteurAlertes
+
+OBJECTIF = 10000  # messages/s
+
+def generer_messages(nombre, nombre_capteurs):
+    """Génère un mélange de messages parking, WiFi, météo et bâtiments: [(topic, categorie, id, payload)]."""
+    debut = time.time()
+    messages = []
+    for i in range(nombre):
+        capteur = f"c{random.randrange(nombre_capteurs)}"
+        timestamp = debut + i * 0.01
+        type_message = i % 4
+        if type_message == 0:
+            messages.append(("iot/parking/" + capteur, "parking", capteur, {
+                "places_disponibles": random.randint(0, 200), "capacite_totale": 200, "timestamp": timestamp}))
+        elif type_message == 1:
+            utilisateurs = random.randint(0, 50)
+            messages.append(("iot/wifi/etat/" + capteur, "wifi", capteur, {
+                "est_en_ligne": random.random() > 0.02, "puissance_signal": -60, "utilisateurs_connectes": utilisateurs,
+                "niveau_congestion": min(100, utilisateurs * 2), "timestamp": timestamp}))
+        elif type_message == 2:
+            messages.append(("iot/meteo/conditions/" + capteur, "meteo", capteur, {
+                "temperature": random.gauss(18, 3), "humidite": random.randint(30, 90), "timestamp": timestamp}))
+        else:
+            messages.append(("iot/batiments/" + capteur, "batiments", capteur, {
+                "salles": [{"nom": f"S{s}", "capacite": 30, "occupation_actuelle": random.randint(0, 32)}
+                           for s in range(5)],
+                "timestamp": timestamp}))
+    return messages
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark du moteur d'alertes de l'API (règles, détecteurs EWMA et traitement complet)")
+    parser.add_argument("--messages", type=int, default=100000, help="Nombre de messages évalués")
+    parser.add_argument("--capteurs", type=int, default=1000, help="Nombre de capteurs par catégorie")
+    arguments = parser.parse_args()
+
+    random.seed(1)
+    messages = generer_messages(arguments.messages, arguments.capteurs)
+    print(f"{len(messages):,} messages, {len(REGLES_ALERTES)} règles, "
+          f"{sum(len(champs) for champs in DETECTEURS_EWMA.values())} champs surveillés")
+
+    # Évaluation seule
+    moteur = MoteurAlertes(REGLES_ALERTES, DETECTEURS_EWMA)
+    debut = time.perf_counter()
+    for _, categorie, capteur_id, payload in messages:
+        moteur.evaluer(categorie, capteur_id, payload)
+    duree = time.perf_counter() - debut
+    print(f"{'moteur seul':<28}{len(messages) / duree:>12,.0f} msg/s  "
+          f"{duree / len(messages) * 1e6:>6.1f} µs/msg  {moteur.nombre_alertes} alertes")
+
+    # Traitement complet d'un message par l'API
+    contenus = [(topic, json.dumps(payload).encode()) for topic, _, _, payload in messages]
+    debut = time.perf_counter()
+    for topic, contenu in contenus:
+        app.traiter_message(topic, contenu)
+    duree = time.perf_counter() - debut
+    debit = len(contenus) / duree
+    print(f"{'traitement complet':<28}{debit:>12,.0f} msg/s  {duree / len(contenus) * 1e6:>6.1f} µs/msg  "
+          f"({'objectif atteint' if debit >= OBJECTIF else 'sous l’objectif'} de {OBJECTIF:,} msg/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Banc de charge bout en bout de l'ingestion: un broker MQTT local (benchmarks/broker_mqtt.py),
+l'API réelle (api/app.py, dans un processus séparé) et N capteurs synthétiques publiant
+des lectures réalistes (générées par les simulateurs) au débit demandé.
+
+Après une phase d'échauffement, le débit soutenu, les percentiles de latence
+publication -> réception relevés par l'API (/metrics), les messages perdus
+(publiés mais jamais traités, et trous de séquence de /api/tracage) ainsi que le
+CPU et la mémoire (RSS) de l'API et du broker sont mesurés et affichés; --sortie
+les enregistre en JSON avec les caractéristiques de l'environnement.
+
+    python3 benchmarks/bench_bout_en_bout.py [--capteurs 600] [--debit 2000] [--duree 20] [--processus 1]
+    python3 benchmarks/bench_bout_en_bout.py --broker localhost:1883     # broker existant (ex: Mosquitto)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import paho.mqtt.client as mqtt_client
+
+from environnement import decrire_environnement
+
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_BROKER = os.path.join(RACINE_PROJET, "benchmarks", "broker_mqtt.py")
+SCRIPT_API = os.path.join(RACINE_PROJET, "api", "app.py")
+
+# Les lectures synthétiques reprennent les générateurs des simulateurs (configuration racine)
+sys.path.insert(0, os.path.join(RACINE_PROJET, "capteurs"))
+import capteur_batiments
+import capteur_meteo
+import capteur_parking
+import capteur_transport
+import capteur_wifi
+from config import TOPIC_PARKING, TOPIC_BATIMENTS, TOPIC_WIFI, TOPIC_METEO, TOPIC_TRANSPORT
+from publication import estampiller
+
+# Topic de base et lecture modèle de chaque catégorie
+SOURCES = {
+    "parking": (TOPIC_PARKING, lambda: capteur_parking.generer_donnees_parking(capteur_parking.PARKINGS[0])),
+    "batiments": (TOPIC_BATIMENTS, lambda: capteur_batiments.generer_donnees_batiment(capteur_batiments.BATIMENTS[0])),
+    "wifi": (TOPIC_WIFI, lambda: capteur_wifi.generer_donnees_wifi(capteur_wifi.POINTS_ACCES[0])),
+    "meteo": (TOPIC_METEO, lambda: capteur_meteo.generer_donnees_meteo(capteur_meteo.STATIONS_METEO[0])),
+    "bus": (f"{TOPIC_TRANSPORT}/bus", lambda: capteur_transport.generer_donnees_bus(capteur_transport.BUS[0])),
+    "taxi": (f"{TOPIC_TRANSPORT}/taxi", lambda: capteur_transport.generer_donnees_taxi(capteur_transport.TAXIS[0]))
+}
+
+PAS_GENERATION = 0.005         # Période de publication des générateurs (en secondes)
+RETARD_MAX = 0.1               # Retard de publication rattrapable (en secondes de débit)
+TOPIC_SONDE = f"{TOPIC_PARKING}/sonde_banc"
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+MOTIF_ECHANTILLON = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+MOTIF_ETIQUETTE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def port_libre():
+    """Retourne un port TCP local libre."""
+    with socket.socket() as prise:
+        prise.bind(("127.0.0.1", 0))
+        return prise.getsockname()[1]
+
+def attendre_port(port, delai):
+    """Attend qu'un port local accepte les connexions. Retourne False à l'expiration du délai."""
+    limite = time.monotonic() + delai
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def lire(url):
+    """Retourne le corps d'une réponse HTTP GET."""
+    with urllib.request.urlopen(url, timeout=10) as reponse:
+        return reponse.read().decode()
+
+def lire_metriques(url_api):
+    """Lit /metrics: {(nom, ((etiquette, valeur), ...)): valeur}."""
+    metriques = {}
+    for ligne in lire(f"{url_api}/metrics").splitlines():
+        correspondance = MOTIF_ECHANTILLON.match(ligne)
+        if ligne.startswith("#") or correspondance is None:
+            continue
+        nom, etiquettes, valeur = correspondance.groups()
+        etiquettes = tuple(sorted(MOTIF_ETIQUETTE.findall(etiquettes or "")))
+        metriques[(nom, etiquettes)] = float(valeur)
+    return metriques
+
+def somme(metriques, nom, **filtre):
+    """Somme des échantillons d'une métrique dont les étiquettes correspondent au filtre."""
+    return sum(valeur for (nom_echantillon, etiquettes), valeur in metriques.items()
+               if nom_echantillon == nom and filtre.items() <= dict(etiquettes).items())
+
+def histogramme(debut, fin, nom, **filtre):
+    """Intervalles cumulés [(borne, nombre)] d'un histogramme observés entre deux relevés, toutes séries confondues."""
+    cumuls = {}
+    for (nom_echantillon, etiquettes), valeur in fin.items():
+        etiquettes = dict(etiquettes)
+        if nom_echantillon != f"{nom}_bucket" or not filtre.items() <= etiquettes.items():
+            continue
+        cle = (nom_echantillon, tuple(sorted(etiquettes.items())))
+        borne = float(etiquettes["le"])
+        cumuls[borne] = cumuls.get(borne, 0) + valeur - debut.get(cle, 0)
+    return sorted(cumuls.items())
+
+def quantile(intervalles, q):
+    """Estime un quantile par interpolation linéaire dans les intervalles d'un histogramme (comme Prometheus)."""
+    if not intervalles or not intervalles[-1][1]:
+        return None
+    rang = q * intervalles[-1][1]
+    borne_precedente, cumul_precedent = 0.0, 0
+    for borne, cumul in intervalles:
+        if cumul >= rang:
+            if borne == float("inf"):
+                return borne_precedente
+            if cumul == cumul_precedent:
+                return borne
+            return borne_precedente + (borne - borne_precedente) * (rang - cumul_precedent) / (cumul - cumul_precedent)
+        borne_precedente, cumul_precedent = borne, cumul
+    return borne_precedente
+
+def mesurer_processus(pid):
+    """Temps CPU (s), RSS et RSS maximal (octets) d'un processus, lus dans /proc (Linux), ou None."""
+    try:
+        with open(f"/proc/{pid}/stat") as fichier:
+            # Les champs suivant le nom du processus (entre parenthèses): utime et stime sont les 12e et 13e
+            champs = fichier.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as fichier:
+            statut = dict(ligne.split(":", 1) for ligne in fichier if ":" in ligne)
+    except OSError:
+        return None
+    return {
+        "cpu": (int(champs[11]) + int(champs[12])) / os.sysconf("SC_CLK_TCK"),
+        "rss": int(statut["VmRSS"].split()[0]) * 1024,
+        "rss_max": int(statut["VmHWM"].split()[0]) * 1024
+    }
+
+def generer_charge(adresse, port, capteurs, debit, debut, fin_echauffement, fin):
+    """Publie les lectures de capteurs [(topic, categorie)] au débit demandé, de debut à fin (heures time.time()).
+
+    Exécutée dans un processus générateur. Retourne le nombre de lectures
+    publiées pendant l'échauffement et pendant la mesure.
+    """
+    modeles = {categorie: generer() for categorie, (_, generer) in SOURCES.items()}
+    client = mqtt_client.Client(client_id=f"banc_bout_en_bout_{os.getpid()}",
+                                callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
+    client.connect(adresse, port)
+    client.loop_start()
+
+    publies = [0, 0]
+    indice = 0
+    retard = 0.0
+    time.sleep(max(0.0, debut - time.time()))
+    precedent = time.time()
+    while precedent < fin:
+        time.sleep(PAS_GENERATION)
+        maintenant = time.time()
+        # Lectures dues depuis le dernier pas; un générateur trop lent abandonne son retard au-delà de RETARD_MAX
+        retard = min(retard + debit * (maintenant - precedent), debit * RETARD_MAX)
+        precedent = maintenant
+        phase = 0 if maintenant < fin_echauffement else 1
+        while retard >= 1:
+            topic, categorie = capteurs[indice]
+            indice = (indice + 1) % len(capteurs)
+            donnees = dict(modeles[categorie])
+            donnees["timestamp"] = maintenant
+            client.publish(topic, json.dumps(estampiller(topic, donnees), ensure_ascii=False))
+            publies[phase] += 1
+            retard -= 1
+
+    # La déconnexion est envoyée après les messages encore en file
+    client.disconnect()
+    client.loop_stop()
+    return publies
+
+def attendre_abonnement(adresse, port, url_api, delai):
+    """Publie une lecture sonde jusqu'à ce que l'API la compte. Retourne False à l'expiration du délai."""
+    client = mqtt_client.Client(client_id="banc_bout_en_bout_sonde",
+                                callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
+    client.connect(adresse, port)
+    client.loop_start()
+    limite = time.monotonic() + delai
+    try:
+        while time.monotonic() < limite:
+            client.publish(TOPIC_SONDE, json.dumps({"places_disponibles": 1, "timestamp": time.time()}))
+            time.sleep(0.2)
+            if somme(lire_metriques(url_api), "iot_messages_recus_total"):
+                return True
+        return False
+    finally:
+        client.disconnect()
+        client.loop_stop()
+
+def repartir_capteurs(nombre, categories, processus):
+    """Répartit les capteurs entre les catégories puis entre les processus générateurs."""
+    capteurs = []
+    for indice in range(nombre):
+        categorie = categories[indice % len(categories)]
+        capteurs.append((f"{SOURCES[categorie][0]}/banc{indice}", categorie))
+    return [capteurs[rang::processus] for rang in range(processus)]
+
+def arreter(processus):
+    """Arrête un processus fils (SIGTERM, puis SIGKILL s'il ne s'arrête pas)."""
+    if processus.poll() is None:
+        processus.send_signal(signal.SIGTERM)
+        try:
+            processus.wait(10)
+        except subprocess.TimeoutExpired:
+            processus.kill()
+            processus.wait()
+
+def lancer_broker():
+    """Démarre le broker minimal sur un port libre. Retourne (processus, port), ou (None, None) en cas d'échec."""
+    port = port_libre()
+    broker = subprocess.Popen([sys.executable, SCRIPT_BROKER, "--port", str(port)], stdout=subprocess.PIPE, text=True)
+    if not attendre_port(port, 10):
+        arreter(broker)
+        return None, None
+    return broker, port
+
+def arreter_broker(broker):
+    """Arrête le broker minimal et retourne ses compteurs."""
+    arreter(broker)
+    lignes = broker.stdout.read().splitlines()
+    return json.loads(lignes[-1]) if lignes else None
+
+def lancer_api(repertoire, adresse, port_broker, environnement=None):
+    """Démarre l'API dans repertoire (instantané, archives, journal api.log) sur un port libre.
+
+    Retourne (processus, url de l'API, chemin du journal). environnement
+    complète les variables transmises à l'API (ex: API_PERIODE_NETTOYAGE).
+    """
+    port_api = port_libre()
+    variables = dict(os.environ, API_BROKER_ADRESSE=adresse, API_BROKER_PORT=str(port_broker),
+                     API_PORT=str(port_api), **(environnement or {}))
+    chemin_journal = os.path.join(repertoire, "api.log")
+    with open(chemin_journal, "w") as journal:
+        api = subprocess.Popen([sys.executable, SCRIPT_API], cwd=repertoire, env=variables,
+                               stdout=journal, stderr=subprocess.STDOUT)
+    return api, f"http://127.0.0.1:{port_api}", chemin_journal
+
+def attendre_api(api, url_api, adresse, port_broker):
+    """Attend que l'API réponde et reçoive les messages MQTT. Retourne False en cas d'échec."""
+    port_api = int(url_api.rsplit(":", 1)[1])
+    return api.poll() is None and attendre_port(port_api, 30) and attendre_abonnement(adresse, port_broker, url_api, 15)
+
+def pourcentage_cpu(debut, fin, duree):
+    if debut is None or fin is None:
+        return None
+    return 100 * (fin["cpu"] - debut["cpu"]) / duree
+
+def resumer_latences(debut, fin, etape):
+    intervalles = histogramme(debut, fin, "iot_latence_secondes", etape=etape)
+    nombre = intervalles[-1][1] if intervalles else 0
+    total = (somme(fin, "iot_latence_secondes_sum", etape=etape)
+             - somme(debut, "iot_latence_secondes_sum", etape=etape))
+    resume = {"observations": int(nombre), "moyenne": total / nombre if nombre else None}
+    for q in QUANTILES:
+        resume[f"p{q * 100:g}"] = quantile(intervalles, q)
+    return resume
+
+def formater_duree(secondes):
+    return "-" if secondes is None else f"{secondes * 1000:.2f} ms"
+
+def formater_octets(octets):
+    return "-" if octets is None else f"{octets / (1024 * 1024):.1f} Mio"
+
+def afficher(rapport):
+    """Affiche le rapport du banc."""
+    parametres, ingestion = rapport["parametres"], rapport["ingestion"]
+    print(f"\n{parametres['capteurs']} capteurs ({', '.join(parametres['categories'])}), "
+          f"débit cible {parametres['debit']} msg/s, {parametres['processus']} générateur(s), "
+          f"mesure {parametres['duree']} s après {parametres['echauffement']} s d'échauffement")
+    print(f"  Publication:        {rapport['publication']['debit']:.0f} msg/s "
+          f"({rapport['publication']['publies']} messages au total)")
+    print(f"  Ingestion soutenue: {ingestion['debit']:.0f} msg/s")
+    print(f"  Perdus:             {ingestion['perdus']} ({ingestion['taux_perte']:.3%}), "
+          f"trous de séquence {ingestion['trous_sequence']}, doublons {ingestion['doublons']}, "
+          f"erreurs {ingestion['erreurs']}")
+    for etape, latences in rapport["latences"].items():
+        quantiles = ", ".join(f"{nom} {formater_duree(valeur)}" for nom, valeur in latences.items()
+                              if nom.startswith("p"))
+        print(f"  Latence {etape}: moyenne {formater_duree(latences['moyenne'])}, {quantiles}")
+    for nom, libelle in (("api", "API"), ("broker", "Broker")):
+        ressources = rapport["ressources"].get(nom)
+        if ressources is None:
+            continue
+        cpu = "-" if ressources["cpu_pourcent"] is None else f"{ressources['cpu_pourcent']:.0f} %"
+        print(f"  {libelle:<8}CPU {cpu}, RSS {formater_octets(ressources['rss'])} "
+              f"(max {formater_octets(ressources['rss_max'])})")
+    if (os.cpu_count() or 1) < parametres["processus"] + 2:
+        print(f"  Attention: {os.cpu_count()} cœur(s) pour {parametres['processus'] + 2} processus (générateurs, "
+              f"broker, API): les mesures incluent leur concurrence pour le CPU")
+    if rapport["broker"]:
+        print(f"  Broker: {rapport['broker']['recus']} reçus, {rapport['broker']['distribues']} distribués, "
+              f"{rapport['broker']['abandonnes']} abandonnés (abonné trop lent)")
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Banc de charge bout en bout de l'ingestion (broker local, API réelle et capteurs synthétiques)")
+    parser.add_argument("--capteurs", type=int, default=600, help="Nombre de capteurs synthétiques")
+    parser.add_argument("--debit", type=float, default=2000, help="Débit total de publication (messages/s)")
+    parser.add_argument("--duree", type=float, default=20, help="Durée de la mesure (en secondes)")
+    parser.add_argument("--echauffement", type=float, default=5, help="Durée de l'échauffement (en secondes)")
+    parser.add_argument("--vidange", type=float, default=10,
+                        help="Attente maximale du traitement des messages en retard après la mesure (en secondes)")
+    parser.add_argument("--processus", type=int, default=1, help="Nombre de processus générateurs")
+    parser.add_argument("--categories", default=",".join(SOURCES),
+                        help="Catégories simulées, séparées par des virgules")
+    parser.add_argument("--broker", help="Broker existant (adresse:port) au lieu du broker minimal")
+    parser.add_argument("--sortie", help="Fichier JSON où enregistrer le rapport")
+    parser.add_argument("--conserver", action="store_true",
+                        help="Conserver le répertoire de travail de l'API (journal, instantané)")
+    arguments = parser.parse_args()
+
+    categories = arguments.categories.split(",")
+    inconnues = [categorie for categorie in categories if categorie not in SOURCES]
+    if inconnues:
+        parser.error(f"Catégories inconnues: {', '.join(inconnues)}")
+
+    repertoire = tempfile.mkdtemp(prefix="banc_bout_en_bout_")
+    broker = api = None
+    try:
+        if arguments.broker:
+            adresse, port_broker = arguments.broker.rsplit(":", 1)
+            port_broker = int(port_broker)
+        else:
+            adresse = "127.0.0.1"
+            broker, port_broker = lancer_broker()
+            if broker is None:
+                print("Le broker n'a pas démarré", file=sys.stderr)
+                return 1
+
+        # L'API travaille dans un répertoire temporaire (instantané, archives) et y écrit son journal
+        api, url_api, chemin_journal = lancer_api(repertoire, adresse, port_broker)
+        if not attendre_api(api, url_api, adresse, port_broker):
+            print(f"L'API n'a pas démarré ou ne reçoit pas les messages (journal: {chemin_journal})", file=sys.stderr)
+            arguments.conserver = True
+            return 1
+
+        # Les générateurs démarrent ensemble, une seconde après leur lancement
+        debut = time.time() + 1
+        fin_echauffement = debut + arguments.echauffement
+        fin = fin_echauffement + arguments.duree
+        recus_initiaux = somme(lire_metriques(url_api), "iot_messages_recus_total")
+        contexte = multiprocessing.get_context("spawn")
+        with contexte.Pool(arguments.processus) as pool:
+            taches = [pool.apply_async(generer_charge, (adresse, port_broker, capteurs,
+                                                        arguments.debit / arguments.processus,
+                                                        debut, fin_echauffement, fin))
+                      for capteurs in repartir_capteurs(arguments.capteurs, categories, arguments.processus)]
+
+            time.sleep(max(0.0, fin_echauffement - time.time()))
+            metriques_debut = lire_metriques(url_api)
+            ressources_debut = {"api": mesurer_processus(api.pid),
+                                "broker": mesurer_processus(broker.pid) if broker else None}
+            instant_debut = time.time()
+
+            time.sleep(max(0.0, fin - time.time()))
+            metriques_fin = lire_metriques(url_api)
+            ressources_fin = {"api": mesurer_processus(api.pid),
+                              "broker": mesurer_processus(broker.pid) if broker else None}
+            duree = time.time() - instant_debut
+
+            publies = [sum(phases) for phases in zip(*(tache.get() for tache in taches))]
+
+        # Vidange: attendre que l'API ait traité les messages encore en file
+        recus = somme(metriques_fin, "iot_messages_recus_total")
+        limite = time.monotonic() + arguments.vidange
+        while time.monotonic() < limite:
+            time.sleep(0.5)
+            metriques_vidange = lire_metriques(url_api)
+            recus, precedents = somme(metriques_vidange, "iot_messages_recus_total"), recus
+            if recus == precedents and recus - recus_initiaux >= sum(publies):
+                break
+        metriques_vidange = lire_metriques(url_api)
+        tracage = json.loads(lire(f"{url_api}/api/tracage"))["categories"]
+        if api.poll() is not None:
+            print(f"L'API s'est arrêtée pendant la mesure (journal: {chemin_journal})", file=sys.stderr)
+            arguments.conserver = True
+            return 1
+    except (OSError, urllib.error.URLError) as erreur:
+        print(f"Erreur pendant le banc: {erreur}", file=sys.stderr)
+        arguments.conserver = True
+        return 1
+    finally:
+        if api is not None:
+            arreter(api)
+        statistiques_broker = None
+        if broker is not None:
+            statistiques_broker = arreter_broker(broker)
+        if arguments.conserver:
+            print(f"Répertoire de travail de l'API: {repertoire}", file=sys.stderr)
+        else:
+            shutil.rmtree(repertoire, ignore_errors=True)
+
+    recus_total = somme(metriques_vidange, "iot_messages_recus_total") - recus_initiaux
+    perdus = max(0, int(sum(publies) - recus_total))
+    rapport = {
+        "environnement": decrire_environnement(),
+        "parametres": {
+            "capteurs": arguments.capteurs, "categories": categories, "debit": arguments.debit,
+            "duree": arguments.duree, "echauffement": arguments.echauffement, "processus": arguments.processus,
+            "broker": arguments.broker or "minimal"
+        },
+        "publication": {"publies": sum(publies), "debit": publies[1] / arguments.duree},
+        "ingestion": {
+            "debit": (somme(metriques_fin, "iot_messages_recus_total")
+                      - somme(metriques_debut, "iot_messages_recus_total")) / duree,
+            "recus": int(recus_total),
+            "perdus": perdus,
+            "taux_perte": perdus / sum(publies) if sum(publies) else 0.0,
+            "trous_sequence": sum(totaux["perdus"] for totaux in tracage.values()),
+            "doublons": sum(totaux["doublons"] for totaux in tracage.values()),
+            "erreurs": int(somme(metriques_vidange, "iot_erreurs_decodage_json_total")
+                           + somme(metriques_vidange, "iot_erreurs_traitement_total"))
+        },
+        # Lectures publiées depuis le début de la mesure, y compris celles traitées pendant la vidange
+        "latences": {etape: resumer_latences(metriques_debut, metriques_vidange, etape)
+                     for etape in ("publication_reception", "reception_emission")},
+        "ressources": {
+            nom: None if ressources_fin[nom] is None else {
+                "cpu_pourcent": pourcentage_cpu(ressources_debut[nom], ressources_fin[nom], duree),
+                "rss": ressources_fin[nom]["rss"],
+                "rss_max": ressources_fin[nom]["rss_max"]
+            }
+            for nom in ("api", "broker")
+        },
+        "broker": statistiques_broker
+    }
+    afficher(rapport)
+    if arguments.sortie:
+        with open(arguments.sortie, "w", encoding="utf-8") as fichier:
+            json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+        print(f"Rapport enregistré dans {arguments.sortie}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
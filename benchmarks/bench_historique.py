@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de l'historique de l'API: stockage en mémoire contre backends SQLite
+et journal de segments. Mesure le débit d'ingestion (points/s, écriture sur
+disque comprise), la latence des lectures d'historique d'un capteur sur une
+fenêtre de temps et la durée de réouverture d'un backend existant.
+
+    python3 benchmarks/bench_historique.py [--capteurs 1000] [--points 200] [--requetes 500]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+# L'API est importée depuis le répertoire api (avec sa propre configuration)
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE_PROJET, "api"))
+
+import app
+from categories import CHAMPS_HISTORIQUE
+from persistance_segments import JournalSegments
+from persistance_sqlite import StockageSQLite
+
+CATEGORIE = "meteo"
+
+# Backends persistants comparés, créés dans un répertoire temporaire
+BACKENDS = {
+    "sqlite": lambda repertoire: StockageSQLite(os.path.join(repertoire, "historique.db"), CHAMPS_HISTORIQUE),
+    "segments": lambda repertoire: JournalSegments(os.path.join(repertoire, "segments"), CHAMPS_HISTORIQUE)
+}
+
+def generer_lectures(nombre_capteurs, nombre_points, debut):
+    """Génère les lectures météo, un point par capteur et par minute."""
+    lectures = []
+    for minute in range(nombre_points):
+        for capteur in range(nombre_capteurs):
+            lectures.append((f"station_{capteur}", {
+                "temperature": round(random.uniform(-5, 30), 1),
+                "humidite": random.randint(30, 90),
+                "timestamp": debut + minute * 60
+            }))
+    return lectures
+
+def vider_memoire():
+    """Vide l'historique en mémoire de l'API."""
+    app.historique_donnees[CATEGORIE].clear()
+    app.donnees_capteurs[CATEGORIE].clear()
+
+def mesurer_ingestion(lectures, taille_lot):
+    """Retourne la durée d'ingestion des lectures par lots de taille_lot."""
+    debut = time.perf_counter()
+    for i in range(0, len(lectures), taille_lot):
+        with app.verrou_donnees:
+            for capteur_id, donnees in lectures[i:i + taille_lot]:
+                app.enregistrer_lecture(CATEGORIE, capteur_id, donnees)
+    if app.backend_historique is not None:
+        app.backend_historique.vider()
+    return time.perf_counter() - debut
+
+def mesurer_requetes(nombre_capteurs, nombre_points, debut, nombre_requetes):
+    """Retourne les latences (secondes) de lectures d'une heure d'historique d'un capteur."""
+    latences = []
+    for _ in range(nombre_requetes):
+        capteur_id = f"station_{random.randrange(nombre_capteurs)}"
+        debut_fenetre = debut + random.randrange(max(nombre_points - 60, 1)) * 60
+        instant = time.perf_counter()
+        app.lire_historique(CATEGORIE, capteur_id, debut_fenetre, debut_fenetre + 3600)
+        latences.append(time.perf_counter() - instant)
+    return sorted(latences)
+
+def afficher(nom, nombre_lectures, duree, latences, duree_ouverture=None):
+    """Affiche une ligne de résultats."""
+    p50 = latences[len(latences) // 2] * 1e3
+    p99 = latences[int(len(latences) * 0.99)] * 1e3
+    ouverture = f"{duree_ouverture * 1e3:>16.1f}" if duree_ouverture is not None else f"{'-':>16}"
+    print(f"{nom:<28}{nombre_lectures / duree:>18,.0f}{p50:>12.3f}{p99:>12.3f}{ouverture}")
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark de l'historique de l'API: mémoire, backends SQLite et journal de segments")
+    parser.add_argument("--capteurs", type=int, default=1000, help="Nombre de capteurs")
+    parser.add_argument("--points", type=int, default=200, help="Nombre de points par capteur (un par minute)")
+    parser.add_argument("--requetes", type=int, default=500, help="Nombre de lectures d'historique mesurées")
+    parser.add_argument("--taille-lot", type=int, default=100, help="Lectures appliquées par acquisition du verrou")
+    arguments = parser.parse_args()
+
+    random.seed(1)
+    debut = time.time() - arguments.points * 60
+    lectures = generer_lectures(arguments.capteurs, arguments.points, debut)
+
+    print(f"{len(lectures):,} points, {arguments.capteurs} capteurs")
+    print(f"{'stockage':<28}{'ingestion (pts/s)':>18}{'p50 (ms)':>12}{'p99 (ms)':>12}{'ouverture (ms)':>16}")
+
+    # Historique uniquement en mémoire
+    duree = mesurer_ingestion(lectures, arguments.taille_lot)
+    latences = mesurer_requetes(arguments.capteurs, arguments.points, debut, arguments.requetes)
+    afficher("mémoire", len(lectures), duree, latences)
+    vider_memoire()
+
+    for nom, creer in BACKENDS.items():
+        with tempfile.TemporaryDirectory() as repertoire:
+            app.backend_historique = creer(repertoire)
+            try:
+                duree = mesurer_ingestion(lectures, arguments.taille_lot)
+
+                # Lectures servies par le tier chaud
+                latences = mesurer_requetes(arguments.capteurs, arguments.points, debut, arguments.requetes)
+                afficher(f"{nom} (tier chaud)", len(lectures), duree, latences)
+
+                # Lectures servies par le backend après un redémarrage de l'API
+                vider_memoire()
+                app.backend_historique.fermer()
+                instant = time.perf_counter()
+                app.backend_historique = creer(repertoire)
+                duree_ouverture = time.perf_counter() - instant
+                latences = mesurer_requetes(arguments.capteurs, arguments.points, debut, arguments.requetes)
+                afficher(f"{nom} (après redémarrage)", len(lectures), duree, latences, duree_ouverture)
+            finally:
+                app.backend_historique.fermer()
+                app.backend_historique = None
+
+if __name__ == "__main__":
+    main()
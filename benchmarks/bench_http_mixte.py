@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test de charge mixte lecture/écriture de l'API: des clients HTTP concurrents (connexions
+persistantes) interrogent les routes REST pendant qu'une ingestion MQTT synthétique tourne
+à débit fixe, sur la même pile que benchmarks/bench_bout_en_bout.py (broker minimal et
+API réelle dans des processus séparés).
+
+L'historique est d'abord préchargé, puis le nettoyage (nettoyer_donnees_anciennes) est
+déclenché toutes les --periode-nettoyage secondes. Pour chaque route: débit, taux
+d'erreur, latences p50/p95/p99/max, et pics de latence (au-delà de --facteur-pic fois le
+p99 hors nettoyage) en distinguant ceux qui chevauchent un nettoyage, relevé par l'API
+dans /metrics: un pic concomitant au nettoyage révèle l'attente du verrou des données.
+
+    python3 benchmarks/bench_http_mixte.py [--clients 8] [--debit 500] [--duree 30] [--prechargement 50000]
+    python3 benchmarks/bench_http_mixte.py --route /api/parking --route "/api/meteo/{meteo}/historique"
+"""
+
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import paho.mqtt.client as mqtt_client
+
+from bench_bout_en_bout import (SOURCES, arreter, arreter_broker, attendre_api, formater_duree, formater_octets,
+                                generer_charge, lancer_api, lancer_broker, lire_metriques, mesurer_processus,
+                                pourcentage_cpu, repartir_capteurs, resumer_latences, somme)
+from environnement import decrire_environnement
+
+# Routes interrogées par défaut; {categorie} est remplacé par un capteur de la catégorie à chaque requête
+ROUTES = [
+    "/api/parking",
+    "/api/transport/taxi",
+    "/api/parking/{parking}/historique",
+    "/api/wifi/{wifi}/historique",
+    "/api/meteo/{meteo}/historique"
+]
+
+MOTIF_CAPTEUR = re.compile(r"\{(\w+)\}")
+PERIODE_RELEVE_NETTOYAGE = 1.0   # Période de lecture des jauges de nettoyage dans /metrics (en secondes)
+DUREE_PRECHARGEMENT = 3600       # Les lectures préchargées couvrent la dernière heure
+
+def centile(durees_triees, q):
+    """Centile (méthode du rang le plus proche) d'une liste triée, ou None."""
+    if not durees_triees:
+        return None
+    return durees_triees[min(len(durees_triees) - 1, max(0, math.ceil(q * len(durees_triees)) - 1))]
+
+def precharger(adresse, port, url_api, capteurs, nombre):
+    """Publie nombre lectures réparties sur les capteurs et datées de la dernière heure, puis attend leur traitement.
+
+    Les lectures préchargées ne portent pas de numéro de séquence: elles
+    n'interfèrent pas avec le suivi des séquences de l'ingestion mesurée.
+    """
+    modeles = {categorie: generer() for categorie, (_, generer) in SOURCES.items()}
+    client = mqtt_client.Client(client_id="banc_http_prechargement",
+                                callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
+    client.connect(adresse, port)
+    client.loop_start()
+    recus = somme(lire_metriques(url_api), "iot_messages_recus_total")
+    origine = time.time() - DUREE_PRECHARGEMENT
+    for indice in range(nombre):
+        topic, categorie = capteurs[indice % len(capteurs)]
+        donnees = dict(modeles[categorie])
+        donnees["timestamp"] = origine + DUREE_PRECHARGEMENT * indice / nombre
+        client.publish(topic, json.dumps(donnees, ensure_ascii=False))
+    client.disconnect()
+    client.loop_stop()
+
+    while somme(lire_metriques(url_api), "iot_messages_recus_total") < recus + nombre:
+        time.sleep(0.5)
+
+def client_http(url_api, routes, identifiants, fin, requetes, graine):
+    """Enchaîne les requêtes sur une connexion persistante jusqu'à fin: [(debut, duree, route, statut)].
+
+    statut est le code HTTP, ou None si la requête a échoué (connexion refusée, coupée...).
+    """
+    hasard = random.Random(graine)
+    adresse = urllib.parse.urlsplit(url_api)
+    connexion = None
+    indice = graine
+    while time.time() < fin:
+        route = routes[indice % len(routes)]
+        indice += 1
+        chemin = MOTIF_CAPTEUR.sub(lambda correspondance: hasard.choice(identifiants[correspondance.group(1)]), route)
+        if connexion is None:
+            connexion = http.client.HTTPConnection(adresse.hostname, adresse.port, timeout=30)
+        debut = time.time()
+        chrono = time.perf_counter()
+        try:
+            connexion.request("GET", chemin)
+            reponse = connexion.getresponse()
+            reponse.read()
+            statut = reponse.status
+            if reponse.will_close:
+                connexion.close()
+                connexion = None
+        except (OSError, http.client.HTTPException):
+            statut = None
+            connexion.close()
+            connexion = None
+        requetes.append((debut, time.perf_counter() - chrono, route, statut))
+    if connexion is not None:
+        connexion.close()
+
+def relever_nettoyages(url_api, fin, nettoyages):
+    """Relève dans /metrics les nettoyages de l'historique jusqu'à fin: {debut: (duree_verrou, duree_totale)}."""
+    while time.time() < fin:
+        try:
+            metriques = lire_metriques(url_api)
+        except (OSError, urllib.error.URLError):
+            metriques = {}
+        debut = somme(metriques, "iot_nettoyage_dernier_debut_secondes")
+        if debut:
+            nettoyages[debut] = (somme(metriques, "iot_nettoyage_derniere_duree_secondes", etape="verrou"),
+                                 somme(metriques, "iot_nettoyage_derniere_duree_secondes", etape="total"))
+        time.sleep(PERIODE_RELEVE_NETTOYAGE)
+
+def analyser_route(requetes, fenetres, duree, facteur_pic):
+    """Statistiques des requêtes d'une route; fenetres: intervalles [(debut, fin)] des nettoyages."""
+    def pendant_nettoyage(requete):
+        debut, duree_requete = requete[0], requete[1]
+        return any(debut < fin and debut + duree_requete > debut_nettoyage for debut_nettoyage, fin in fenetres)
+
+    erreurs = sum(1 for requete in requetes if requete[3] is None or requete[3] >= 400)
+    durees = sorted(requete[1] for requete in requetes)
+    pendant = sorted(requete[1] for requete in requetes if pendant_nettoyage(requete))
+    hors = sorted(requete[1] for requete in requetes if not pendant_nettoyage(requete))
+    # Un pic est une requête bien plus lente que le p99 observé hors nettoyage
+    seuil_pic = facteur_pic * centile(hors, 0.99) if hors else None
+    pics = [requete for requete in requetes if seuil_pic is not None and requete[1] > seuil_pic]
+    return {
+        "requetes": len(requetes),
+        "debit": len(requetes) / duree,
+        "erreurs": erreurs,
+        "taux_erreur": erreurs / len(requetes) if requetes else 0.0,
+        "p50": centile(durees, 0.5),
+        "p95": centile(durees, 0.95),
+        "p99": centile(durees, 0.99),
+        "max": durees[-1] if durees else None,
+        "pendant_nettoyage": {"requetes": len(pendant), "p99": centile(pendant, 0.99)},
+        "hors_nettoyage": {"requetes": len(hors), "p99": centile(hors, 0.99)},
+        "seuil_pic": seuil_pic,
+        "pics": len(pics),
+        "pics_pendant_nettoyage": sum(1 for requete in pics if pendant_nettoyage(requete))
+    }
+
+def afficher(rapport):
+    """Affiche le rapport du test."""
+    parametres = rapport["parametres"]
+    print(f"\n{parametres['clients']} clients HTTP, ingestion {parametres['debit']} msg/s sur {parametres['capteurs']} "
+          f"capteurs, historique préchargé de {parametres['prechargement']} lectures, "
+          f"nettoyage toutes les {parametres['periode_nettoyage']} s, mesure {parametres['duree']} s")
+    print(f"\n{'route':<36}{'req/s':>8}{'erreurs':>9}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}"
+          f"{'p99 nett.':>11}{'pics (nett.)':>14}")
+    for route, statistiques in rapport["routes"].items():
+        print(f"{route:<36}{statistiques['debit']:>8.0f}{statistiques['taux_erreur']:>9.1%}"
+              f"{formater_duree(statistiques['p50']):>11}{formater_duree(statistiques['p95']):>11}"
+              f"{formater_duree(statistiques['p99']):>11}{formater_duree(statistiques['max']):>11}"
+              f"{formater_duree(statistiques['pendant_nettoyage']['p99']):>11}"
+              f"{statistiques['pics']:>7} ({statistiques['pics_pendant_nettoyage']})")
+
+    nettoyages = rapport["nettoyages"]
+    pics = sum(statistiques["pics"] for statistiques in rapport["routes"].values())
+    pics_nettoyage = sum(statistiques["pics_pendant_nettoyage"] for statistiques in rapport["routes"].values())
+    verrou_max = max((nettoyage["verrou"] for nettoyage in nettoyages), default=None)
+    print(f"\nNettoyages pendant la mesure: {len(nettoyages)}, détention maximale du verrou {formater_duree(verrou_max)}")
+    print(f"Pics de latence: {pics}, dont {pics_nettoyage} pendant un nettoyage")
+    if pics and pics_nettoyage / pics >= 0.5:
+        print("  -> la majorité des pics coïncide avec le nettoyage: attente du verrou des données")
+
+    ingestion = rapport["ingestion"]
+    latences = ingestion["latence_publication_reception"]
+    print(f"Ingestion: {ingestion['debit']:.0f} msg/s, latence publication -> réception p50 "
+          f"{formater_duree(latences['p50'])}, p99 {formater_duree(latences['p99'])}")
+    if rapport["api"] is not None:
+        cpu = "-" if rapport["api"]["cpu_pourcent"] is None else f"{rapport['api']['cpu_pourcent']:.0f} %"
+        print(f"API: CPU {cpu}, RSS {formater_octets(rapport['api']['rss'])}")
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Test de charge mixte lecture/écriture de l'API (clients HTTP concurrents et ingestion MQTT)")
+    parser.add_argument("--clients", type=int, default=8, help="Nombre de clients HTTP concurrents")
+    parser.add_argument("--route", action="append", dest="routes",
+                        help="Route interrogée (répétable); {categorie} désigne un capteur de la catégorie")
+    parser.add_argument("--debit", type=float, default=500, help="Débit de l'ingestion MQTT (messages/s)")
+    parser.add_argument("--capteurs", type=int, default=600, help="Nombre de capteurs synthétiques")
+    parser.add_argument("--prechargement", type=int, default=50000,
+                        help="Lectures publiées avant la mesure pour remplir l'historique")
+    parser.add_argument("--periode-nettoyage", type=int, default=5,
+                        help="Période du nettoyage de l'historique dans l'API (en secondes)")
+    parser.add_argument("--duree", type=float, default=30, help="Durée de la mesure (en secondes)")
+    parser.add_argument("--echauffement", type=float, default=3, help="Durée de l'échauffement (en secondes)")
+    parser.add_argument("--facteur-pic", type=float, default=3,
+                        help="Une requête plus lente que ce multiple du p99 hors nettoyage de sa route est un pic")
+    parser.add_argument("--sortie", help="Fichier JSON où enregistrer le rapport")
+    parser.add_argument("--conserver", action="store_true",
+                        help="Conserver le répertoire de travail de l'API (journal, instantané)")
+    arguments = parser.parse_args()
+
+    routes = arguments.routes or ROUTES
+    capteurs = repartir_capteurs(arguments.capteurs, list(SOURCES), 1)[0]
+    identifiants = {}
+    for topic, categorie in capteurs:
+        identifiants.setdefault(categorie, []).append(topic.rsplit("/", 1)[1])
+    inconnues = {nom for route in routes for nom in MOTIF_CAPTEUR.findall(route) if nom not in identifiants}
+    if inconnues:
+        parser.error(f"Catégories inconnues dans les routes: {', '.join(sorted(inconnues))}")
+
+    repertoire = tempfile.mkdtemp(prefix="banc_http_mixte_")
+    broker = api = None
+    try:
+        adresse = "127.0.0.1"
+        broker, port_broker = lancer_broker()
+        if broker is None:
+            print("Le broker n'a pas démarré", file=sys.stderr)
+            return 1
+        api, url_api, chemin_journal = lancer_api(repertoire, adresse, port_broker,
+                                                  {"API_PERIODE_NETTOYAGE": str(arguments.periode_nettoyage)})
+        if not attendre_api(api, url_api, adresse, port_broker):
+            print(f"L'API n'a pas démarré ou ne reçoit pas les messages (journal: {chemin_journal})", file=sys.stderr)
+            arguments.conserver = True
+            return 1
+
+        print(f"Préchargement de {arguments.prechargement} lectures...")
+        precharger(adresse, port_broker, url_api, capteurs, arguments.prechargement)
+
+        debut = time.time() + 1
+        fin_echauffement = debut + arguments.echauffement
+        fin = fin_echauffement + arguments.duree
+        nettoyages = {}
+        requetes = [[] for _ in range(arguments.clients)]
+        threads = [threading.Thread(target=relever_nettoyages, args=(url_api, fin, nettoyages), daemon=True)]
+        threads += [threading.Thread(target=client_http, args=(url_api, routes, identifiants, fin, requetes[rang], rang),
+                                     daemon=True)
+                    for rang in range(arguments.clients)]
+
+        contexte = multiprocessing.get_context("spawn")
+        with contexte.Pool(1) as pool:
+            ingestion = pool.apply_async(generer_charge, (adresse, port_broker, capteurs, arguments.debit,
+                                                          debut, fin_echauffement, fin))
+            time.sleep(max(0.0, debut - time.time()))
+            for thread in threads:
+                thread.start()
+
+            time.sleep(max(0.0, fin_echauffement - time.time()))
+            metriques_debut = lire_metriques(url_api)
+            ressources_debut = mesurer_processus(api.pid)
+            instant_debut = time.time()
+
+            time.sleep(max(0.0, fin - time.time()))
+            metriques_fin = lire_metriques(url_api)
+            ressources_fin = mesurer_processus(api.pid)
+            duree = time.time() - instant_debut
+            for thread in threads:
+                thread.join()
+            ingestion.get()
+        if api.poll() is not None:
+            print(f"L'API s'est arrêtée pendant la mesure (journal: {chemin_journal})", file=sys.stderr)
+            arguments.conserver = True
+            return 1
+    except (OSError, urllib.error.URLError) as erreur:
+        print(f"Erreur pendant le test: {erreur}", file=sys.stderr)
+        arguments.conserver = True
+        return 1
+    finally:
+        if api is not None:
+            arreter(api)
+        if broker is not None:
+            arreter_broker(broker)
+        if arguments.conserver:
+            print(f"Répertoire de travail de l'API: {repertoire}", file=sys.stderr)
+        else:
+            shutil.rmtree(repertoire, ignore_errors=True)
+
+    # Seules les requêtes commencées pendant la mesure sont analysées
+    mesurees = [requete for requetes_client in requetes for requete in requetes_client
+                if fin_echauffement <= requete[0] < fin]
+    fenetres = sorted((debut_nettoyage, debut_nettoyage + total) for debut_nettoyage, (_, total) in nettoyages.items()
+                      if debut_nettoyage < fin and debut_nettoyage + total > fin_echauffement)
+    rapport = {
+        "environnement": decrire_environnement(),
+        "parametres": {
+            "clients": arguments.clients, "routes": routes, "debit": arguments.debit, "capteurs": arguments.capteurs,
+            "prechargement": arguments.prechargement, "periode_nettoyage": arguments.periode_nettoyage,
+            "duree": arguments.duree, "echauffement": arguments.echauffement, "facteur_pic": arguments.facteur_pic
+        },
+        "routes": {route: analyser_route([requete for requete in mesurees if requete[2] == route], fenetres, duree,
+                                         arguments.facteur_pic)
+                   for route in routes},
+        "nettoyages": [{"debut": debut_nettoyage, "verrou": verrou, "total": total}
+                       for debut_nettoyage, (verrou, total) in sorted(nettoyages.items())
+                       if debut_nettoyage < fin and debut_nettoyage + total > fin_echauffement],
+        "ingestion": {
+            "debit": (somme(metriques_fin, "iot_messages_recus_total")
+                      - somme(metriques_debut, "iot_messages_recus_total")) / duree,
+            "latence_publication_reception": resumer_latences(metriques_debut, metriques_fin, "publication_reception")
+        },
+        "api": None if ressources_fin is None else {
+            "cpu_pourcent": pourcentage_cpu(ressources_debut, ressources_fin, duree),
+            "rss": ressources_fin["rss"],
+            "rss_max": ressources_fin["rss_max"]
+        }
+    }
+    afficher(rapport)
+    if arguments.sortie:
+        with open(arguments.sortie, "w", encoding="utf-8") as fichier:
+            json.dump(rapport, fichier, indent=2, ensure_ascii=False)
+        print(f"Rapport enregistré dans {arguments.sortie}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark des modes scalaire et vectorisé des simulateurs météo, Wi-Fi et parking.
+Mesure le nombre de capteurs générés par seconde sur un seul cœur, construction
+des messages JSON comprise (sauf avec --sans-json).
+
+    python3 benchmarks/bench_simulateurs_vectorises.py [--capteurs 100000] [--cycles 5] [--sans-json]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+# Les simulateurs sont importés depuis le répertoire capteurs
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RACINE_PROJET, "capteurs"))
+
+SIMULATEURS = ["capteur_meteo", "capteur_wifi", "capteur_parking"]
+
+def mesurer(generer, cycles, encoder):
+    """Retourne la durée moyenne d'un cycle de génération, messages JSON compris si encoder."""
+    # Premier cycle hors mesure: construction paresseuse de la population et de l'état
+    for _ in generer():
+        pass
+    
+    debut = time.perf_counter()
+    for _ in range(cycles):
+        for _, donnees in generer():
+            if encoder:
+                json.dumps(donnees, ensure_ascii=False)
+    return (time.perf_counter() - debut) / cycles
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--capteurs", type=int, default=100000, help="Nombre de capteurs par simulateur")
+    parser.add_argument("--cycles", type=int, default=5, help="Nombre de cycles mesurés")
+    parser.add_argument("--sans-json", action="store_true", help="Mesurer la génération seule, sans encodage JSON")
+    arguments = parser.parse_args()
+    
+    # La population est dimensionnée avant l'import des simulateurs
+    os.environ["SIMULATION_ECHELLE"] = str(arguments.capteurs)
+    
+    print(f"{'simulateur':<18}{'scalaire (capteurs/s)':>24}{'vectorisé (capteurs/s)':>25}{'gain':>8}")
+    for nom in SIMULATEURS:
+        module = importlib.import_module(nom)
+        if not module.NUMPY_DISPONIBLE:
+            print("numpy non disponible: benchmark vectorisé impossible")
+            return
+        
+        duree_scalaire = mesurer(module.generer_lectures, arguments.cycles, not arguments.sans_json)
+        duree_vectorisee = mesurer(module.generer_lectures_vectorisees, arguments.cycles, not arguments.sans_json)
+        
+        debit_scalaire = arguments.capteurs / duree_scalaire
+        debit_vectorise = arguments.capteurs / duree_vectorisee
+        print(f"{nom:<18}{debit_scalaire:>24,.0f}{debit_vectorise:>25,.0f}{debit_vectorise / debit_scalaire:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Broker MQTT 3.1.1 minimal (asyncio, un seul thread) pour les tests de charge hors
+Mosquitto: CONNECT, PUBLISH (QoS 0, 1 et 2 en entrée, distribution en QoS 0),
+messages retenus, SUBSCRIBE/UNSUBSCRIBE avec jokers + et #, PINGREQ et DISCONNECT.
+Ni sessions persistantes, ni messages testament, ni authentification.
+
+À l'arrêt (SIGTERM ou SIGINT), les compteurs sont écrits en une ligne JSON sur
+la sortie standard.
+
+    python3 benchmarks/broker_mqtt.py [--port 1883] [--tampon-max 67108864]
+"""
+
+import argparse
+import asyncio
+import json
+import signal
+import struct
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+def encoder_longueur(longueur):
+    """Encode la longueur restante d'un paquet (entier de 1 à 4 octets, 7 bits par octet)."""
+    octets = bytearray()
+    while True:
+        octet = longueur % 128
+        longueur //= 128
+        octets.append(octet | 0x80 if longueur else octet)
+        if not longueur:
+            return bytes(octets)
+
+def encoder_chaine(texte):
+    """Encode une chaîne UTF-8 préfixée de sa longueur."""
+    donnees = texte.encode()
+    return struct.pack("!H", len(donnees)) + donnees
+
+def paquet_publish(topic, contenu, retenu=False):
+    """Construit un paquet PUBLISH en QoS 0."""
+    corps = encoder_chaine(topic) + contenu
+    return bytes([PUBLISH << 4 | (1 if retenu else 0)]) + encoder_longueur(len(corps)) + corps
+
+def correspond(filtre, niveaux):
+    """Indique si un topic (découpé en niveaux) correspond à un filtre d'abonnement découpé."""
+    for indice, element in enumerate(filtre):
+        if element == "#":
+            return True
+        if indice >= len(niveaux) or (element != "+" and element != niveaux[indice]):
+            return False
+    return len(filtre) == len(niveaux)
+
+class Broker:
+    """État partagé du broker: clients, abonnements, messages retenus et compteurs."""
+
+    def __init__(self, tampon_max):
+        self.tampon_max = tampon_max
+        self.clients = set()
+        self.retenus = {}
+        # Abonnés de chaque topic déjà rencontré, invalidé à chaque (dés)abonnement
+        self.cache_abonnes = {}
+        self.statistiques = {"connexions": 0, "recus": 0, "distribues": 0, "abandonnes": 0}
+
+    def invalider(self):
+        self.cache_abonnes.clear()
+
+    def abonnes(self, topic):
+        abonnes = self.cache_abonnes.get(topic)
+        if abonnes is None:
+            niveaux = topic.split("/")
+            abonnes = self.cache_abonnes[topic] = [
+                client for client in self.clients if any(correspond(filtre, niveaux) for filtre in client.filtres)
+            ]
+        return abonnes
+
+    def publier(self, topic, contenu, retenu):
+        self.statistiques["recus"] += 1
+        if retenu:
+            if contenu:
+                self.retenus[topic] = contenu
+            else:
+                self.retenus.pop(topic, None)
+        paquet = None
+        for client in self.abonnes(topic):
+            # QoS 0: un abonné trop lent perd les messages plutôt que de faire grossir son tampon
+            if client.transport.get_write_buffer_size() > self.tampon_max:
+                self.statistiques["abandonnes"] += 1
+                continue
+            if paquet is None:
+                paquet = paquet_publish(topic, contenu)
+            client.transport.write(paquet)
+            self.statistiques["distribues"] += 1
+
+class ConnexionClient(asyncio.Protocol):
+    """Connexion d'un client MQTT: découpe le flux en paquets et y répond."""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.transport = None
+        self.tampon = bytearray()
+        self.filtres = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exception):
+        if self in self.broker.clients:
+            self.broker.clients.discard(self)
+            self.broker.invalider()
+
+    def data_received(self, donnees):
+        self.tampon.extend(donnees)
+        position = 0
+        taille = len(self.tampon)
+        while taille - position >= 2:
+            # En-tête fixe: type et drapeaux, puis longueur restante sur 1 à 4 octets
+            entete = self.tampon[position]
+            longueur, multiplicateur, indice, complet = 0, 1, position + 1, False
+            while indice < taille and indice - position <= 4:
+                octet = self.tampon[indice]
+                indice += 1
+                longueur += (octet & 0x7F) * multiplicateur
+                if not octet & 0x80:
+                    complet = True
+                    break
+                multiplicateur *= 128
+            if not complet or taille - indice < longueur:
+                break
+            corps = bytes(self.tampon[indice:indice + longueur])
+            position = indice + longueur
+            if not self.traiter(entete >> 4, entete & 0x0F, corps):
+                self.transport.close()
+                return
+        del self.tampon[:position]
+
+    def traiter(self, type_paquet, drapeaux, corps):
+        """Traite un paquet. Retourne False pour fermer la connexion."""
+        if type_paquet == PUBLISH:
+            qos = (drapeaux >> 1) & 0x03
+            longueur_topic = struct.unpack_from("!H", corps)[0]
+            topic = corps[2:2 + longueur_topic].decode()
+            debut = 2 + longueur_topic
+            if qos:
+                identifiant = corps[debut:debut + 2]
+                debut += 2
+                self.transport.write(bytes([(PUBACK if qos == 1 else PUBREC) << 4, 2]) + identifiant)
+            self.broker.publier(topic, corps[debut:], bool(drapeaux & 0x01))
+        elif type_paquet == CONNECT:
+            self.broker.clients.add(self)
+            self.broker.invalider()
+            self.broker.statistiques["connexions"] += 1
+            self.transport.write(bytes([CONNACK << 4, 2, 0, 0]))
+        elif type_paquet == SUBSCRIBE:
+            identifiant, position, nouveaux = corps[:2], 2, []
+            while position < len(corps):
+                longueur = struct.unpack_from("!H", corps, position)[0]
+                nouveaux.append(corps[position + 2:position + 2 + longueur].decode())
+                position += 3 + longueur
+            self.filtres.extend(filtre.split("/") for filtre in nouveaux)
+            self.broker.invalider()
+            # Toutes les souscriptions sont accordées en QoS 0
+            self.transport.write(bytes([SUBACK << 4, 2 + len(nouveaux)]) + identifiant + bytes(len(nouveaux)))
+            for topic, contenu in list(self.broker.retenus.items()):
+                niveaux = topic.split("/")
+                if any(correspond(filtre.split("/"), niveaux) for filtre in nouveaux):
+                    self.transport.write(paquet_publish(topic, contenu, retenu=True))
+        elif type_paquet == UNSUBSCRIBE:
+            identifiant, position = corps[:2], 2
+            while position < len(corps):
+                longueur = struct.unpack_from("!H", corps, position)[0]
+                filtre = corps[position + 2:position + 2 + longueur].decode().split("/")
+                if filtre in self.filtres:
+                    self.filtres.remove(filtre)
+                position += 2 + longueur
+            self.broker.invalider()
+            self.transport.write(bytes([UNSUBACK << 4, 2]) + identifiant)
+        elif type_paquet == PUBREL:
+            self.transport.write(bytes([PUBCOMP << 4, 2]) + corps[:2])
+        elif type_paquet == PINGREQ:
+            self.transport.write(bytes([PINGRESP << 4, 0]))
+        elif type_paquet == DISCONNECT:
+            return False
+        return True
+
+async def servir(port, tampon_max):
+    """Démarre le broker et le fait tourner jusqu'à SIGTERM ou SIGINT."""
+    broker = Broker(tampon_max)
+    boucle = asyncio.get_running_loop()
+    serveur = await boucle.create_server(lambda: ConnexionClient(broker), "127.0.0.1", port)
+    arret = asyncio.Event()
+    for signal_arret in (signal.SIGTERM, signal.SIGINT):
+        boucle.add_signal_handler(signal_arret, arret.set)
+    async with serveur:
+        await arret.wait()
+    print(json.dumps(broker.statistiques), flush=True)
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Broker MQTT 3.1.1 minimal pour les tests de charge hors Mosquitto")
+    parser.add_argument("--port", type=int, default=1883, help="Port d'écoute (127.0.0.1)")
+    parser.add_argument("--tampon-max", type=int, default=64 * 1024 * 1024,
+                        help="Octets en attente par abonné au-delà desquels les messages sont abandonnés")
+    arguments = parser.parse_args()
+    asyncio.run(servir(arguments.port, arguments.tampon_max))
+
+if __name__ == "__main__":
+    main()
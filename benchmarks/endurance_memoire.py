@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Test d'endurance mémoire du stockage de l'API: plusieurs jours de trafic simulés en
+quelques minutes. Les messages synthétiques (lectures des simulateurs, datées d'une
+horloge simulée qui avance de l'intervalle de publication de chaque catégorie) passent
+par le vrai traitement de l'API (traiter_message), et le nettoyage (nettoyer_une_fois)
+est forcé toutes les PERIODE_NETTOYAGE secondes simulées.
+
+La RSS du processus et le nombre de points d'historique sont relevés à intervalles
+réguliers, juste avant le nettoyage éventuellement dû (au sommet de la dent de scie);
+avec --tracemalloc, la mémoire suivie par tracemalloc et les principaux sites
+d'allocation le sont aussi. Le test échoue (code de sortie 1) si, une fois
+l'historique rempli (après DUREE_CONSERVATION), la mémoire ne plafonne pas: points
+d'historique au-delà de la borne théorique pour le nombre de capteurs et la durée de
+conservation, croissance de la mémoire au-delà de --tolerance, ou RSS au-delà de --borne-mo.
+
+    python3 benchmarks/endurance_memoire.py [--capteurs 300] [--jours 3] [--conservation 86400]
+    python3 benchmarks/endurance_memoire.py --tracemalloc --borne-mo 400 --sortie endurance.json
+"""
+
+import argparse
+import heapq
+import json
+import linecache
+import os
+import sys
+import time
+import tracemalloc
+
+from bench_bout_en_bout import SOURCES, formater_octets, mesurer_processus, repartir_capteurs
+from environnement import decrire_environnement
+
+# Les simulateurs (importés par bench_bout_en_bout) et l'API ont chacun leur module config
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+del sys.modules["config"]
+sys.path.insert(0, os.path.join(RACINE_PROJET, "api"))
+import app
+from config import INTERVALLES_ATTENDUS
+
+JOUR = 86400
+NOMBRE_SITES = 8    # Sites d'allocation affichés à chaque relevé tracemalloc
+
+def borne_points(capteurs, conservation, periode_nettoyage):
+    """Nombre maximal de points d'historique en mémoire, une fois l'historique rempli.
+
+    Juste avant un nettoyage, un capteur conserve les points de la durée de
+    conservation plus ceux publiés depuis le nettoyage précédent.
+    """
+    return sum((conservation + periode_nettoyage) // INTERVALLES_ATTENDUS[categorie] + 1
+               for _, categorie in capteurs)
+
+def nom_fichier(chemin):
+    """Chemin relatif à la racine du projet pour ses fichiers, nom du module pour les autres."""
+    if chemin.startswith(RACINE_PROJET + os.sep):
+        return os.path.relpath(chemin, RACINE_PROJET)
+    return os.path.basename(chemin)
+
+def sites_allocation(instantane, precedent):
+    """Principaux sites d'allocation (fichier:ligne), avec leur évolution depuis le relevé précédent."""
+    filtres = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, linecache.__file__),
+               tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+    instantane = instantane.filter_traces(filtres)
+    if precedent is None:
+        statistiques = instantane.statistics("lineno")
+    else:
+        statistiques = instantane.compare_to(precedent, "lineno")
+    sites = [{
+        "site": f"{nom_fichier(statistique.traceback[0].filename)}:{statistique.traceback[0].lineno}",
+        "octets": statistique.size,
+        "blocs": statistique.count,
+        "evolution": getattr(statistique, "size_diff", None)
+    } for statistique in statistiques[:NOMBRE_SITES]]
+    return sites, instantane
+
+def relever(temps_simule, debut_simule, messages, avec_tracemalloc):
+    """Relève la mémoire du processus et la taille de l'historique."""
+    processus = mesurer_processus(os.getpid())
+    historique = app.mesurer_historique()
+    return {
+        "heures": (temps_simule - debut_simule) / 3600,
+        "messages": messages,
+        "points": sum(points for points, _ in historique.values()),
+        "octets_historique": sum(octets for _, octets in historique.values()),
+        "rss": processus["rss"] if processus else None,
+        "tracemalloc": tracemalloc.get_traced_memory()[0] if avec_tracemalloc else None
+    }
+
+def afficher_releve(releve):
+    tracee = "" if releve["tracemalloc"] is None else f", tracemalloc {formater_octets(releve['tracemalloc'])}"
+    print(f"{releve['heures']:>8.1f} h {releve['messages']:>10} msg {releve['points']:>10} points "
+          f"(~{formater_octets(releve['octets_historique'])}), RSS {formater_octets(releve['rss'])}{tracee}")
+
+def verifier(releves, debut_permanent, points_max, tolerance, borne_mo):
+    """Vérifie le plafonnement de la mémoire en régime permanent. Retourne la liste des échecs."""
+    permanent = [releve for releve in releves if releve["heures"] * 3600 >= debut_permanent]
+    if len(permanent) < 4:
+        return ["Durée simulée insuffisante pour atteindre le régime permanent: augmenter --jours"]
+
+    echecs = []
+    points = max(releve["points"] for releve in permanent)
+    if points > points_max:
+        echecs.append(f"{points} points d'historique en mémoire, au-delà de la borne de {points_max}")
+
+    # Le maximum de la seconde moitié du régime permanent ne doit pas dépasser celui de la première.
+    # Avec tracemalloc, la RSS inclut ses propres structures (et ses instantanés): seule la mémoire suivie compte.
+    moitie = len(permanent) // 2
+    for mesure in ("tracemalloc",) if permanent[0]["tracemalloc"] is not None else ("rss",):
+        if permanent[0][mesure] is None:
+            continue
+        premier = max(releve[mesure] for releve in permanent[:moitie])
+        second = max(releve[mesure] for releve in permanent[moitie:])
+        croissance = second / premier - 1
+        print(f"Croissance {mesure} en régime permanent: {croissance:+.1%} "
+              f"({formater_octets(premier)} -> {formater_octets(second)})")
+        if croissance > tolerance:
+            echecs.append(f"Croissance {mesure} de {croissance:.1%} en régime permanent, au-delà de {tolerance:.0%}")
+
+    rss = [releve["rss"] for releve in releves if releve["rss"] is not None]
+    if borne_mo is not None and rss and max(rss) > borne_mo * 1024 * 1024:
+        echecs.append(f"RSS maximale de {formater_octets(max(rss))}, au-delà de la borne de {borne_mo} Mio")
+    return echecs
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Test d'endurance mémoire du stockage de l'API sur plusieurs jours de trafic simulés")
+    parser.add_argument("--capteurs", type=int, default=300, help="Nombre de capteurs simulés")
+    parser.add_argument("--jours", type=float, default=3, help="Durée de trafic simulée (en jours)")
+    parser.add_argument("--conservation", type=int, default=app.DUREE_CONSERVATION,
+                        help="DUREE_CONSERVATION de l'API (en secondes)")
+    parser.add_argument("--periode-nettoyage", type=int, default=app.PERIODE_NETTOYAGE,
+                        help="PERIODE_NETTOYAGE de l'API (en secondes simulées)")
+    parser.add_argument("--periode-releve", type=int, default=1800,
+                        help="Période des relevés mémoire (en secondes simulées)")
+    parser.add_argument("--periode-sites", type=int, default=6 * 3600,
+                        help="Période des relevés des sites d'allocation (en secondes simulées)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Suivre les allocations avec tracemalloc (plusieurs fois plus lent)")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="Croissance tolérée de la mémoire en régime permanent (0.05 = 5 %%)")
+    parser.add_argument("--borne-mo", type=float, help="RSS maximale tolérée (en Mio)")
+    parser.add_argument("--sortie", help="Fichier JSON où enregistrer les relevés")
+    arguments = parser.parse_args()
+
+    # Les messages de l'API (alertes, capteurs périmés...) ne doivent pas se mêler aux relevés
+    app.logger.disabled = True
+    app.DUREE_CONSERVATION = arguments.conservation
+    avec_tracemalloc = arguments.tracemalloc
+    if avec_tracemalloc:
+        tracemalloc.start()
+
+    capteurs = repartir_capteurs(arguments.capteurs, list(SOURCES), 1)[0]
+    modeles = {categorie: generer() for categorie, (_, generer) in SOURCES.items()}
+    duree = arguments.jours * JOUR
+    debut_simule = time.time() - duree
+    fin_simulee = debut_simule + duree
+    points_max = borne_points(capteurs, arguments.conservation, arguments.periode_nettoyage)
+    debut_permanent = arguments.conservation + arguments.periode_nettoyage
+
+    # Prochaine publication de chaque capteur; les premières sont étalées sur un intervalle
+    echeances = [(debut_simule + INTERVALLES_ATTENDUS[categorie] * indice / len(capteurs), indice)
+                 for indice, (_, categorie) in enumerate(capteurs)]
+    heapq.heapify(echeances)
+    prochain_nettoyage = debut_simule + arguments.periode_nettoyage
+    prochain_releve = debut_simule
+    prochains_sites = debut_simule + debut_permanent
+
+    print(f"{arguments.capteurs} capteurs, {arguments.jours:g} jours simulés, conservation {arguments.conservation} s, "
+          f"nettoyage toutes les {arguments.periode_nettoyage} s; borne: {points_max} points d'historique")
+    releves, sites, instantane_precedent = [], [], None
+    messages = 0
+    chrono = time.perf_counter()
+    while echeances[0][0] < fin_simulee:
+        instant, indice = heapq.heappop(echeances)
+        topic, categorie = capteurs[indice]
+
+        if instant >= prochain_releve:
+            releves.append(relever(instant, debut_simule, messages, avec_tracemalloc))
+            afficher_releve(releves[-1])
+            prochain_releve += arguments.periode_releve
+        if avec_tracemalloc and instant >= prochains_sites:
+            courants, instantane_precedent = sites_allocation(tracemalloc.take_snapshot(), instantane_precedent)
+            sites.append({"heures": (instant - debut_simule) / 3600, "sites": courants})
+            for site in courants:
+                evolution = "" if site["evolution"] is None else f" ({site['evolution'] / 1024:+.0f} Kio)"
+                print(f"           {site['site']:<48}{formater_octets(site['octets']):>12}{evolution}")
+            prochains_sites += arguments.periode_sites
+        while prochain_nettoyage <= instant:
+            app.nettoyer_une_fois(prochain_nettoyage)
+            prochain_nettoyage += arguments.periode_nettoyage
+
+        donnees = dict(modeles[categorie])
+        donnees["timestamp"] = instant
+        app.traiter_message(topic, json.dumps(donnees, ensure_ascii=False).encode())
+        messages += 1
+        heapq.heappush(echeances, (instant + INTERVALLES_ATTENDUS[categorie], indice))
+
+    releves.append(relever(fin_simulee, debut_simule, messages, avec_tracemalloc))
+    afficher_releve(releves[-1])
+    duree_reelle = time.perf_counter() - chrono
+    print(f"\n{messages} messages traités en {duree_reelle:.0f} s ({messages / duree_reelle:.0f} msg/s, "
+          f"{duree / duree_reelle:.0f} fois le temps réel)")
+
+    echecs = verifier(releves, debut_permanent, points_max, arguments.tolerance, arguments.borne_mo)
+    if arguments.sortie:
+        with open(arguments.sortie, "w", encoding="utf-8") as fichier:
+            json.dump({
+                "environnement": decrire_environnement(),
+                "parametres": {"capteurs": arguments.capteurs, "jours": arguments.jours,
+                               "conservation": arguments.conservation, "periode_nettoyage": arguments.periode_nettoyage,
+                               "tracemalloc": avec_tracemalloc, "borne_points": points_max},
+                "releves": releves,
+                "sites_allocation": sites,
+                "echecs": echecs
+            }, fichier, indent=2, ensure_ascii=False)
+        print(f"Relevés enregistrés dans {arguments.sortie}")
+
+    for echec in echecs:
+        print(f"ÉCHEC: {echec}")
+    if echecs:
+        return 1
+    print("La mémoire plafonne en régime permanent")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
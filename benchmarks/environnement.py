@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+"""
+Description de la machine et du code mesurés, enregistrée avec les résultats des benchmarks
+pour que des mesures prises sur des machines ou des commits différents restent comparables.
+"""
+
+import datetime
+import os
+import platform
+import subprocess
+
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def version_module(nom):
+    """Retourne la version d'un module installé, ou None."""
+    try:
+        return __import__(nom).__version__
+    except (ImportError, AttributeError):
+        return None
+
+def decrire_environnement():
+    """Caractéristiques de la machine et du code mesurés, enregistrées avec les résultats."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=RACINE_PROJET, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "systeme": platform.platform(),
+        "machine": platform.machine(),
+        "processeur": platform.processor() or None,
+        "coeurs": os.cpu_count(),
+        "numpy": version_module("numpy"),
+        "geopy": version_module("geopy")
+    }
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Suite de micro-benchmarks des fonctions critiques du projet, exécutable hors ligne
+(sans broker MQTT): traitement des messages MQTT par l'API pour chaque catégorie,
+nettoyage de l'historique, filtres /historique, génération des données de chaque
+simulateur, déplacement des bus et taxis et calcul de distance GPS (avec et sans geopy).
+
+Les résultats (secondes par opération) sont enregistrés en JSON avec les
+caractéristiques de l'environnement, et comparés à une référence: le script
+échoue (code de sortie 1) si une mesure régresse de plus de --seuil. Sans fichier
+de référence, il se contente d'un avertissement, sauf avec --exiger-reference (CI).
+
+    python3 benchmarks/suite_micro.py --enregistrer-reference          # crée la référence
+    python3 benchmarks/suite_micro.py [--filtre au_message] [--sortie resultats.json] [--seuil 0.15]
+    python3 benchmarks/suite_micro.py --exiger-reference               # échoue sans référence
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import timeit
+
+from environnement import decrire_environnement
+
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REFERENCE_PAR_DEFAUT = os.path.join(RACINE_PROJET, "benchmarks", "reference_micro.json")
+
+# Les simulateurs et l'API ont chacun leur module config: les simulateurs sont importés
+# en premier (avec la configuration racine, lue à l'import), puis l'API avec la sienne.
+sys.path.insert(0, os.path.join(RACINE_PROJET, "capteurs"))
+import capteur_batiments
+import capteur_meteo
+import capteur_parking
+import capteur_transport
+import capteur_wifi
+from config import TOPIC_PARKING, TOPIC_BATIMENTS, TOPIC_WIFI, TOPIC_METEO, TOPIC_TRANSPORT
+from publication import estampiller
+
+del sys.modules["config"]
+sys.path.insert(0, os.path.join(RACINE_PROJET, "api"))
+import app
+from categories import CATEGORIES, sous_dictionnaire
+
+# Nombre de capteurs simulés par catégorie pour le traitement des messages
+NOMBRE_CAPTEURS = 1000
+
+# Calcul de distance choisi à l'import du simulateur de transport (geopy s'il est installé)
+GEOPY_INITIAL = capteur_transport.GEOPY_DISPONIBLE
+
+class MessageSynthetique:
+    """Message ayant les attributs lus par l'API sur un paho.mqtt.client.MQTTMessage."""
+
+    __slots__ = ("topic", "payload", "retain")
+
+    def __init__(self, topic, payload, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.retain = retain
+
+def reinitialiser_api():
+    """Vide les données courantes et l'historique de l'API entre deux benchmarks."""
+    with app.verrou_donnees:
+        for categorie in CATEGORIES:
+            sous_dictionnaire(app.donnees_capteurs, categorie).clear()
+            sous_dictionnaire(app.historique_donnees, categorie).clear()
+
+# Lectures d'un capteur de chaque catégorie: (topic de base, générateur de données)
+SOURCES_MESSAGES = {
+    "parking": (TOPIC_PARKING, lambda: capteur_parking.generer_donnees_parking(capteur_parking.PARKINGS[0])),
+    "batiments": (TOPIC_BATIMENTS, lambda: capteur_batiments.generer_donnees_batiment(capteur_batiments.BATIMENTS[0])),
+    "wifi": (TOPIC_WIFI, lambda: capteur_wifi.generer_donnees_wifi(capteur_wifi.POINTS_ACCES[0])),
+    "meteo": (TOPIC_METEO, lambda: capteur_meteo.generer_donnees_meteo(capteur_meteo.STATIONS_METEO[0])),
+    "bus": (f"{TOPIC_TRANSPORT}/bus", lambda: capteur_transport.generer_donnees_bus(capteur_transport.BUS[0])),
+    "taxi": (f"{TOPIC_TRANSPORT}/taxi", lambda: capteur_transport.generer_donnees_taxi(capteur_transport.TAXIS[0]))
+}
+
+def preparer_au_message(categorie):
+    """Traitement par au_message de NOMBRE_CAPTEURS messages d'une catégorie (un par capteur)."""
+    reinitialiser_api()
+    topic_base, generer = SOURCES_MESSAGES[categorie]
+    messages = []
+    for i in range(NOMBRE_CAPTEURS):
+        topic = f"{topic_base}/capteur_{i}"
+        messages.append(MessageSynthetique(topic, json.dumps(estampiller(topic, generer())).encode()))
+
+    def executer():
+        for message in messages:
+            app.au_message(None, None, message)
+    return executer, len(messages)
+
+def remplir_historique(categorie, nombre_points, debut, pas):
+    """Remplit l'historique en mémoire d'une catégorie: NOMBRE_CAPTEURS capteurs, nombre_points au total."""
+    reinitialiser_api()
+    points_par_capteur = max(1, nombre_points // NOMBRE_CAPTEURS)
+    with app.verrou_donnees:
+        historique = sous_dictionnaire(app.historique_donnees, categorie)
+        for i in range(NOMBRE_CAPTEURS):
+            historique[f"capteur_{i}"] = [
+                {"timestamp": debut + j * pas, "temperature": 15.0 + (j % 10), "humidite": 50 + (j % 20)}
+                for j in range(points_par_capteur)
+            ]
+
+def preparer_nettoyage(nombre_points):
+    """Un cycle de nettoyage (nettoyer_une_fois) sur un historique de nombre_points points non expirés."""
+    maintenant = time.time()
+    remplir_historique("meteo", nombre_points, maintenant - app.DUREE_CONSERVATION / 2, 1)
+    return lambda: app.nettoyer_une_fois(maintenant), 1
+
+def preparer_historique(mode):
+    """Lectures de l'historique d'un capteur (24 h, un point par minute), filtré sur une heure ou complet."""
+    maintenant = time.time()
+    debut = maintenant - 86400
+    remplir_historique("meteo", NOMBRE_CAPTEURS * 1440, debut, 60)
+    capteurs = [f"capteur_{i}" for i in random.Random(0).sample(range(NOMBRE_CAPTEURS), 100)]
+    fenetre = (debut + 43200, debut + 46800)
+
+    if mode == "fonction_fenetre":
+        def executer():
+            for capteur_id in capteurs:
+                app.lire_historique("meteo", capteur_id, *fenetre)
+    elif mode == "fonction_complet":
+        def executer():
+            for capteur_id in capteurs:
+                app.lire_historique("meteo", capteur_id)
+    else:
+        client = app.app.test_client()
+        def executer():
+            for capteur_id in capteurs:
+                client.get(f"/api/meteo/{capteur_id}/historique?debut={fenetre[0]}&fin={fenetre[1]}")
+    return executer, len(capteurs)
+
+# Génération des données d'un cycle de chaque simulateur: (population, fonction de génération)
+GENERATEURS = {
+    "parking": (lambda: capteur_parking.PARKINGS, capteur_parking.generer_donnees_parking),
+    "batiment": (lambda: capteur_batiments.BATIMENTS, capteur_batiments.generer_donnees_batiment),
+    "wifi": (lambda: capteur_wifi.POINTS_ACCES, capteur_wifi.generer_donnees_wifi),
+    "meteo": (lambda: capteur_meteo.STATIONS_METEO, capteur_meteo.generer_donnees_meteo),
+    "bus": (lambda: capteur_transport.BUS, capteur_transport.generer_donnees_bus),
+    "taxi": (lambda: capteur_transport.TAXIS, capteur_transport.generer_donnees_taxi)
+}
+
+def preparer_generation(nom):
+    """Génération des données de toute la population d'un simulateur."""
+    population, generer = GENERATEURS[nom]
+    elements = list(population())
+    # Les bus calculent des distances: mesurés avec le calcul par défaut du simulateur
+    capteur_transport.GEOPY_DISPONIBLE = GEOPY_INITIAL
+
+    def executer():
+        for element in elements:
+            generer(element)
+    return executer, len(elements)
+
+def choisir_geopy(avec_geopy):
+    """Sélectionne le calcul de distance du simulateur de transport. Retourne False si geopy manque."""
+    if avec_geopy and "geodesic" not in vars(capteur_transport):
+        return False
+    capteur_transport.GEOPY_DISPONIBLE = avec_geopy
+    return True
+
+def preparer_deplacement(vehicule, avec_geopy):
+    """Mise à jour de la position de tous les bus ou taxis pour un pas de 15 s."""
+    if not choisir_geopy(avec_geopy):
+        return None
+    if vehicule == "bus":
+        vehicules, deplacer = capteur_transport.BUS, capteur_transport.mettre_a_jour_position_bus
+    else:
+        vehicules, deplacer = capteur_transport.TAXIS, capteur_transport.mettre_a_jour_position_taxi
+
+    def executer():
+        for element in vehicules:
+            deplacer(element, 15)
+    return executer, len(vehicules)
+
+def preparer_distance(avec_geopy):
+    """Calcul de distance entre 1000 paires de points de l'agglomération."""
+    if not choisir_geopy(avec_geopy):
+        return None
+    generateur = random.Random(0)
+    paires = [
+        tuple({"latitude": 48.85 + generateur.uniform(-0.1, 0.1), "longitude": 2.35 + generateur.uniform(-0.1, 0.1)}
+              for _ in range(2))
+        for _ in range(1000)
+    ]
+
+    def executer():
+        for point1, point2 in paires:
+            capteur_transport.calculer_distance_gps(point1, point2)
+    return executer, len(paires)
+
+# Benchmarks de la suite: nom -> préparation (retourne (fonction, opérations par appel), ou None si impossible)
+BENCHMARKS = {}
+for _categorie in CATEGORIES:
+    BENCHMARKS[f"au_message[{_categorie}]"] = lambda categorie=_categorie: preparer_au_message(categorie)
+for _nombre in (10000, 100000, 500000):
+    BENCHMARKS[f"nettoyage[{_nombre} points]"] = lambda nombre=_nombre: preparer_nettoyage(nombre)
+for _mode in ("fonction_fenetre", "fonction_complet", "route_fenetre"):
+    BENCHMARKS[f"historique[{_mode}]"] = lambda mode=_mode: preparer_historique(mode)
+for _nom in GENERATEURS:
+    BENCHMARKS[f"generer_donnees[{_nom}]"] = lambda nom=_nom: preparer_generation(nom)
+for _geopy in (True, False):
+    _suffixe = "geopy" if _geopy else "haversine"
+    for _vehicule in ("bus", "taxi"):
+        BENCHMARKS[f"mettre_a_jour_position_{_vehicule}[{_suffixe}]"] = (
+            lambda vehicule=_vehicule, geopy=_geopy: preparer_deplacement(vehicule, geopy))
+    BENCHMARKS[f"calculer_distance_gps[{_suffixe}]"] = lambda geopy=_geopy: preparer_distance(geopy)
+
+def mesurer(preparer, repetitions):
+    """Exécute un benchmark. Retourne ses résultats en secondes par opération, ou None s'il est ignoré."""
+    random.seed(0)
+    preparation = preparer()
+    if preparation is None:
+        return None
+    fonction, operations = preparation
+
+    minuteur = timeit.Timer(fonction)
+    # Nombre d'appels par répétition pour qu'une répétition dure au moins 0,2 s
+    nombre, _ = minuteur.autorange()
+    durees = [duree / (nombre * operations) for duree in minuteur.repeat(repetitions, nombre)]
+    return {
+        "min": min(durees),
+        "mediane": statistics.median(durees),
+        "operations": nombre * operations * repetitions
+    }
+
+def comparer(resultats, reference, seuil):
+    """Affiche la comparaison avec la référence. Retourne les noms des benchmarks en régression."""
+    regressions = []
+    print(f"\n{'benchmark':<44}{'référence (µs/op)':>19}{'actuel (µs/op)':>16}{'écart':>9}")
+    for nom, resultat in resultats.items():
+        precedent = reference.get(nom)
+        if resultat is None or precedent is None:
+            etat = "ignoré" if resultat is None else "nouveau"
+            print(f"{nom:<44}{'-':>19}{'-':>16}  {etat}")
+            continue
+        ecart = resultat["min"] / precedent["min"] - 1
+        alerte = ""
+        if ecart > seuil:
+            regressions.append(nom)
+            alerte = "  RÉGRESSION"
+        print(f"{nom:<44}{precedent['min'] * 1e6:>19.3f}{resultat['min'] * 1e6:>16.3f}{ecart:>+9.1%}{alerte}")
+    return regressions
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks hors ligne des fonctions critiques, comparés à une référence")
+    parser.add_argument("--filtre", action="append", help="N'exécuter que les benchmarks dont le nom contient ce texte")
+    parser.add_argument("--repetitions", type=int, default=5, help="Répétitions de chaque mesure (la meilleure compte)")
+    parser.add_argument("--sortie", help="Fichier JSON où enregistrer les résultats")
+    parser.add_argument("--reference", default=REFERENCE_PAR_DEFAUT, help="Fichier JSON de référence à comparer")
+    parser.add_argument("--enregistrer-reference", action="store_true",
+                        help="Enregistrer les résultats comme nouvelle référence au lieu de comparer")
+    parser.add_argument("--exiger-reference", action="store_true",
+                        help="Échouer (code de sortie 1) si le fichier de référence est absent")
+    parser.add_argument("--seuil", type=float, default=0.15,
+                        help="Ralentissement toléré par rapport à la référence (0.15 = 15 %%)")
+    parser.add_argument("--lister", action="store_true", help="Lister les benchmarks sans les exécuter")
+    arguments = parser.parse_args()
+
+    noms = [nom for nom in BENCHMARKS if not arguments.filtre or any(texte in nom for texte in arguments.filtre)]
+    if arguments.lister:
+        print("\n".join(noms))
+        return 0
+
+    # Les messages de l'API (alertes, capteurs périmés...) ne doivent pas se mêler aux mesures
+    app.logger.disabled = True
+
+    print(f"{'benchmark':<44}{'min (µs/op)':>14}{'médiane (µs/op)':>18}")
+    resultats = {}
+    for nom in noms:
+        resultat = mesurer(BENCHMARKS[nom], arguments.repetitions)
+        resultats[nom] = resultat
+        if resultat is None:
+            print(f"{nom:<44}{'ignoré (dépendance absente)':>32}")
+        else:
+            print(f"{nom:<44}{resultat['min'] * 1e6:>14.3f}{resultat['mediane'] * 1e6:>18.3f}")
+    reinitialiser_api()
+
+    document = {
+        "environnement": decrire_environnement(),
+        "repetitions": arguments.repetitions,
+        "unite": "secondes par opération",
+        "resultats": resultats
+    }
+    chemins = [arguments.sortie] if arguments.sortie else []
+    if arguments.enregistrer_reference:
+        chemins.append(arguments.reference)
+    for chemin in chemins:
+        with open(chemin, "w", encoding="utf-8") as fichier:
+            json.dump(document, fichier, indent=2, ensure_ascii=False)
+        print(f"Résultats enregistrés dans {chemin}")
+
+    if arguments.enregistrer_reference:
+        return 0
+    if not os.path.exists(arguments.reference):
+        print(f"\n{'ÉCHEC' if arguments.exiger_reference else 'ATTENTION'}: aucune référence trouvée "
+              f"({arguments.reference}), aucune régression n'a pu être détectée. "
+              f"Pour la créer: python3 benchmarks/suite_micro.py --enregistrer-reference")
+        return 1 if arguments.exiger_reference else 0
+    with open(arguments.reference, encoding="utf-8") as fichier:
+        reference = json.load(fichier)
+    print(f"Référence: {arguments.reference} (commit {reference['environnement'].get('commit')}, "
+          f"{reference['environnement'].get('date')})")
+    regressions = comparer(resultats, reference["resultats"], arguments.seuil)
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de {arguments.seuil:.0%}: {', '.join(regressions)}")
+        return 1
+    print(f"\nAucune régression au-delà de {arguments.seuil:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
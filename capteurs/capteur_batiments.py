@@ -18,7 +18,10 @@ import os
 
 # Ajout du répertoire parent au path pour importer config.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_BATIMENTS, INTERVALLE_BATIMENTS
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_BATIMENTS, INTERVALLE_BATIMENTS, MODE_LOT, PUBLICATION_RETENUE
+from publication import LotLectures, TamponPublication, estampiller
+import horloge
+import population
 
 # Liste des bâtiments à simuler
 BATIMENTS = [
@@ -49,6 +52,37 @@ BATIMENTS = [
     }
 ]
 
+# Types de salles utilisés pour la population à grande échelle (fonction, capacité min, max)
+TYPES_SALLES = [
+    ("Salle de Cours", 20, 60),
+    ("Laboratoire", 15, 30),
+    ("Salle Informatique", 15, 30),
+    ("Salle de Réunion", 6, 20),
+    ("Bureau Administratif", 2, 10),
+    ("Bibliothèque", 30, 120)
+]
+
+def fabriquer_batiment(index, rng):
+    """Génère la description d'un bâtiment de la population à grande échelle."""
+    latitude, longitude, quartier = population.position_aleatoire(rng, dispersion_km=0.4)
+    salles = []
+    for numero in range(rng.randint(2, 12)):
+        fonction, capacite_min, capacite_max = rng.choice(TYPES_SALLES)
+        salles.append({
+            "nom": f"Salle {numero // 4 + 1}{numero % 4 + 1:02d}",
+            "fonction": fonction,
+            "capacite": rng.randint(capacite_min, capacite_max)
+        })
+    return {
+        "nom": f"Batiment Q{quartier:03d}-{index:05d}",
+        "latitude": latitude,
+        "longitude": longitude,
+        "salles": salles
+    }
+
+BATIMENTS = population.charger("batiments", BATIMENTS, fabriquer_batiment)
+GRANDE_ECHELLE = not isinstance(BATIMENTS, list)
+
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
     # Génération d'un ID client unique
@@ -63,12 +97,15 @@ def connecter_mqtt():
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
-    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    
+    # Connexion asynchrone: la boucle réseau réessaie tant que le broker est injoignable
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(BROKER_ADRESSE, BROKER_PORT)
     return client
 
 def generer_horaires():
     """Génère des horaires d'ouverture et de fermeture réalistes."""
-    jour_actuel = datetime.datetime.now().weekday()
+    jour_actuel = horloge.datetime_actuelle().weekday()
     
     # Weekend (samedi=5, dimanche=6)
     if jour_actuel >= 5:
@@ -89,7 +126,7 @@ def generer_horaires():
         heure_fermeture = f"{random.randint(17, 20)}:00"
     
     # Déterminer si le bâtiment est actuellement ouvert
-    heure_actuelle = datetime.datetime.now().time()
+    heure_actuelle = horloge.datetime_actuelle().time()
     heure_ouv = datetime.datetime.strptime(heure_ouverture, "%H:%M").time()
     heure_ferm = datetime.datetime.strptime(heure_fermeture, "%H:%M").time()
     est_ouvert = heure_ouv <= heure_actuelle <= heure_ferm
@@ -142,37 +179,55 @@ def generer_donnees_batiment(batiment):
         for salle in batiment["salles"]:
             salles_donnees.append(generer_donnees_salle(salle))
     
-    return {
+    donnees = {
         "nom": batiment["nom"],
         "est_ouvert": horaires["est_ouvert"],
         "heure_ouverture": horaires["heure_ouverture"],
         "heure_fermeture": horaires["heure_fermeture"],
         "salles": salles_donnees,
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
     }
+    
+    # Les bâtiments générés à grande échelle sont géolocalisés
+    if "latitude" in batiment:
+        donnees["latitude"] = batiment["latitude"]
+        donnees["longitude"] = batiment["longitude"]
+    
+    return donnees
 
-def publier(client):
+def publier(tampon):
     """Publie périodiquement les données de tous les bâtiments."""
     while True:
         try:
+            # En mode lot, les lectures du cycle sont regroupées dans un seul message
+            lot = LotLectures(tampon, TOPIC_BATIMENTS) if MODE_LOT else None
+            
             for batiment in BATIMENTS:
                 donnees = generer_donnees_batiment(batiment)
-                message = json.dumps(donnees, ensure_ascii=False)
-                topic = f"{TOPIC_BATIMENTS}/{batiment['nom'].replace(' ', '_').lower()}"
-                result = client.publish(topic, message)
+                cle = batiment['nom'].replace(' ', '_').lower()
+                if lot is not None:
+                    lot.ajouter(cle, donnees)
+                    continue
+                
+                topic = f"{TOPIC_BATIMENTS}/{cle}"
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque bâtiment
-                time.sleep(1)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(1)
+            
+            if lot is not None:
+                lot.vider()
                 
             # Attente avant la prochaine série de publications
-            time.sleep(INTERVALLE_BATIMENTS)
+            horloge.dormir(INTERVALLE_BATIMENTS)
             
         except Exception as e:
             print(f"Erreur: {e}")
@@ -181,8 +236,9 @@ def publier(client):
 def executer():
     """Fonction principale du simulateur."""
     client = connecter_mqtt()
+    tampon = TamponPublication(client, "batiments")
     client.loop_start()
-    publier(client)
+    publier(tampon)
 
 if __name__ == '__main__':
     print("Démarrage du simulateur de capteurs de bâtiments scolaires...")
@@ -11,14 +11,26 @@ import random
 import time
 import uuid
 import math
-from datetime import datetime
 from paho.mqtt import client as mqtt_client
 import sys
 import os
 
 # Ajout du répertoire parent au path pour importer config.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_METEO, INTERVALLE_METEO
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_METEO, INTERVALLE_METEO, MODE_LOT, PUBLICATION_RETENUE, MODE_VECTORISE
+from publication import LotLectures, TamponPublication, estampiller
+import horloge
+import population
+
+# NumPy n'est nécessaire que pour le mode vectorisé
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+    if MODE_VECTORISE:
+        print("Warning: numpy non disponible, le mode vectorisé est désactivé")
+VECTORISE = MODE_VECTORISE and NUMPY_DISPONIBLE
 
 # Liste des stations météo à simuler
 STATIONS_METEO = [
@@ -27,6 +39,19 @@ STATIONS_METEO = [
     {"id": "METEO003", "nom": "Station Annexe Sud", "latitude": 48.8496, "longitude": 2.3523}
 ]
 
+def fabriquer_station(index, rng):
+    """Génère la description d'une station de la population à grande échelle."""
+    latitude, longitude, quartier = population.position_aleatoire(rng, dispersion_km=2.0)
+    return {
+        "id": f"METEO{index:06d}",
+        "nom": f"Station Q{quartier:03d}-{index:06d}",
+        "latitude": latitude,
+        "longitude": longitude
+    }
+
+STATIONS_METEO = population.charger("meteo", STATIONS_METEO, fabriquer_station)
+GRANDE_ECHELLE = not isinstance(STATIONS_METEO, list)
+
 # États possibles du ciel
 ETATS_CIEL = ["Ensoleillé", "Partiellement nuageux", "Nuageux", "Couvert", "Brumeux", 
               "Pluvieux", "Orageux", "Neigeux"]
@@ -35,6 +60,7 @@ ETATS_CIEL = ["Ensoleillé", "Partiellement nuageux", "Nuageux", "Couvert", "Bru
 tendance_temperature = random.uniform(-0.5, 0.5)  # Tendance de variation par heure
 tendance_humidite = random.uniform(-2, 2)  # Tendance de variation par heure
 derniere_meteo = {}  # Pour stocker les dernières valeurs générées par station
+temperature_base = None  # Température de saison commune à toutes les stations
 
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
@@ -50,15 +76,23 @@ def connecter_mqtt():
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
-    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    
+    # Connexion asynchrone: la boucle réseau réessaie tant que le broker est injoignable
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(BROKER_ADRESSE, BROKER_PORT)
     return client
 
 def initialiser_meteo():
     """Initialise les données météo pour toutes les stations."""
-    global derniere_meteo
-    
+    global temperature_base
+    temperature_base = None
+    for station in STATIONS_METEO:
+        initialiser_station(station)
+
+def calculer_temperature_base():
+    """Tire une température de base réaliste pour la saison simulée."""
     # Obtenir le mois actuel pour des données saisonnières réalistes
-    mois_actuel = datetime.now().month
+    mois_actuel = horloge.datetime_actuelle().month
     
     # Températures de base selon la saison (hémisphère nord)
     if 3 <= mois_actuel <= 5:  # Printemps
@@ -70,54 +104,61 @@ def initialiser_meteo():
     else:  # Hiver
         temp_base = random.uniform(-5, 10)
     
-    # Initialiser les données pour chaque station
-    for station in STATIONS_METEO:
-        # Légère variation entre stations
-        temp_variation = random.uniform(-2, 2)
-        temperature = round(temp_base + temp_variation, 1)
-        
-        humidite = random.randint(30, 90)
-        pression = random.uniform(990, 1030)
-        
-        # L'état du ciel est influencé par l'humidité
-        if humidite > 80:
-            etats_possibles = ["Couvert", "Pluvieux", "Brumeux", "Orageux"]
-        elif humidite > 60:
-            etats_possibles = ["Partiellement nuageux", "Nuageux", "Couvert"]
-        else:
-            etats_possibles = ["Ensoleillé", "Partiellement nuageux"]
-        
-        etat_ciel = random.choice(etats_possibles)
-        
-        # Vitesse du vent (en km/h)
-        vitesse_vent = round(random.uniform(0, 30), 1)
-        
-        # Direction du vent (en degrés)
-        direction_vent = random.randint(0, 359)
-        
-        # Précipitations (en mm)
-        if etat_ciel in ["Pluvieux", "Orageux", "Neigeux"]:
-            precipitations = round(random.uniform(0.1, 15), 1)
-        else:
-            precipitations = 0.0
-        
-        derniere_meteo[station["id"]] = {
-            "temperature": temperature,
-            "humidite": humidite,
-            "pression": pression,
-            "etat_ciel": etat_ciel,
-            "vitesse_vent": vitesse_vent,
-            "direction_vent": direction_vent,
-            "precipitations": precipitations
-        }
+    return temp_base
+
+def initialiser_station(station):
+    """Initialise les données météo d'une station à sa première mesure."""
+    global temperature_base
+    
+    if temperature_base is None:
+        temperature_base = calculer_temperature_base()
+    
+    # Légère variation entre stations
+    temp_variation = random.uniform(-2, 2)
+    temperature = round(temperature_base + temp_variation, 1)
+    
+    humidite = random.randint(30, 90)
+    pression = random.uniform(990, 1030)
+    
+    # L'état du ciel est influencé par l'humidité
+    if humidite > 80:
+        etats_possibles = ["Couvert", "Pluvieux", "Brumeux", "Orageux"]
+    elif humidite > 60:
+        etats_possibles = ["Partiellement nuageux", "Nuageux", "Couvert"]
+    else:
+        etats_possibles = ["Ensoleillé", "Partiellement nuageux"]
+    
+    etat_ciel = random.choice(etats_possibles)
+    
+    # Vitesse du vent (en km/h)
+    vitesse_vent = round(random.uniform(0, 30), 1)
+    
+    # Direction du vent (en degrés)
+    direction_vent = random.randint(0, 359)
+    
+    # Précipitations (en mm)
+    if etat_ciel in ["Pluvieux", "Orageux", "Neigeux"]:
+        precipitations = round(random.uniform(0.1, 15), 1)
+    else:
+        precipitations = 0.0
+    
+    derniere_meteo[station["id"]] = {
+        "temperature": temperature,
+        "humidite": humidite,
+        "pression": pression,
+        "etat_ciel": etat_ciel,
+        "vitesse_vent": vitesse_vent,
+        "direction_vent": direction_vent,
+        "precipitations": precipitations
+    }
 
 def generer_donnees_meteo(station):
     """Génère des données météorologiques évolutives pour une station."""
     global tendance_temperature, tendance_humidite, derniere_meteo
     
-    # Si les données n'ont pas été initialisées
+    # Si les données n'ont pas été initialisées (première mesure de la station)
     if station["id"] not in derniere_meteo:
-        initialiser_meteo()
+        initialiser_station(station)
     
     derniere = derniere_meteo[station["id"]]
     
@@ -190,34 +231,151 @@ def generer_donnees_meteo(station):
         "vitesse_vent": derniere_meteo[station["id"]]["vitesse_vent"],
         "direction_vent": derniere_meteo[station["id"]]["direction_vent"],
         "precipitations": derniere_meteo[station["id"]]["precipitations"],
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
     }
     
     return donnees
 
-def publier(client):
+def generer_lectures():
+    """Génère les lectures de toutes les stations, une station à la fois."""
+    for station in STATIONS_METEO:
+        yield station["id"], generer_donnees_meteo(station)
+
+# Choix de l'état du ciel selon l'humidité, en indices de ETATS_CIEL:
+# groupe 0 (humidité <= 60), 1 (<= 80) et 2 (> 80), complétés par -1
+TABLE_ETATS_CIEL = [
+    [0, 1, -1, -1],  # Ensoleillé, Partiellement nuageux
+    [1, 2, 3, -1],   # Partiellement nuageux, Nuageux, Couvert
+    [3, 5, 4, 6]     # Couvert, Pluvieux, Brumeux, Orageux
+]
+NOMBRE_ETATS_CIEL = [2, 3, 4]
+
+# État du mode vectorisé, construit au premier cycle
+etat_vectorise = None
+
+def choisir_etats_ciel(rng, humidite):
+    """Tire un état du ciel (indice de ETATS_CIEL) pour chaque station selon son humidité."""
+    groupe = np.where(humidite > 80, 2, np.where(humidite > 60, 1, 0))
+    choix = (rng.random(len(humidite)) * etat_vectorise["nombre_etats"][groupe]).astype(np.int64)
+    return etat_vectorise["table_etats"][groupe, choix]
+
+def initialiser_vectorise():
+    """Construit les tableaux NumPy de l'état de toutes les stations."""
+    global etat_vectorise
+    rng = np.random.default_rng(population.graine_processus())
+    stations = list(STATIONS_METEO)
+    nombre = len(stations)
+    
+    etat_vectorise = {
+        "stations": stations,
+        "rng": rng,
+        "table_etats": np.array(TABLE_ETATS_CIEL),
+        "nombre_etats": np.array(NOMBRE_ETATS_CIEL)
+    }
+    
+    humidite = rng.integers(30, 91, size=nombre).astype(np.float64)
+    etat_ciel = choisir_etats_ciel(rng, humidite)
+    precipitations = np.where(np.isin(etat_ciel, [5, 6, 7]),
+                              np.round(rng.uniform(0.1, 15, size=nombre), 1), 0.0)
+    
+    etat_vectorise.update({
+        "temperature": np.round(calculer_temperature_base() + rng.uniform(-2, 2, size=nombre), 1),
+        "humidite": humidite,
+        "pression": rng.uniform(990, 1030, size=nombre),
+        "etat_ciel": etat_ciel,
+        "vitesse_vent": np.round(rng.uniform(0, 30, size=nombre), 1),
+        "direction_vent": rng.integers(0, 360, size=nombre),
+        "precipitations": precipitations
+    })
+
+def generer_lectures_vectorisees():
+    """Fait évoluer toutes les stations en une seule étape vectorisée et génère leurs lectures."""
+    if etat_vectorise is None:
+        initialiser_vectorise()
+    etat = etat_vectorise
+    rng = etat["rng"]
+    nombre = len(etat["stations"])
+    
+    # Marches aléatoires bornées, identiques au mode scalaire
+    etat["temperature"] = np.round(np.clip(
+        etat["temperature"] + rng.uniform(-0.3, 0.3, size=nombre) + tendance_temperature * (INTERVALLE_METEO / 3600),
+        -30, 45), 1)
+    etat["humidite"] = np.round(np.clip(
+        etat["humidite"] + rng.uniform(-2, 2, size=nombre) + tendance_humidite * (INTERVALLE_METEO / 3600),
+        10, 100))
+    etat["pression"] = np.round(np.clip(etat["pression"] + rng.uniform(-0.5, 0.5, size=nombre), 950, 1050), 1)
+    etat["vitesse_vent"] = np.round(np.maximum(0, etat["vitesse_vent"] + rng.uniform(-2, 2, size=nombre)), 1)
+    etat["direction_vent"] = (etat["direction_vent"] + rng.integers(-10, 11, size=nombre)) % 360
+    
+    # 10% de chance de changement de l'état du ciel, selon l'humidité
+    changement = rng.random(nombre) < 0.1
+    etat["etat_ciel"] = np.where(changement, choisir_etats_ciel(rng, etat["humidite"]), etat["etat_ciel"])
+    
+    # Précipitations basées sur l'état du ciel
+    pluie = np.isin(etat["etat_ciel"], [5, 6])
+    neige = etat["etat_ciel"] == 7
+    variation = np.where(pluie, rng.uniform(-1, 2, size=nombre),
+                         np.where(neige, rng.uniform(-0.5, 1, size=nombre), -rng.uniform(0, 0.5, size=nombre)))
+    etat["precipitations"] = np.round(np.maximum(0, etat["precipitations"] + variation), 1)
+    
+    # Construire les messages à partir des tableaux
+    timestamp = horloge.maintenant()
+    lectures = []
+    for station, temperature, humidite, pression, etat_ciel, vitesse_vent, direction_vent, precipitations in zip(
+            etat["stations"], etat["temperature"].tolist(), etat["humidite"].astype(np.int64).tolist(),
+            etat["pression"].tolist(), etat["etat_ciel"].tolist(), etat["vitesse_vent"].tolist(),
+            etat["direction_vent"].tolist(), etat["precipitations"].tolist()):
+        lectures.append((station["id"], {
+            "id": station["id"],
+            "nom": station["nom"],
+            "latitude": station["latitude"],
+            "longitude": station["longitude"],
+            "temperature": temperature,
+            "humidite": humidite,
+            "pression": pression,
+            "etat_ciel": ETATS_CIEL[etat_ciel],
+            "vitesse_vent": vitesse_vent,
+            "direction_vent": direction_vent,
+            "precipitations": precipitations,
+            "timestamp": timestamp
+        }))
+    return lectures
+
+def publier(tampon):
     """Publie périodiquement les données de toutes les stations météo."""
-    # Initialiser les données météo au démarrage
-    initialiser_meteo()
+    # Initialiser les données météo au démarrage (à la première mesure en grande échelle)
+    if not GRANDE_ECHELLE and not VECTORISE:
+        initialiser_meteo()
     
     # Boucle de publication
     while True:
         try:
-            for station in STATIONS_METEO:
-                donnees = generer_donnees_meteo(station)
-                message = json.dumps(donnees, ensure_ascii=False)
-                topic = f"{TOPIC_METEO}/{station['id']}"
-                result = client.publish(topic, message)
+            # En mode lot, les lectures du cycle sont regroupées dans un seul message
+            lot = LotLectures(tampon, TOPIC_METEO) if MODE_LOT else None
+            
+            lectures = generer_lectures_vectorisees() if VECTORISE else generer_lectures()
+            
+            for cle, donnees in lectures:
+                if lot is not None:
+                    lot.ajouter(cle, donnees)
+                    continue
+                
+                topic = f"{TOPIC_METEO}/{cle}"
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque station
-                time.sleep(0.5)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(0.5)
+            
+            if lot is not None:
+                lot.vider()
                 
             # Faire évoluer légèrement les tendances
             global tendance_temperature, tendance_humidite
@@ -227,7 +385,7 @@ def publier(client):
             tendance_humidite = max(-3, min(3, tendance_humidite))
             
             # Attente avant la prochaine série de publications
-            time.sleep(INTERVALLE_METEO)
+            horloge.dormir(INTERVALLE_METEO)
             
         except Exception as e:
             print(f"Erreur: {e}")
@@ -236,8 +394,9 @@ def publier(client):
 def executer():
     """Fonction principale du simulateur."""
     client = connecter_mqtt()
+    tampon = TamponPublication(client, "meteo")
     client.loop_start()
-    publier(client)
+    publier(tampon)
 
 if __name__ == '__main__':
     print("Démarrage du simulateur de capteurs météorologiques...")
@@ -17,7 +17,20 @@ import os
 
 # Ajout du répertoire parent au path pour importer config.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_PARKING, INTERVALLE_PARKING
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_PARKING, INTERVALLE_PARKING, MODE_LOT, PUBLICATION_RETENUE, MODE_VECTORISE
+from publication import LotLectures, TamponPublication, estampiller
+import horloge
+import population
+
+# NumPy n'est nécessaire que pour le mode vectorisé
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+    if MODE_VECTORISE:
+        print("Warning: numpy non disponible, le mode vectorisé est désactivé")
+VECTORISE = MODE_VECTORISE and NUMPY_DISPONIBLE
 
 # Liste des parkings à simuler
 PARKINGS = [
@@ -28,6 +41,19 @@ PARKINGS = [
     {"nom": "Parking Hôpital", "capacite_totale": 80}
 ]
 
+def fabriquer_parking(index, rng):
+    """Génère la description d'un parking de la population à grande échelle."""
+    latitude, longitude, quartier = population.position_aleatoire(rng)
+    return {
+        "nom": f"Parking Q{quartier:03d}-{index:06d}",
+        "capacite_totale": rng.choice([40, 80, 120, 150, 200, 300, 500]),
+        "latitude": latitude,
+        "longitude": longitude
+    }
+
+PARKINGS = population.charger("parking", PARKINGS, fabriquer_parking)
+GRANDE_ECHELLE = not isinstance(PARKINGS, list)
+
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
     # Génération d'un ID client unique
@@ -42,22 +68,28 @@ def connecter_mqtt():
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
-    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    
+    # Connexion asynchrone: la boucle réseau réessaie tant que le broker est injoignable
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(BROKER_ADRESSE, BROKER_PORT)
     return client
 
-def generer_donnees_parking(parking):
-    """Génère des données aléatoires pour un parking."""
-    capacite_totale = parking["capacite_totale"]
-    # Simuler une occupation variable selon l'heure de la journée
-    heure_actuelle = time.localtime().tm_hour
-    
+def bornes_occupation(heure_actuelle):
+    """Retourne l'intervalle du taux d'occupation selon l'heure de la journée."""
     # Facteur d'occupation basé sur l'heure (plus occupé pendant les heures de pointe)
     if 7 <= heure_actuelle <= 9 or 16 <= heure_actuelle <= 19:
-        taux_occupation = random.uniform(0.7, 0.95)  # Heures de pointe: 70-95% occupé
+        return 0.7, 0.95  # Heures de pointe: 70-95% occupé
     elif 10 <= heure_actuelle <= 15:
-        taux_occupation = random.uniform(0.4, 0.8)   # Journée: 40-80% occupé
+        return 0.4, 0.8   # Journée: 40-80% occupé
     else:
-        taux_occupation = random.uniform(0.1, 0.5)   # Nuit: 10-50% occupé
+        return 0.1, 0.5   # Nuit: 10-50% occupé
+
+def generer_donnees_parking(parking):
+    """Génère des données aléatoires pour un parking."""
+    capacite_totale = parking["capacite_totale"]
+    # Simuler une occupation variable selon l'heure de la journée
+    heure_actuelle = horloge.heure_locale().tm_hour
+    taux_occupation = random.uniform(*bornes_occupation(heure_actuelle))
     
     places_occupees = int(capacite_totale * taux_occupation)
     places_disponibles = capacite_totale - places_occupees
@@ -65,35 +97,106 @@ def generer_donnees_parking(parking):
     # Ajout d'une petite variation aléatoire
     places_disponibles = max(0, places_disponibles + random.randint(-5, 5))
     
-    return {
+    donnees = {
         "nom": parking["nom"],
         "capacite_totale": capacite_totale,
         "places_disponibles": places_disponibles,
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
+    }
+    
+    # Les parkings générés à grande échelle sont géolocalisés
+    if "latitude" in parking:
+        donnees["latitude"] = parking["latitude"]
+        donnees["longitude"] = parking["longitude"]
+    
+    return donnees
+
+def cle_parking(parking):
+    """Retourne le dernier segment du topic d'un parking."""
+    return parking['nom'].replace(' ', '_').lower()
+
+def generer_lectures():
+    """Génère les lectures de tous les parkings, un parking à la fois."""
+    for parking in PARKINGS:
+        yield cle_parking(parking), generer_donnees_parking(parking)
+
+# État du mode vectorisé, construit au premier cycle
+etat_vectorise = None
+
+def initialiser_vectorise():
+    """Construit les tableaux NumPy décrivant tous les parkings."""
+    global etat_vectorise
+    parkings = list(PARKINGS)
+    etat_vectorise = {
+        "parkings": parkings,
+        "cles": [cle_parking(parking) for parking in parkings],
+        "capacites": np.array([parking["capacite_totale"] for parking in parkings], dtype=np.int64),
+        "rng": np.random.default_rng(population.graine_processus())
     }
 
-def publier(client):
+def generer_lectures_vectorisees():
+    """Génère les lectures de tous les parkings en une seule étape vectorisée."""
+    if etat_vectorise is None:
+        initialiser_vectorise()
+    rng = etat_vectorise["rng"]
+    capacites = etat_vectorise["capacites"]
+    nombre = len(capacites)
+    
+    taux_occupation = rng.uniform(*bornes_occupation(horloge.heure_locale().tm_hour), size=nombre)
+    places_occupees = (capacites * taux_occupation).astype(np.int64)
+    # Ajout d'une petite variation aléatoire
+    places_disponibles = np.maximum(0, capacites - places_occupees + rng.integers(-5, 6, size=nombre))
+    
+    # Construire les messages à partir des tableaux
+    timestamp = horloge.maintenant()
+    lectures = []
+    for parking, cle, capacite, places in zip(etat_vectorise["parkings"], etat_vectorise["cles"],
+                                              capacites.tolist(), places_disponibles.tolist()):
+        donnees = {
+            "nom": parking["nom"],
+            "capacite_totale": capacite,
+            "places_disponibles": places,
+            "timestamp": timestamp
+        }
+        if "latitude" in parking:
+            donnees["latitude"] = parking["latitude"]
+            donnees["longitude"] = parking["longitude"]
+        lectures.append((cle, donnees))
+    return lectures
+
+def publier(tampon):
     """Publie périodiquement les données de tous les parkings."""
     while True:
         try:
-            for parking in PARKINGS:
-                donnees = generer_donnees_parking(parking)
-                message = json.dumps(donnees, ensure_ascii=False)
-                topic = f"{TOPIC_PARKING}/{parking['nom'].replace(' ', '_').lower()}"
-                result = client.publish(topic, message)
+            # En mode lot, les lectures du cycle sont regroupées dans un seul message
+            lot = LotLectures(tampon, TOPIC_PARKING) if MODE_LOT else None
+            
+            lectures = generer_lectures_vectorisees() if VECTORISE else generer_lectures()
+            
+            for cle, donnees in lectures:
+                if lot is not None:
+                    lot.ajouter(cle, donnees)
+                    continue
+                
+                topic = f"{TOPIC_PARKING}/{cle}"
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}: {message}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque parking pour éviter de surcharger le broker
-                time.sleep(1)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(1)
+            
+            if lot is not None:
+                lot.vider()
                 
             # Attente avant la prochaine série de publications
-            time.sleep(INTERVALLE_PARKING)
+            horloge.dormir(INTERVALLE_PARKING)
             
         except Exception as e:
             print(f"Erreur: {e}")
@@ -102,8 +205,9 @@ def publier(client):
 def executer():
     """Fonction principale du simulateur."""
     client = connecter_mqtt()
+    tampon = TamponPublication(client, "parking")
     client.loop_start()
-    publier(client)
+    publier(tampon)
 
 if __name__ == '__main__':
     print("Démarrage du simulateur de capteurs de parking...")
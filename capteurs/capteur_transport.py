@@ -27,7 +27,10 @@ except ImportError:
 
 # Ajout du répertoire parent au path pour importer config.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_TRANSPORT, INTERVALLE_TRANSPORT
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_TRANSPORT, INTERVALLE_TRANSPORT, MODE_LOT, PUBLICATION_RETENUE
+from publication import LotLectures, TamponPublication, estampiller
+import horloge
+import population
 
 # Définition des lignes de bus (points de passage avec coordonnées GPS)
 LIGNES_BUS = {
@@ -72,60 +75,115 @@ ZONES_TAXIS = {
     }
 }
 
+def creer_bus(ligne_id, ligne, i, rng=random):
+    """Crée l'état initial du i-ème bus d'une ligne."""
+    # Répartir les bus le long de la ligne
+    position_initiale = i % len(ligne["arrets"])
+    position_suivante = (position_initiale + 1) % len(ligne["arrets"])
+    progression = rng.random()  # Progression entre les deux arrêts
+    
+    return {
+        "id": f"BUS_{ligne_id}_{i+1}",
+        "ligne": ligne_id,
+        "nom_ligne": ligne["nom"],
+        "position_arret_actuel": position_initiale,
+        "position_arret_suivant": position_suivante,
+        "progression": progression,
+        "vitesse": ligne["vitesse_moyenne"] * (0.8 + rng.random() * 0.4),  # Variation de vitesse
+        "en_service": rng.random() < 0.9,  # 90% des bus en service
+        "capacite": 50,
+        "passagers": rng.randint(0, 40)
+    }
+
+def creer_taxi(zone_id, zone, i, rng=random):
+    """Crée l'état initial du i-ème taxi d'une zone."""
+    # Position aléatoire dans la zone
+    angle = rng.uniform(0, 2 * math.pi)
+    distance = rng.uniform(0, zone["rayon"])
+    
+    # Calcul des coordonnées (approximation simple)
+    lat_km = 111.32  # km par degré de latitude (approximation)
+    lon_km = 111.32 * math.cos(math.radians(zone["centre"]["latitude"]))  # km par degré de longitude
+    
+    latitude = zone["centre"]["latitude"] + (distance * math.sin(angle)) / lat_km
+    longitude = zone["centre"]["longitude"] + (distance * math.cos(angle)) / lon_km
+    
+    return {
+        "id": f"TAXI_{zone_id}_{i+1}",
+        "zone": zone_id,
+        "nom_zone": zone["nom"],
+        "latitude": latitude,
+        "longitude": longitude,
+        "vitesse": rng.uniform(0, 50),  # Vitesse en km/h
+        "disponible": rng.random() < 0.7,  # 70% des taxis disponibles
+        "en_mouvement": rng.random() < 0.6,  # 60% des taxis en mouvement
+        "destination": {
+            "latitude": zone["centre"]["latitude"] + rng.uniform(-0.01, 0.01),
+            "longitude": zone["centre"]["longitude"] + rng.uniform(-0.01, 0.01)
+        } if rng.random() < 0.6 else None  # 60% avec une destination
+    }
+
 # Créer les véhicules (bus et taxis)
 BUS = []
 for ligne_id, ligne in LIGNES_BUS.items():
     # Créer plusieurs bus par ligne
     nombre_bus = max(1, int(60 / ligne["frequence_passage"]))  # Au moins 1 bus
     for i in range(nombre_bus):
-        # Répartir les bus le long de la ligne
-        position_initiale = i % len(ligne["arrets"])
-        position_suivante = (position_initiale + 1) % len(ligne["arrets"])
-        progression = random.random()  # Progression entre les deux arrêts
-        
-        BUS.append({
-            "id": f"BUS_{ligne_id}_{i+1}",
-            "ligne": ligne_id,
-            "nom_ligne": ligne["nom"],
-            "position_arret_actuel": position_initiale,
-            "position_arret_suivant": position_suivante,
-            "progression": progression,
-            "vitesse": ligne["vitesse_moyenne"] * (0.8 + random.random() * 0.4),  # Variation de vitesse
-            "en_service": random.random() < 0.9,  # 90% des bus en service
-            "capacite": 50,
-            "passagers": random.randint(0, 40)
-        })
+        BUS.append(creer_bus(ligne_id, ligne, i, random))
 
 TAXIS = []
 for zone_id, zone in ZONES_TAXIS.items():
     # Créer plusieurs taxis par zone
     nombre_taxis = random.randint(3, 8)
     for i in range(nombre_taxis):
-        # Position aléatoire dans la zone
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(0, zone["rayon"])
-        
-        # Calcul des coordonnées (approximation simple)
-        lat_km = 111.32  # km par degré de latitude (approximation)
-        lon_km = 111.32 * math.cos(math.radians(zone["centre"]["latitude"]))  # km par degré de longitude
-        
-        latitude = zone["centre"]["latitude"] + (distance * math.sin(angle)) / lat_km
-        longitude = zone["centre"]["longitude"] + (distance * math.cos(angle)) / lon_km
-        
-        TAXIS.append({
-            "id": f"TAXI_{zone_id}_{i+1}",
-            "zone": zone_id,
-            "nom_zone": zone["nom"],
-            "latitude": latitude,
-            "longitude": longitude,
-            "vitesse": random.uniform(0, 50),  # Vitesse en km/h
-            "disponible": random.random() < 0.7,  # 70% des taxis disponibles
-            "en_mouvement": random.random() < 0.6,  # 60% des taxis en mouvement
-            "destination": {
-                "latitude": zone["centre"]["latitude"] + random.uniform(-0.01, 0.01),
-                "longitude": zone["centre"]["longitude"] + random.uniform(-0.01, 0.01)
-            } if random.random() < 0.6 else None  # 60% avec une destination
-        })
+        TAXIS.append(creer_taxi(zone_id, zone, i, random))
+
+# Population à grande échelle: lignes et zones générées à la demande
+BUS_PAR_LIGNE = 6
+TAXIS_PAR_ZONE = 20
+
+def fabriquer_ligne(ligne_id, rng):
+    """Génère une ligne de bus: arrêts espacés de 300 à 700 m sur un trajet sinueux."""
+    latitude, longitude, quartier = population.position_aleatoire(rng, dispersion_km=1.0)
+    direction = rng.uniform(0, 2 * math.pi)
+    arrets = []
+    for numero in range(rng.randint(5, 10)):
+        arrets.append({"nom": f"Arrêt {ligne_id}-{numero + 1}", "latitude": latitude, "longitude": longitude})
+        direction += rng.uniform(-0.4, 0.4)
+        latitude, longitude = population.deplacer(latitude, longitude, rng.uniform(0.3, 0.7), direction)
+    return {
+        "nom": f"Ligne {ligne_id} - Quartier {quartier}",
+        "arrets": arrets,
+        "frequence_passage": rng.choice([5, 10, 15, 20]),
+        "vitesse_moyenne": rng.uniform(15, 25)
+    }
+
+def fabriquer_zone(zone_id, rng):
+    """Génère une zone de circulation de taxis centrée sur un quartier."""
+    latitude, longitude, quartier = population.position_aleatoire(rng, dispersion_km=0.5)
+    return {
+        "nom": f"Zone {zone_id} - Quartier {quartier}",
+        "centre": {"latitude": latitude, "longitude": longitude},
+        "rayon": rng.uniform(1.0, 3.0)
+    }
+
+def fabriquer_bus(index, rng):
+    """Génère un bus de la population à grande échelle, rattaché à une ligne générée."""
+    ligne_id = f"L{index // BUS_PAR_LIGNE:05d}"
+    return creer_bus(ligne_id, LIGNES_BUS[ligne_id], index % BUS_PAR_LIGNE, rng)
+
+def fabriquer_taxi(index, rng):
+    """Génère un taxi de la population à grande échelle, rattaché à une zone générée."""
+    zone_id = f"Z{index // TAXIS_PAR_ZONE:04d}"
+    return creer_taxi(zone_id, ZONES_TAXIS[zone_id], index % TAXIS_PAR_ZONE, rng)
+
+if population.taille_population("bus") is not None:
+    LIGNES_BUS = population.Catalogue("ligne", fabriquer_ligne)
+if population.taille_population("taxi") is not None:
+    ZONES_TAXIS = population.Catalogue("zone", fabriquer_zone)
+BUS = population.charger("bus", BUS, fabriquer_bus)
+TAXIS = population.charger("taxi", TAXIS, fabriquer_taxi)
+GRANDE_ECHELLE = not isinstance(BUS, list) or not isinstance(TAXIS, list)
 
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
@@ -141,7 +199,10 @@ def connecter_mqtt():
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
-    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    
+    # Connexion asynchrone: la boucle réseau réessaie tant que le broker est injoignable
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(BROKER_ADRESSE, BROKER_PORT)
     return client
 
 def calculer_distance_gps(point1, point2):
@@ -320,7 +381,7 @@ def generer_donnees_bus(bus):
         "taux_occupation": round(bus["passagers"] / bus["capacite"] * 100),
         "temps_estime_prochain_arret": round(temps_estime_secondes),
         "retard": retard,
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
     }
 
 def generer_donnees_taxi(taxi):
@@ -335,57 +396,73 @@ def generer_donnees_taxi(taxi):
         "disponible": taxi["disponible"],
         "en_mouvement": taxi["en_mouvement"],
         "destination": taxi["destination"],
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
     }
 
-def publier(client):
+def publier(tampon):
     """Publie périodiquement les données de tous les véhicules."""
-    derniere_publication = time.time()
+    derniere_publication = horloge.maintenant()
     
     while True:
         try:
-            temps_actuel = time.time()
+            temps_actuel = horloge.maintenant()
             delta_temps = temps_actuel - derniere_publication
             derniere_publication = temps_actuel
             
+            # En mode lot, les lectures du cycle sont regroupées par type de véhicule
+            lot_bus = LotLectures(tampon, f"{TOPIC_TRANSPORT}/bus") if MODE_LOT else None
+            lot_taxi = LotLectures(tampon, f"{TOPIC_TRANSPORT}/taxi") if MODE_LOT else None
+            
             # Mettre à jour les positions des bus
             for bus in BUS:
                 mettre_a_jour_position_bus(bus, delta_temps)
                 donnees = generer_donnees_bus(bus)
-                message = json.dumps(donnees, ensure_ascii=False)
+                if lot_bus is not None:
+                    lot_bus.ajouter(bus['id'], donnees)
+                    continue
+                
                 topic = f"{TOPIC_TRANSPORT}/bus/{bus['id']}"
-                result = client.publish(topic, message)
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque publication
-                time.sleep(0.1)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(0.1)
             
             # Mettre à jour les positions des taxis
             for taxi in TAXIS:
                 mettre_a_jour_position_taxi(taxi, delta_temps)
                 donnees = generer_donnees_taxi(taxi)
-                message = json.dumps(donnees, ensure_ascii=False)
+                if lot_taxi is not None:
+                    lot_taxi.ajouter(taxi['id'], donnees)
+                    continue
+                
                 topic = f"{TOPIC_TRANSPORT}/taxi/{taxi['id']}"
-                result = client.publish(topic, message)
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque publication
-                time.sleep(0.1)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(0.1)
+            
+            if lot_bus is not None:
+                lot_bus.vider()
+                lot_taxi.vider()
             
             # Attente avant la prochaine série de publications
-            time.sleep(INTERVALLE_TRANSPORT)
+            horloge.dormir(INTERVALLE_TRANSPORT)
             
         except Exception as e:
             print(f"Erreur: {e}")
@@ -394,8 +471,9 @@ def publier(client):
 def executer():
     """Fonction principale du simulateur."""
     client = connecter_mqtt()
+    tampon = TamponPublication(client, "transport")
     client.loop_start()
-    publier(client)
+    publier(tampon)
 
 if __name__ == '__main__':
     print("Démarrage du simulateur de capteurs de transport public...")
@@ -17,7 +17,20 @@ import os
 
 # Ajout du répertoire parent au path pour importer config.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_WIFI, INTERVALLE_WIFI
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE, TOPIC_WIFI, INTERVALLE_WIFI, MODE_LOT, PUBLICATION_RETENUE, MODE_VECTORISE
+from publication import LotLectures, TamponPublication, estampiller
+import horloge
+import population
+
+# NumPy n'est nécessaire que pour le mode vectorisé
+try:
+    import numpy as np
+    NUMPY_DISPONIBLE = True
+except ImportError:
+    NUMPY_DISPONIBLE = False
+    if MODE_VECTORISE:
+        print("Warning: numpy non disponible, le mode vectorisé est désactivé")
+VECTORISE = MODE_VECTORISE and NUMPY_DISPONIBLE
 
 # Liste des points d'accès Wi-Fi à simuler
 POINTS_ACCES = [
@@ -30,6 +43,21 @@ POINTS_ACCES = [
     {"id": "AP007", "nom": "WiFi-Cafeteria", "localisation": "Cafétéria"}
 ]
 
+def fabriquer_point_acces(index, rng):
+    """Génère la description d'un point d'accès de la population à grande échelle."""
+    latitude, longitude, quartier = population.position_aleatoire(rng, dispersion_km=0.3)
+    etage = rng.randint(0, 5)
+    return {
+        "id": f"AP{index:06d}",
+        "nom": f"WiFi-Q{quartier:03d}-{index:06d}",
+        "localisation": f"Quartier {quartier}, étage {etage}",
+        "latitude": latitude,
+        "longitude": longitude
+    }
+
+POINTS_ACCES = population.charger("wifi", POINTS_ACCES, fabriquer_point_acces)
+GRANDE_ECHELLE = not isinstance(POINTS_ACCES, list)
+
 def connecter_mqtt():
     """Établit une connexion au broker MQTT."""
     # Génération d'un ID client unique
@@ -44,7 +72,10 @@ def connecter_mqtt():
     # Création du client MQTT
     client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
     client.on_connect = au_connexion
-    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    
+    # Connexion asynchrone: la boucle réseau réessaie tant que le broker est injoignable
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(BROKER_ADRESSE, BROKER_PORT)
     return client
 
 def generer_donnees_wifi(point_acces):
@@ -57,7 +88,7 @@ def generer_donnees_wifi(point_acces):
         puissance_signal = random.randint(60, 100)  # En pourcentage
         
         # Simuler le nombre d'utilisateurs connectés
-        heure_actuelle = time.localtime().tm_hour
+        heure_actuelle = horloge.heure_locale().tm_hour
         if 8 <= heure_actuelle <= 18:  # Heures de cours
             utilisateurs_connectes = random.randint(5, 50)
         else:  # En dehors des heures de cours
@@ -74,7 +105,7 @@ def generer_donnees_wifi(point_acces):
         bande_passante_utilisee = 0.0
         niveau_congestion = 0
     
-    return {
+    donnees = {
         "id": point_acces["id"],
         "nom": point_acces["nom"],
         "localisation": point_acces["localisation"],
@@ -83,31 +114,114 @@ def generer_donnees_wifi(point_acces):
         "utilisateurs_connectes": utilisateurs_connectes,
         "bande_passante_utilisee": bande_passante_utilisee,
         "niveau_congestion": niveau_congestion,
-        "timestamp": time.time()
+        "timestamp": horloge.maintenant()
     }
+    
+    # Les points d'accès générés à grande échelle sont géolocalisés
+    if "latitude" in point_acces:
+        donnees["latitude"] = point_acces["latitude"]
+        donnees["longitude"] = point_acces["longitude"]
+    
+    return donnees
 
-def publier(client):
+def generer_lectures():
+    """Génère les lectures de tous les points d'accès, un point d'accès à la fois."""
+    for point_acces in POINTS_ACCES:
+        yield point_acces["id"], generer_donnees_wifi(point_acces)
+
+# État du mode vectorisé, construit au premier cycle
+etat_vectorise = None
+
+def initialiser_vectorise():
+    """Prépare la liste des points d'accès et le générateur NumPy du mode vectorisé."""
+    global etat_vectorise
+    etat_vectorise = {
+        "points_acces": list(POINTS_ACCES),
+        "rng": np.random.default_rng(population.graine_processus())
+    }
+
+def generer_lectures_vectorisees():
+    """Génère les lectures de tous les points d'accès en une seule étape vectorisée."""
+    if etat_vectorise is None:
+        initialiser_vectorise()
+    rng = etat_vectorise["rng"]
+    points_acces = etat_vectorise["points_acces"]
+    nombre = len(points_acces)
+    
+    # Probabilité que le point d'accès soit en ligne (95% du temps)
+    est_en_ligne = rng.random(nombre) < 0.95
+    
+    puissance_signal = rng.integers(60, 101, size=nombre)
+    heure_actuelle = horloge.heure_locale().tm_hour
+    if 8 <= heure_actuelle <= 18:  # Heures de cours
+        utilisateurs_connectes = rng.integers(5, 51, size=nombre)
+    else:  # En dehors des heures de cours
+        utilisateurs_connectes = rng.integers(0, 16, size=nombre)
+    bande_passante_utilisee = np.round(rng.uniform(1.0, 100.0, size=nombre), 2)
+    niveau_congestion = np.minimum(100, (utilisateurs_connectes * 2 + bande_passante_utilisee / 2).astype(np.int64))
+    
+    # Les points d'accès hors ligne ne remontent aucune mesure
+    puissance_signal[~est_en_ligne] = 0
+    utilisateurs_connectes[~est_en_ligne] = 0
+    bande_passante_utilisee[~est_en_ligne] = 0.0
+    niveau_congestion[~est_en_ligne] = 0
+    
+    # Construire les messages à partir des tableaux
+    timestamp = horloge.maintenant()
+    lectures = []
+    for point_acces, en_ligne, puissance, utilisateurs, bande_passante, congestion in zip(
+            points_acces, est_en_ligne.tolist(), puissance_signal.tolist(), utilisateurs_connectes.tolist(),
+            bande_passante_utilisee.tolist(), niveau_congestion.tolist()):
+        donnees = {
+            "id": point_acces["id"],
+            "nom": point_acces["nom"],
+            "localisation": point_acces["localisation"],
+            "est_en_ligne": en_ligne,
+            "puissance_signal": puissance,
+            "utilisateurs_connectes": utilisateurs,
+            "bande_passante_utilisee": bande_passante,
+            "niveau_congestion": congestion,
+            "timestamp": timestamp
+        }
+        if "latitude" in point_acces:
+            donnees["latitude"] = point_acces["latitude"]
+            donnees["longitude"] = point_acces["longitude"]
+        lectures.append((point_acces["id"], donnees))
+    return lectures
+
+def publier(tampon):
     """Publie périodiquement les données de tous les points d'accès Wi-Fi."""
     while True:
         try:
-            for point_acces in POINTS_ACCES:
-                donnees = generer_donnees_wifi(point_acces)
-                message = json.dumps(donnees, ensure_ascii=False)
-                topic = f"{TOPIC_WIFI}/{point_acces['id']}"
-                result = client.publish(topic, message)
+            # En mode lot, les lectures du cycle sont regroupées dans un seul message
+            lot = LotLectures(tampon, TOPIC_WIFI) if MODE_LOT else None
+            
+            lectures = generer_lectures_vectorisees() if VECTORISE else generer_lectures()
+            
+            for cle, donnees in lectures:
+                if lot is not None:
+                    lot.ajouter(cle, donnees)
+                    continue
+                
+                topic = f"{TOPIC_WIFI}/{cle}"
+                message = json.dumps(estampiller(topic, donnees), ensure_ascii=False)
+                envoye = tampon.publier(topic, message, retain=PUBLICATION_RETENUE)
                 
                 # Vérification de la publication
-                statut = result[0]
-                if statut == 0:
+                if envoye:
                     print(f"Message envoyé au topic {topic}")
                 else:
-                    print(f"Échec d'envoi du message au topic {topic}")
+                    print(f"Broker indisponible, message au topic {topic} mis en tampon")
                 
                 # Petit délai entre chaque point d'accès
-                time.sleep(0.5)
+                if not GRANDE_ECHELLE:
+                    horloge.dormir(0.5)
+            
+            if lot is not None:
+                lot.vider()
                 
             # Attente avant la prochaine série de publications
-            time.sleep(INTERVALLE_WIFI)
+            horloge.dormir(INTERVALLE_WIFI)
             
         except Exception as e:
             print(f"Erreur: {e}")
@@ -116,8 +230,9 @@ def publier(client):
 def executer():
     """Fonction principale du simulateur."""
     client = connecter_mqtt()
+    tampon = TamponPublication(client, "wifi")
     client.loop_start()
-    publier(client)
+    publier(tampon)
 
 if __name__ == '__main__':
     print("Démarrage du simulateur de capteurs Wi-Fi...")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Horloge de simulation commune à tous les simulateurs de capteurs.
+Le temps simulé part de DEBUT_SIMULATION (ou de l'heure actuelle) et avance
+VITESSE_SIMULATION fois plus vite que le temps réel. Les attentes entre
+publications sont raccourcies d'autant.
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+# Ajout du répertoire parent au path pour importer config.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import VITESSE_SIMULATION, DEBUT_SIMULATION
+
+# Variables d'environnement permettant de surcharger la configuration
+VARIABLE_VITESSE = "SIMULATION_VITESSE"
+VARIABLE_DEBUT = "SIMULATION_DEBUT"
+
+vitesse = 1.0
+origine_simulee = time.time()
+origine_reelle = time.monotonic()
+
+def configurer(nouvelle_vitesse=None, debut=None):
+    """(Re)définit la vitesse et la date de départ du temps simulé.
+
+    debut peut être un timestamp ou une chaîne "AAAA-MM-JJ HH:MM[:SS]"; None
+    fait partir le temps simulé de l'heure actuelle.
+    """
+    global vitesse, origine_simulee, origine_reelle
+    
+    if nouvelle_vitesse is not None:
+        if float(nouvelle_vitesse) <= 0:
+            raise ValueError("La vitesse de simulation doit être strictement positive")
+        vitesse = float(nouvelle_vitesse)
+    
+    if debut is None:
+        origine_simulee = time.time()
+    elif isinstance(debut, str):
+        origine_simulee = datetime.fromisoformat(debut).timestamp()
+    else:
+        origine_simulee = float(debut)
+    origine_reelle = time.monotonic()
+
+def maintenant():
+    """Retourne le timestamp simulé actuel (équivalent de time.time())."""
+    return origine_simulee + (time.monotonic() - origine_reelle) * vitesse
+
+def heure_locale():
+    """Retourne l'heure locale simulée (équivalent de time.localtime())."""
+    return time.localtime(maintenant())
+
+def datetime_actuelle():
+    """Retourne la date simulée (équivalent de datetime.now())."""
+    return datetime.fromtimestamp(maintenant())
+
+def dormir(secondes):
+    """Attend une durée exprimée en temps simulé."""
+    time.sleep(secondes / vitesse)
+
+configurer(
+    os.environ.get(VARIABLE_VITESSE, VITESSE_SIMULATION),
+    os.environ.get(VARIABLE_DEBUT, DEBUT_SIMULATION)
+)
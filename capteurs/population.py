@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Génération procédurale de populations de capteurs à grande échelle.
+
+Chaque capteur est construit à la demande à partir de son index, avec un
+générateur aléatoire dérivé de (graine, type, index): les identifiants et
+positions sont donc stables d'une exécution à l'autre, et le démarrage reste
+instantané même pour 100 000 capteurs.
+
+En mode multi-processus, chaque processus ne simule qu'une partie (shard) de la
+population: les capteurs dont l'index modulo le nombre de shards fait partie
+de ses shards.
+
+Un fichier de scénario JSON peut préciser la taille de chaque type de capteur
+et la zone géographique simulée:
+
+    {"graine": 42, "centre": {"latitude": 48.8566, "longitude": 2.3522},
+     "rayon_km": 15, "parking": 20000, "wifi": 100000, "bus": 3000}
+"""
+
+import json
+import math
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+import os
+import random
+import sys
+
+# Ajout du répertoire parent au path pour importer config.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import ECHELLE_SIMULATION, FICHIER_SCENARIO
+
+# Variables d'environnement permettant de surcharger la configuration
+VARIABLE_ECHELLE = "SIMULATION_ECHELLE"
+VARIABLE_SCENARIO = "SIMULATION_SCENARIO"
+VARIABLE_SHARDS = "SIMULATION_SHARDS"            # Shards simulés par ce processus, ex: "0,3"
+VARIABLE_NOMBRE_SHARDS = "SIMULATION_NB_SHARDS"  # Nombre total de shards
+VARIABLE_GRAINE = "SIMULATION_GRAINE"            # Graine aléatoire du processus
+
+# Zone simulée par défaut
+SCENARIO_DEFAUT = {
+    "graine": 0,
+    "centre": {"latitude": 48.8566, "longitude": 2.3522},
+    "rayon_km": 10.0,
+    "quartiers": 50
+}
+
+KM_PAR_DEGRE_LATITUDE = 111.32
+
+def charger_scenario():
+    """Charge le scénario de population depuis le fichier ou l'échelle configurés."""
+    scenario = dict(SCENARIO_DEFAUT)
+    
+    chemin = os.environ.get(VARIABLE_SCENARIO, FICHIER_SCENARIO)
+    if chemin:
+        with open(chemin, encoding="utf-8") as fichier:
+            scenario.update(json.load(fichier))
+        return scenario
+    
+    echelle = os.environ.get(VARIABLE_ECHELLE, ECHELLE_SIMULATION)
+    if echelle:
+        scenario["echelle"] = int(echelle)
+    return scenario
+
+scenario = charger_scenario()
+
+def lire_shards():
+    """Retourne (shards de ce processus, nombre total de shards), ou (None, 1) sans partition."""
+    shards = os.environ.get(VARIABLE_SHARDS)
+    if not shards:
+        return None, 1
+    return sorted(int(shard) for shard in shards.split(",")), int(os.environ[VARIABLE_NOMBRE_SHARDS])
+
+SHARDS, NOMBRE_SHARDS = lire_shards()
+
+def suffixe_shard():
+    """Retourne un suffixe distinguant les ressources (fichiers...) de ce processus."""
+    if SHARDS is None:
+        return ""
+    return "_shard" + "-".join(str(shard) for shard in SHARDS)
+
+def graine_processus():
+    """Retourne la graine aléatoire imposée à ce processus, ou None."""
+    graine = os.environ.get(VARIABLE_GRAINE)
+    return int(graine) if graine is not None else None
+
+# Rendre les tirages du processus reproductibles lorsqu'une graine est imposée
+if graine_processus() is not None:
+    random.seed(graine_processus())
+
+def taille_population(type_capteur):
+    """Retourne le nombre de capteurs à générer pour un type, ou None pour la liste prédéfinie."""
+    taille = scenario.get(type_capteur, scenario.get("echelle"))
+    return int(taille) if taille is not None else None
+
+def generateur(type_capteur, index):
+    """Retourne un générateur aléatoire déterministe propre à un capteur."""
+    return random.Random(f"{scenario['graine']}:{type_capteur}:{index}")
+
+def deplacer(latitude, longitude, distance_km, angle):
+    """Retourne le point situé à distance_km dans la direction angle (radians)."""
+    km_par_degre_longitude = KM_PAR_DEGRE_LATITUDE * math.cos(math.radians(latitude))
+    return (
+        latitude + distance_km * math.sin(angle) / KM_PAR_DEGRE_LATITUDE,
+        longitude + distance_km * math.cos(angle) / km_par_degre_longitude
+    )
+
+@lru_cache(maxsize=None)
+def centre_quartier(numero):
+    """Retourne le centre d'un quartier, plus dense près du centre de la zone."""
+    rng = random.Random(f"{scenario['graine']}:quartier:{numero}")
+    distance = scenario["rayon_km"] * rng.random() ** 1.5
+    return deplacer(scenario["centre"]["latitude"], scenario["centre"]["longitude"],
+                    distance, rng.uniform(0, 2 * math.pi))
+
+def position_aleatoire(rng, dispersion_km=0.6):
+    """Tire une position réaliste: regroupée autour d'un quartier de la zone simulée.
+
+    Retourne (latitude, longitude, numero_quartier).
+    """
+    numero = rng.randrange(scenario["quartiers"])
+    latitude, longitude = centre_quartier(numero)
+    latitude, longitude = deplacer(latitude, longitude, abs(rng.gauss(0, dispersion_km)),
+                                   rng.uniform(0, 2 * math.pi))
+    return latitude, longitude, numero
+
+class IndicesShards:
+    """Séquence des index de capteurs appartenant à un ensemble de shards, sans les matérialiser."""
+
+    def __init__(self, taille, shards, nombre_shards):
+        self.plages = [range(shard, taille, nombre_shards) for shard in shards]
+        self.cumul = list(accumulate(len(plage) for plage in self.plages))
+
+    def __len__(self):
+        return self.cumul[-1] if self.cumul else 0
+
+    def __getitem__(self, position):
+        numero = bisect_right(self.cumul, position)
+        debut = self.cumul[numero - 1] if numero else 0
+        return self.plages[numero][position - debut]
+
+class Population:
+    """Séquence de capteurs construits à leur premier accès puis conservés."""
+
+    def __init__(self, type_capteur, taille, fabrique, indices=None):
+        self.type_capteur = type_capteur
+        self.indices = indices if indices is not None else range(taille)
+        self.fabrique = fabrique
+        self.capteurs = {}
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        index = self.indices[position]
+        capteur = self.capteurs.get(index)
+        if capteur is None:
+            capteur = self.fabrique(index, generateur(self.type_capteur, index))
+            self.capteurs[index] = capteur
+        return capteur
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+class Catalogue(dict):
+    """Dictionnaire dont les entrées absentes sont construites à la demande depuis leur clé."""
+
+    def __init__(self, type_capteur, fabrique):
+        super().__init__()
+        self.type_capteur = type_capteur
+        self.fabrique = fabrique
+
+    def __missing__(self, cle):
+        valeur = self.fabrique(cle, generateur(self.type_capteur, cle))
+        self[cle] = valeur
+        return valeur
+
+def charger(type_capteur, liste_predefinie, fabrique):
+    """Retourne la population d'un type: générée si une échelle est configurée, sinon la liste prédéfinie.
+
+    fabrique(index, rng) construit la description du capteur d'index donné. Seuls
+    les capteurs des shards de ce processus sont retenus.
+    """
+    taille = taille_population(type_capteur)
+    if taille is None:
+        if SHARDS is None:
+            return liste_predefinie
+        return [capteur for index, capteur in enumerate(liste_predefinie) if index % NOMBRE_SHARDS in SHARDS]
+    
+    if SHARDS is None:
+        population = Population(type_capteur, taille, fabrique)
+    else:
+        population = Population(type_capteur, taille, fabrique, IndicesShards(taille, SHARDS, NOMBRE_SHARDS))
+    print(f"Population générée: {len(population)}/{taille} capteurs de type {type_capteur}")
+    return population
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Outils de publication MQTT communs à tous les simulateurs de capteurs.
+"""
+
+import json
+import re
+import time
+import threading
+from collections import deque
+import sys
+import os
+
+# Ajout du répertoire parent au path pour importer config.py
+RACINE_PROJET = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RACINE_PROJET)
+from config import TAILLE_MAX_LOT, TAILLE_TAMPON_MEMOIRE, REPERTOIRE_TAMPON, DEBIT_REJEU
+from population import SHARDS, suffixe_shard
+
+# Suffixe des topics transportant un lot de lectures
+SUFFIXE_LOT = "batch"
+
+# Tampons créés dans ce processus (consultés pour les statistiques de publication)
+tampons_actifs = []
+
+# Lots contenant des lectures pas encore publiées (vidés avant l'arrêt d'un worker)
+lots_en_cours = set()
+
+# Dernier numéro de séquence publié par capteur (clé: topic de publication individuelle)
+sequences = {}
+
+def estampiller(topic, donnees):
+    """Ajoute à une lecture son numéro de séquence et son heure de publication.
+
+    Le numéro "seq" croît de 1 à chaque lecture d'un même capteur: l'API en
+    déduit les messages perdus ou dupliqués. "t_publication" est l'heure réelle
+    (time.time(), et non l'horloge simulée) à laquelle la lecture est publiée.
+    """
+    seq = sequences.get(topic, 0) + 1
+    sequences[topic] = seq
+    donnees["seq"] = seq
+    donnees["t_publication"] = time.time()
+    return donnees
+
+class LotLectures:
+    """Regroupe plusieurs lectures dans un message unique publié sur un topic de lot.
+
+    Le message publié a la forme {"lectures": [{"id": ..., "donnees": {...}}, ...]},
+    où "id" est le dernier segment du topic utilisé en publication individuelle.
+    """
+
+    def __init__(self, tampon, topic_base, taille_max=TAILLE_MAX_LOT):
+        self.tampon = tampon
+        self.topic_base = topic_base
+        self.topic = f"{topic_base}/{SUFFIXE_LOT}"
+        self.taille_max = taille_max
+        self.lectures = []
+
+    def ajouter(self, cle, donnees):
+        """Ajoute une lecture au lot et le publie si la taille maximale est atteinte."""
+        estampiller(f"{self.topic_base}/{cle}", donnees)
+        self.lectures.append({"id": cle, "donnees": donnees})
+        lots_en_cours.add(self)
+        if len(self.lectures) >= self.taille_max:
+            self.vider()
+
+    def vider(self):
+        """Publie les lectures en attente en un seul message."""
+        if not self.lectures:
+            return
+        # Les lectures du lot sont publiées ensemble: même heure de publication
+        instant = time.time()
+        for lecture in self.lectures:
+            lecture["donnees"]["t_publication"] = instant
+        message = json.dumps({"lectures": self.lectures}, ensure_ascii=False)
+        envoye = self.tampon.publier(self.topic, message)
+        
+        # Vérification de la publication
+        if envoye:
+            print(f"Lot de {len(self.lectures)} lectures envoyé au topic {self.topic}")
+        else:
+            print(f"Broker indisponible, lot au topic {self.topic} mis en tampon")
+        self.lectures = []
+        lots_en_cours.discard(self)
+
+def reprendre_debordements(repertoire, nom, chemin_debordement):
+    """Ajoute au fichier de débordement les fichiers laissés par d'autres ensembles de shards de ce processus.
+
+    Quand les shards d'un worker arrêté sont confiés à un survivant, celui-ci
+    redémarre avec un nouvel ensemble de shards, donc un nouveau nom de fichier:
+    les fichiers de l'ancien ensemble et du worker arrêté ne seraient plus rejoués.
+    """
+    if SHARDS is None:
+        return
+    motif = re.compile(re.escape(nom) + r"_shard(\d+(?:-\d+)*)\.ndjson")
+    for nom_fichier in sorted(os.listdir(repertoire)):
+        correspondance = motif.fullmatch(nom_fichier)
+        chemin = os.path.join(repertoire, nom_fichier)
+        if correspondance is None or chemin == chemin_debordement:
+            continue
+        if not {int(shard) for shard in correspondance.group(1).split("-")} <= set(SHARDS):
+            continue
+        with open(chemin, "rb") as fichier:
+            contenu = fichier.read()
+        # Une dernière ligne incomplète (arrêt pendant l'écriture) arrêterait le rejeu
+        contenu = contenu[:contenu.rfind(b"\n") + 1]
+        if contenu:
+            with open(chemin_debordement, "ab") as fichier:
+                fichier.write(contenu)
+            messages = contenu.count(b"\n")
+            print(f"Tampon {nom_fichier} repris dans {os.path.basename(chemin_debordement)} ({messages} messages)")
+        os.remove(chemin)
+
+def arreter_publications():
+    """Publie les lots en cours puis déverse les tampons du processus, avant son arrêt."""
+    for lot in list(lots_en_cours):
+        lot.vider()
+    for tampon in tampons_actifs:
+        tampon.deverser()
+
+class TamponPublication:
+    """Publie les messages MQTT en les conservant lorsque le broker est injoignable.
+
+    Les messages non publiés sont gardés dans une file mémoire bornée, puis écrits
+    dans un fichier de débordement en ajout seul lorsque la file est pleine. À la
+    reconnexion, un thread les rejoue dans l'ordre à un débit limité.
+    """
+
+    def __init__(self, client, nom, taille_memoire=TAILLE_TAMPON_MEMOIRE, debit_rejeu=DEBIT_REJEU):
+        self.client = client
+        self.taille_memoire = taille_memoire
+        self.intervalle_rejeu = 1.0 / debit_rejeu if debit_rejeu > 0 else 0
+        self.file_memoire = deque()
+        self.verrou = threading.Lock()
+        self.connecte = threading.Event()
+        self.message_disponible = threading.Event()
+        
+        # Fichier de débordement: écrit en ajout, relu depuis position_lecture
+        repertoire = os.path.join(RACINE_PROJET, REPERTOIRE_TAMPON)
+        os.makedirs(repertoire, exist_ok=True)
+        self.chemin_debordement = os.path.join(repertoire, f"{nom}{suffixe_shard()}.ndjson")
+        reprendre_debordements(repertoire, nom, self.chemin_debordement)
+        self.fichier_ecriture = open(self.chemin_debordement, "ab")
+        self.fichier_lecture = open(self.chemin_debordement, "rb")
+        self.position_lecture = 0
+        
+        # Un fichier laissé par une exécution précédente est rejoué à la connexion
+        self.debordement_en_attente = os.path.getsize(self.chemin_debordement) > 0
+        
+        # Compteurs de suivi
+        self.statistiques = {
+            "publies": 0,
+            "bufferises": 0,
+            "deverses": 0,
+            "rejoues": 0,
+            "duree_publication": 0.0  # Temps cumulé passé dans client.publish (secondes)
+        }
+        
+        # Chaîner les callbacks de connexion existants
+        au_connexion_initial = client.on_connect
+        au_deconnexion_initial = client.on_disconnect
+        
+        def au_connexion(client, userdata, flags, rc):
+            if au_connexion_initial:
+                au_connexion_initial(client, userdata, flags, rc)
+            if rc == 0:
+                self.connecte.set()
+                self.message_disponible.set()
+        
+        def au_deconnexion(client, userdata, rc):
+            self.connecte.clear()
+            print(f"Déconnecté du broker MQTT (code {rc}), les messages seront mis en tampon")
+            if au_deconnexion_initial:
+                au_deconnexion_initial(client, userdata, rc)
+        
+        client.on_connect = au_connexion
+        client.on_disconnect = au_deconnexion
+        
+        thread_rejeu = threading.Thread(target=self._rejouer)
+        thread_rejeu.daemon = True
+        thread_rejeu.start()
+        
+        tampons_actifs.append(self)
+
+    def deverser(self):
+        """Écrit dans le fichier de débordement les messages en attente en mémoire, puis se déconnecte.
+
+        Les messages en mémoire sont plus anciens que ceux du fichier: ils sont
+        placés avant la partie du fichier qui n'a pas encore été rejouée, pour
+        qu'un processus qui reprend ce fichier les rejoue dans l'ordre.
+        """
+        with self.verrou:
+            self.fichier_lecture.seek(self.position_lecture)
+            reste = self.fichier_lecture.read()
+            reste = reste[:reste.rfind(b"\n") + 1]
+            lignes = [json.dumps({"topic": topic, "message": message, "retain": retain}, ensure_ascii=False).encode()
+                      + b"\n" for topic, message, retain in self.file_memoire]
+            self.statistiques["deverses"] += len(lignes)
+            self.file_memoire.clear()
+            
+            chemin_temporaire = self.chemin_debordement + ".tmp"
+            with open(chemin_temporaire, "wb") as fichier:
+                fichier.writelines(lignes)
+                fichier.write(reste)
+            self.fichier_ecriture.close()
+            self.fichier_lecture.close()
+            os.replace(chemin_temporaire, self.chemin_debordement)
+            # Le thread de rejeu reste en attente de connexion jusqu'à la fin du processus
+            self.debordement_en_attente = False
+            self.connecte.clear()
+            
+            # Les messages déjà transmis au client partent avant le paquet DISCONNECT
+            self.client.disconnect()
+        self.client.loop_stop()
+
+    def publier(self, topic, message, retain=False):
+        """Publie un message, ou le met en tampon si le broker est injoignable.
+
+        Retourne True si le message a été transmis au client MQTT.
+        """
+        with self.verrou:
+            # Publication directe seulement si rien n'attend, pour préserver l'ordre
+            if self.connecte.is_set() and not self.file_memoire and not self.debordement_en_attente:
+                debut = time.perf_counter()
+                result = self.client.publish(topic, message, retain=retain)
+                self.statistiques["duree_publication"] += time.perf_counter() - debut
+                if result[0] == 0:
+                    self.statistiques["publies"] += 1
+                    return True
+            
+            self._mettre_en_tampon(topic, message, retain)
+            return False
+
+    def _mettre_en_tampon(self, topic, message, retain):
+        """Ajoute un message au tampon mémoire ou au fichier de débordement (verrou acquis)."""
+        if self.debordement_en_attente or len(self.file_memoire) >= self.taille_memoire:
+            ligne = json.dumps({"topic": topic, "message": message, "retain": retain}, ensure_ascii=False)
+            self.fichier_ecriture.write(ligne.encode() + b"\n")
+            self.fichier_ecriture.flush()
+            self.debordement_en_attente = True
+            self.statistiques["deverses"] += 1
+        else:
+            self.file_memoire.append((topic, message, retain))
+            self.statistiques["bufferises"] += 1
+        self.message_disponible.set()
+
+    def _prochain_message(self):
+        """Retire le plus ancien message en attente (verrou acquis).
+
+        Retourne (message, position) où position est l'offset du fichier de
+        débordement avant lecture, ou None si le message vient de la mémoire.
+        """
+        if self.file_memoire:
+            return self.file_memoire.popleft(), None
+        
+        if self.debordement_en_attente:
+            position = self.position_lecture
+            self.fichier_lecture.seek(position)
+            ligne = self.fichier_lecture.readline()
+            if ligne.endswith(b"\n"):
+                self.position_lecture = self.fichier_lecture.tell()
+                enregistrement = json.loads(ligne)
+                return (enregistrement["topic"], enregistrement["message"], enregistrement["retain"]), position
+            
+            # Fichier entièrement rejoué: le vider
+            self.fichier_ecriture.truncate(0)
+            self.position_lecture = 0
+            self.debordement_en_attente = False
+        
+        return None, None
+
+    def _rejouer(self):
+        """Rejoue les messages en attente dans l'ordre, à débit limité."""
+        rejeu_en_cours = False
+        while True:
+            self.message_disponible.wait()
+            self.connecte.wait()
+            
+            with self.verrou:
+                message, position = self._prochain_message()
+                if message is None:
+                    self.message_disponible.clear()
+                    if rejeu_en_cours:
+                        print(f"Rejeu du tampon terminé: {self.statistiques}")
+                        rejeu_en_cours = False
+                    continue
+                
+                topic, contenu, retain = message
+                result = self.client.publish(topic, contenu, retain=retain)
+                if result[0] == 0:
+                    self.statistiques["rejoues"] += 1
+                    rejeu_en_cours = True
+                else:
+                    # Échec: remettre le message en tête avant de réessayer
+                    if position is None:
+                        self.file_memoire.appendleft(message)
+                    else:
+                        self.position_lecture = position
+            
+            time.sleep(self.intervalle_rejeu if result[0] == 0 else 1)
@@ -19,3 +19,36 @@ INTERVALLE_BATIMENTS = 60    # Mise à jour toutes les 5 minutes
 INTERVALLE_WIFI = 30          # Mise à jour toutes les 30 secondes
 INTERVALLE_METEO = 120        # Mise à jour toutes les 2 minutes
 INTERVALLE_TRANSPORT = 15     # Mise à jour toutes les 15 secondes
+
+# Les dernières valeurs de chaque capteur sont publiées en message retenu: le broker les
+# renvoie à chaque nouvel abonné (redémarrage à chaud de l'API). Les lots ne sont pas retenus.
+PUBLICATION_RETENUE = True
+
+# Mode lot: regroupe les lectures d'un cycle dans un seul message publié sur <topic>/batch
+MODE_LOT = False
+TAILLE_MAX_LOT = 500          # Nombre maximal de lectures par message de lot
+
+# Tampon de publication utilisé lorsque le broker est injoignable
+TAILLE_TAMPON_MEMOIRE = 10000  # Nombre maximal de messages gardés en mémoire
+REPERTOIRE_TAMPON = "tampons"  # Fichiers de débordement (relatif à la racine du projet)
+DEBIT_REJEU = 200              # Messages rejoués par seconde après reconnexion
+
+# Horloge de simulation (surchargeable par les variables SIMULATION_VITESSE / SIMULATION_DEBUT)
+VITESSE_SIMULATION = 1.0       # Multiplicateur du temps simulé (96 = 24 h en 15 minutes)
+DEBUT_SIMULATION = None        # Date de départ simulée "AAAA-MM-JJ HH:MM", None = maintenant
+
+# Population de capteurs à grande échelle (surchargeable par SIMULATION_ECHELLE / SIMULATION_SCENARIO)
+ECHELLE_SIMULATION = None      # Nombre de capteurs générés par type, None = listes prédéfinies
+FICHIER_SCENARIO = None        # Fichier JSON décrivant la population (prioritaire sur l'échelle)
+
+# Mode vectorisé (NumPy): l'état de tous les capteurs météo, Wi-Fi et parking avance en une étape
+MODE_VECTORISE = False
+
+# Objectifs du diagnostic de performance (python3 diagnostic.py --perf), surchargeables par --cible nom=valeur
+CIBLES_DIAGNOSTIC = {
+    "connexion_broker_ms": 100,   # Durée maximale de connexion au broker (jusqu'à l'acquittement CONNACK)
+    "aller_retour_p99_ms": 20,    # Latence publication -> réception sur un topic en boucle (p99)
+    "debit_publication": 2000,    # Débit soutenu minimal publié et reçu (messages/s)
+    "api_p95_ms": 100,            # Latence p95 de /api/status et des routes de chaque catégorie
+    "json_operations": 20000      # Encodages et décodages JSON minimaux par seconde, par payload
+}
@@ -3,9 +3,18 @@
 
 """
 Script principal pour démarrer tous les simulateurs de capteurs IoT.
+
+Avec --shards N, chaque simulateur est réparti sur N processus workers qui
+simulent chacun une partie de la population, avec leur propre connexion MQTT
+et une graine aléatoire déterministe.
 """
 
+import argparse
+import importlib
+import multiprocessing
+import queue
 import subprocess
+import threading
 import time
 import os
 import signal
@@ -23,6 +32,11 @@ SIMULATEURS = [
 # Liste pour stocker les processus
 processus = []
 
+# Mode multi-processus
+PERIODE_STATISTIQUES = 5   # Période de remontée des statistiques des workers (secondes)
+MAX_REDEMARRAGES = 3       # Redémarrages d'un worker avant répartition de ses shards
+DELAI_ARRET = 10           # Délai laissé à un worker pour déverser ses tampons (secondes)
+
 def arreter_simulateurs(signal, frame):
     """Arrête proprement tous les simulateurs en cas d'interruption."""
     print("\nArrêt des simulateurs...")
@@ -31,15 +45,209 @@ def arreter_simulateurs(signal, frame):
             proc.terminate()
     sys.exit(0)
 
+def demander_arret(signal, frame):
+    """Interrompt la simulation du worker (SIGTERM du superviseur)."""
+    sys.exit(0)
+
+def executer_worker(simulateur, shards, nombre_shards, graine, file_statistiques):
+    """Point d'entrée d'un worker: simule les shards qui lui sont attribués."""
+    # La partition et la graine doivent être connues avant l'import du simulateur
+    os.environ["SIMULATION_SHARDS"] = ",".join(str(shard) for shard in shards)
+    os.environ["SIMULATION_NB_SHARDS"] = str(nombre_shards)
+    os.environ["SIMULATION_GRAINE"] = str(graine)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "capteurs"))
+    
+    # Les messages individuels ne sont pas affichés: le superviseur agrège les statistiques
+    sys.stdout = open(os.devnull, "w")
+    
+    # L'arrêt est piloté par le superviseur, par SIGTERM: SystemExit remonte jusqu'ici en libérant
+    # les verrous tenus par la simulation, puis les lots et tampons sont vidés (voir arreter_publications)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, demander_arret)
+    
+    module = importlib.import_module(os.path.splitext(os.path.basename(simulateur))[0])
+    import publication
+    
+    def remonter_statistiques():
+        while True:
+            time.sleep(PERIODE_STATISTIQUES)
+            statistiques = {}
+            for tampon in publication.tampons_actifs:
+                for cle, valeur in tampon.statistiques.items():
+                    statistiques[cle] = statistiques.get(cle, 0) + valeur
+            file_statistiques.put((simulateur, tuple(shards), time.time(), statistiques))
+    
+    thread_statistiques = threading.Thread(target=remonter_statistiques)
+    thread_statistiques.daemon = True
+    thread_statistiques.start()
+    
+    try:
+        module.executer()
+    except SystemExit:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        publication.arreter_publications()
+        raise
+
+def demarrer_worker(contexte, worker, nombre_shards, graine_base, file_statistiques):
+    """Démarre (ou redémarre) le processus d'un worker."""
+    graine = graine_base * 1000 + worker["shards"][0]
+    worker["processus"] = contexte.Process(
+        target=executer_worker,
+        args=(worker["simulateur"], worker["shards"], nombre_shards, graine, file_statistiques)
+    )
+    worker["processus"].daemon = True
+    worker["processus"].start()
+    worker["mesures"] = []
+    print(f"Worker '{worker['simulateur']}' shards {worker['shards']} démarré avec PID {worker['processus'].pid}")
+
+def collecter_statistiques(file_statistiques, workers):
+    """Range les statistiques remontées par les workers (deux dernières mesures par worker)."""
+    while True:
+        try:
+            simulateur, shards, instant, statistiques = file_statistiques.get_nowait()
+        except queue.Empty:
+            return
+        for worker in workers:
+            if worker["simulateur"] == simulateur and tuple(worker["shards"]) == shards:
+                worker["mesures"] = (worker["mesures"] + [(instant, statistiques)])[-2:]
+
+def arreter_worker(worker):
+    """Demande l'arrêt d'un worker et attend qu'il ait déversé ses tampons."""
+    worker["processus"].terminate()
+    worker["processus"].join(DELAI_ARRET)
+    if worker["processus"].is_alive():
+        print(f"Le worker '{worker['simulateur']}' shards {worker['shards']} ne s'est pas arrêté, "
+              f"ses messages en attente sont perdus")
+        worker["processus"].kill()
+        worker["processus"].join()
+
+def surveiller_workers(contexte, workers, nombre_shards, graine_base, file_statistiques):
+    """Redémarre les workers arrêtés, ou répartit leurs shards sur un worker survivant."""
+    for worker in list(workers):
+        if worker["processus"].is_alive():
+            continue
+        
+        print(f"Le worker '{worker['simulateur']}' shards {worker['shards']} "
+              f"s'est arrêté avec le code {worker['processus'].exitcode}")
+        
+        if worker["redemarrages"] < MAX_REDEMARRAGES:
+            worker["redemarrages"] += 1
+            demarrer_worker(contexte, worker, nombre_shards, graine_base, file_statistiques)
+            continue
+        
+        # Trop de redémarrages: confier ses shards au worker le moins chargé du même simulateur
+        workers.remove(worker)
+        survivants = [w for w in workers if w["simulateur"] == worker["simulateur"] and w["processus"].is_alive()]
+        if not survivants:
+            print(f"Plus aucun worker pour '{worker['simulateur']}', shards {worker['shards']} abandonnés")
+            continue
+        
+        repreneur = min(survivants, key=lambda w: len(w["shards"]))
+        print(f"Répartition des shards {worker['shards']} sur le worker shards {repreneur['shards']}")
+        arreter_worker(repreneur)
+        repreneur["shards"] = sorted(repreneur["shards"] + worker["shards"])
+        demarrer_worker(contexte, repreneur, nombre_shards, graine_base, file_statistiques)
+
+def afficher_statistiques(workers):
+    """Affiche le débit et la latence de publication agrégés par simulateur."""
+    agregats = {}
+    for worker in workers:
+        agregat = agregats.setdefault(worker["simulateur"], {
+            "workers": 0, "debit": 0.0, "publies": 0, "duree": 0.0, "en_attente": 0
+        })
+        agregat["workers"] += worker["processus"].is_alive()
+        if len(worker["mesures"]) < 2:
+            continue
+        (instant_1, mesure_1), (instant_2, mesure_2) = worker["mesures"]
+        publies = mesure_2["publies"] - mesure_1["publies"]
+        agregat["debit"] += publies / max(instant_2 - instant_1, 1e-9)
+        agregat["publies"] += publies
+        agregat["duree"] += mesure_2["duree_publication"] - mesure_1["duree_publication"]
+        agregat["en_attente"] += mesure_2["bufferises"] + mesure_2["deverses"] - mesure_2["rejoues"]
+    
+    total = 0.0
+    for simulateur, agregat in agregats.items():
+        latence = agregat["duree"] / agregat["publies"] * 1e6 if agregat["publies"] else 0.0
+        print(f"  {simulateur:<32} workers: {agregat['workers']:>3}  {agregat['debit']:>10.0f} msg/s  "
+              f"publish: {latence:>7.1f} µs  en tampon: {agregat['en_attente']}")
+        total += agregat["debit"]
+    print(f"  {'total':<32} {total:>25.0f} msg/s")
+
+def superviser_shards(simulateurs, nombre_shards, graine_base):
+    """Répartit chaque simulateur sur nombre_shards workers et les supervise."""
+    contexte = multiprocessing.get_context("spawn")
+    file_statistiques = contexte.Queue()
+    
+    workers = []
+    for simulateur in simulateurs:
+        for shard in range(nombre_shards):
+            worker = {"simulateur": simulateur, "shards": [shard], "redemarrages": 0}
+            demarrer_worker(contexte, worker, nombre_shards, graine_base, file_statistiques)
+            workers.append(worker)
+    
+    try:
+        while True:
+            time.sleep(PERIODE_STATISTIQUES)
+            collecter_statistiques(file_statistiques, workers)
+            surveiller_workers(contexte, workers, nombre_shards, graine_base, file_statistiques)
+            afficher_statistiques(workers)
+    except KeyboardInterrupt:
+        print("\nArrêt des workers...")
+        for worker in workers:
+            if worker["processus"].is_alive():
+                worker["processus"].terminate()
+        for worker in workers:
+            worker["processus"].join(DELAI_ARRET)
+
+def analyser_arguments():
+    """Analyse les arguments de la ligne de commande."""
+    parser = argparse.ArgumentParser(description="Démarre tous les simulateurs de capteurs IoT.")
+    parser.add_argument("--vitesse", type=float, default=None,
+                        help="Multiplicateur du temps simulé (ex: 96 pour rejouer 24 h en 15 minutes)")
+    parser.add_argument("--debut", default=None,
+                        help="Date de départ simulée, format \"AAAA-MM-JJ HH:MM\"")
+    parser.add_argument("--echelle", type=int, default=None,
+                        help="Nombre de capteurs générés par type de simulateur")
+    parser.add_argument("--scenario", default=None,
+                        help="Fichier JSON décrivant la population de capteurs à générer")
+    parser.add_argument("--shards", type=int, default=None,
+                        help="Nombre de processus workers par simulateur (mode multi-processus)")
+    parser.add_argument("--graine", type=int, default=1,
+                        help="Graine de base des workers en mode multi-processus")
+    parser.add_argument("--simulateurs", nargs="+", default=None,
+                        help="Simulateurs à démarrer (ex: parking wifi), tous par défaut")
+    return parser.parse_args()
+
 def main():
     """Fonction principale."""
+    arguments = analyser_arguments()
+    
+    # Les simulateurs héritent de l'environnement: transmettre l'horloge et la population
+    if arguments.vitesse is not None:
+        os.environ["SIMULATION_VITESSE"] = str(arguments.vitesse)
+    if arguments.debut is not None:
+        os.environ["SIMULATION_DEBUT"] = arguments.debut
+    if arguments.echelle is not None:
+        os.environ["SIMULATION_ECHELLE"] = str(arguments.echelle)
+    if arguments.scenario is not None:
+        os.environ["SIMULATION_SCENARIO"] = os.path.abspath(arguments.scenario)
+    
+    simulateurs = SIMULATEURS
+    if arguments.simulateurs:
+        simulateurs = [f"capteurs/capteur_{nom}.py" for nom in arguments.simulateurs]
+    
+    if arguments.shards:
+        print(f"Démarrage des simulateurs en mode multi-processus ({arguments.shards} shards chacun)...")
+        superviser_shards(simulateurs, arguments.shards, arguments.graine)
+        return
+    
     # Gestionnaire de signal pour arrêter proprement les simulateurs
     signal.signal(signal.SIGINT, arreter_simulateurs)
     
     print("Démarrage de tous les simulateurs de capteurs IoT...")
     
     # Démarrer chaque simulateur
-    for simulateur in SIMULATEURS:
+    for simulateur in simulateurs:
         chemin_simulateur = os.path.join(os.path.dirname(os.path.abspath(__file__)), simulateur)
         
         # S'assurer que le script est exécutable
@@ -65,15 +273,15 @@ def main():
             # Vérifier si tous les processus sont toujours en cours d'exécution
             for i, proc in enumerate(processus):
                 if proc.poll() is not None:  # Le processus s'est terminé
-                    print(f"Le simulateur '{SIMULATEURS[i]}' s'est arrêté avec le code {proc.returncode}")
+                    print(f"Le simulateur '{simulateurs[i]}' s'est arrêté avec le code {proc.returncode}")
                     # Afficher les erreurs éventuelles
                     stderr = proc.stderr.read()
                     if stderr:
                         print(f"Erreur: {stderr}")
                     
                     # Redémarrer le simulateur
-                    print(f"Redémarrage du simulateur '{SIMULATEURS[i]}'...")
-                    chemin_simulateur = os.path.join(os.path.dirname(os.path.abspath(__file__)), SIMULATEURS[i])
+                    print(f"Redémarrage du simulateur '{simulateurs[i]}'...")
+                    chemin_simulateur = os.path.join(os.path.dirname(os.path.abspath(__file__)), simulateurs[i])
                     proc = subprocess.Popen(
                         ["python3", chemin_simulateur],
                         stdout=subprocess.PIPE,
@@ -82,7 +290,7 @@ def main():
                         bufsize=1
                     )
                     processus[i] = proc
-                    print(f"Simulateur '{SIMULATEURS[i]}' redémarré avec PID {proc.pid}")
+                    print(f"Simulateur '{simulateurs[i]}' redémarré avec PID {proc.pid}")
             
             # Attendre un peu avant de vérifier à nouveau
             time.sleep(5)
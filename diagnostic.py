@@ -3,10 +3,22 @@
 
 """
 Script de diagnostic pour le projet IoT.
+
+Sans option, vérifie les modules nécessaires et les chemins Python. Avec --perf,
+mesure les performances de l'installation (broker MQTT, API REST, JSON,
+accélérateurs optionnels) et les compare aux objectifs CIBLES_DIAGNOSTIC de
+config.py, surchargeables par --cible nom=valeur.
+
+    python3 diagnostic.py [--perf] [--api http://localhost:5000] [--cible aller_retour_p99_ms=10]
 """
 
-import sys
+import argparse
 import importlib
+import math
+import os
+import sys
+import time
+import timeit
 
 # Liste des modules à vérifier
 modules = [
@@ -16,25 +28,307 @@ modules = [
     "paho.mqtt.client"
 ]
 
-print("== Diagnostic du projet IoT ==")
-print(f"Python version: {sys.version}")
-print("Vérification des modules...")
+RACINE_PROJET = os.path.dirname(os.path.abspath(__file__))
+
+# Routes de l'API mesurées par --perf
+ROUTES_API = ["/api/status", "/api/parking", "/api/batiments", "/api/wifi", "/api/meteo", "/api/transport/bus",
+              "/api/transport/taxi"]
+REQUETES_PAR_ROUTE = 20
+ALLERS_RETOURS = 100
+
+# Accélérateurs optionnels et chemins de code qu'ils activent (None: module inutilisé par le projet)
+ACCELERATEURS = [
+    ("numpy", "agrégations de /api/query, index des segments, archive npz, simulateurs vectorisés (MODE_VECTORISE)"),
+    ("pyarrow", "archive à froid au format parquet"),
+    ("geopy", "distance géodésique des bus et taxis (sinon formule de haversine, plus rapide et moins précise)"),
+    ("orjson", None)
+]
+
+STATUTS = {"ok": "✅", "avertissement": "⚠️ ", "echec": "❌", "info": "ℹ️ "}
+
+def verifier_modules():
+    """Vérifie que les modules nécessaires s'importent."""
+    print("Vérification des modules...")
+
+    for module_name in modules:
+        try:
+            module = importlib.import_module(module_name)
+            print(f"✅ {module_name} - OK (version: {getattr(module, '__version__', 'inconnue')})")
+
+            # Vérification spécifique pour paho.mqtt
+            if module_name == "paho.mqtt.client":
+                print(f"   - API versions disponibles: {dir(module.CallbackAPIVersion)}")
+        except ImportError:
+            print(f"❌ {module_name} - ÉCHEC: Module non trouvé")
+        except Exception as e:
+            print(f"❌ {module_name} - ÉCHEC: {str(e)}")
+
+    print("\nVérification des chemins Python:")
+    for path in sys.path:
+        print(f"- {path}")
+
+def centile(valeurs, q):
+    """Centile (méthode du rang le plus proche) d'une liste de valeurs."""
+    triees = sorted(valeurs)
+    return triees[min(len(triees) - 1, max(0, math.ceil(q * len(triees)) - 1))]
+
+class Bilan:
+    """Résultats des vérifications de performance: (statut, vérification, détail)."""
+
+    def __init__(self):
+        self.resultats = []
+
+    def ajouter(self, statut, verification, detail):
+        self.resultats.append((statut, verification, detail))
+        print(f"{STATUTS[statut]} {verification}: {detail}")
+
+    def comparer(self, verification, valeur, cible, unite, maximum=True):
+        """Enregistre une mesure comparée à son objectif (maximal, ou minimal si maximum=False)."""
+        respecte = valeur <= cible if maximum else valeur >= cible
+        comparaison = "≤" if maximum else "≥"
+        self.ajouter("ok" if respecte else "avertissement", verification,
+                     f"{valeur:.1f} {unite} (objectif {comparaison} {cible:g} {unite})")
+
+    def compter(self, statut):
+        return sum(1 for resultat in self.resultats if resultat[0] == statut)
+
+def mesurer_broker(adresse, port, cibles, nombre_messages, bilan):
+    """Connexion au broker, aller-retour publication -> réception et débit soutenu sur des topics de diagnostic."""
+    import queue
+    import threading
+    import uuid
+    import paho.mqtt.client as mqtt_client
+
+    identifiant = str(uuid.uuid4())[:8]
+    # Hors de l'espace iot/: l'API n'est pas abonnée à ces topics
+    topic_boucle = f"diagnostic/{identifiant}/boucle"
+    topic_debit = f"diagnostic/{identifiant}/debit"
+    connexion = threading.Event()
+    abonnement = threading.Event()
+    reponses = queue.Queue()
+    debit = {"recus": 0, "dernier": None, "termine": threading.Event(), "attendus": nombre_messages}
+
+    def au_connexion(client, userdata, flags, rc):
+        userdata["rc"] = rc
+        userdata["connecte"] = time.perf_counter()
+        connexion.set()
+
+    def au_abonnement(client, userdata, mid, granted_qos):
+        abonnement.set()
+
+    def au_message(client, userdata, msg):
+        if msg.topic == topic_debit:
+            debit["recus"] += 1
+            debit["dernier"] = time.perf_counter()
+            if debit["recus"] >= debit["attendus"]:
+                debit["termine"].set()
+        else:
+            reponses.put((msg.payload, time.perf_counter()))
 
-for module_name in modules:
+    etat = {}
+    client = mqtt_client.Client(client_id=f"diagnostic_{identifiant}", userdata=etat,
+                                callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
+    client.on_connect = au_connexion
+    client.on_subscribe = au_abonnement
+    client.on_message = au_message
+
+    debut = time.perf_counter()
+    try:
+        client.connect(adresse, port)
+    except OSError as e:
+        bilan.ajouter("echec", "Connexion au broker", f"{adresse}:{port} injoignable ({e})")
+        return
+    client.loop_start()
+    try:
+        if not connexion.wait(5) or etat["rc"] != 0:
+            bilan.ajouter("echec", "Connexion au broker", f"refusée ou sans réponse (code {etat.get('rc')})")
+            return
+        bilan.comparer("Connexion au broker", (etat["connecte"] - debut) * 1000, cibles["connexion_broker_ms"], "ms")
+
+        client.subscribe([(topic_boucle, 0), (topic_debit, 0)])
+        if not abonnement.wait(5):
+            bilan.ajouter("echec", "Abonnement au broker", "aucun acquittement en 5 s")
+            return
+
+        # Aller-retour: chaque message est attendu avant de publier le suivant
+        latences, perdus = [], 0
+        for indice in range(ALLERS_RETOURS):
+            contenu = str(indice).encode()
+            emission = time.perf_counter()
+            client.publish(topic_boucle, contenu)
+            try:
+                while True:
+                    recu, instant = reponses.get(timeout=2)
+                    if recu == contenu:
+                        latences.append(instant - emission)
+                        break
+            except queue.Empty:
+                perdus += 1
+        if latences:
+            bilan.comparer(f"Aller-retour MQTT (p99 sur {ALLERS_RETOURS}, médiane {centile(latences, 0.5) * 1000:.2f} ms)",
+                           centile(latences, 0.99) * 1000, cibles["aller_retour_p99_ms"], "ms")
+        if perdus:
+            bilan.ajouter("avertissement", "Aller-retour MQTT", f"{perdus} message(s) sans réponse en 2 s")
+
+        # Débit soutenu: nombre_messages publiés d'affilée, mesurés jusqu'à la réception du dernier
+        contenu = exemples_payloads()["transport (bus)"].encode()
+        debut = time.perf_counter()
+        for _ in range(nombre_messages):
+            client.publish(topic_debit, contenu)
+        debit["termine"].wait(max(10.0, nombre_messages / 500))
+        if debit["recus"]:
+            bilan.comparer(f"Débit soutenu ({debit['recus']}/{nombre_messages} messages reçus)",
+                           debit["recus"] / (debit["dernier"] - debut), cibles["debit_publication"], "msg/s",
+                           maximum=False)
+        if debit["recus"] < nombre_messages:
+            bilan.ajouter("avertissement", "Débit soutenu", f"{nombre_messages - debit['recus']} message(s) perdu(s)")
+    finally:
+        client.disconnect()
+        client.loop_stop()
+
+def mesurer_api(url, cibles, bilan):
+    """Latence de /api/status et des routes de chaque catégorie (connexion persistante)."""
+    import http.client
+    from urllib.parse import urlsplit
+
+    adresse = urlsplit(url)
+    connexion = http.client.HTTPConnection(adresse.hostname, adresse.port or 80, timeout=10)
+    try:
+        for route in ROUTES_API:
+            durees, erreurs = [], 0
+            for _ in range(REQUETES_PAR_ROUTE):
+                debut = time.perf_counter()
+                connexion.request("GET", route)
+                reponse = connexion.getresponse()
+                reponse.read()
+                durees.append(time.perf_counter() - debut)
+                if reponse.status >= 400:
+                    erreurs += 1
+            if erreurs:
+                bilan.ajouter("avertissement", f"API {route}", f"{erreurs}/{REQUETES_PAR_ROUTE} réponses en erreur")
+            bilan.comparer(f"API {route} (p95, médiane {centile(durees, 0.5) * 1000:.2f} ms)",
+                           centile(durees, 0.95) * 1000, cibles["api_p95_ms"], "ms")
+    except (OSError, http.client.HTTPException) as e:
+        bilan.ajouter("echec", "API", f"{url} injoignable ({e})")
+    finally:
+        connexion.close()
+
+def exemples_payloads():
+    """Payloads représentatifs, générés par les simulateurs de transport et de bâtiments."""
+    import json
+    sys.path.insert(0, os.path.join(RACINE_PROJET, "capteurs"))
+    import capteur_batiments
+    import capteur_transport
+    return {
+        "transport (bus)": json.dumps(capteur_transport.generer_donnees_bus(capteur_transport.BUS[0]),
+                                      ensure_ascii=False),
+        "batiments": json.dumps(capteur_batiments.generer_donnees_batiment(capteur_batiments.BATIMENTS[0]),
+                                ensure_ascii=False)
+    }
+
+def operations_par_seconde(fonction):
+    """Nombre d'exécutions par seconde de fonction (meilleure de 3 séries)."""
+    minuteur = timeit.Timer(fonction)
+    nombre, _ = minuteur.autorange()
+    return nombre / min(minuteur.repeat(3, nombre))
+
+def mesurer_json(cibles, bilan):
+    """Débit d'encodage (comme les simulateurs) et de décodage (comme l'API) des payloads représentatifs."""
+    import json
     try:
-        module = importlib.import_module(module_name)
-        print(f"✅ {module_name} - OK (version: {getattr(module, '__version__', 'inconnue')})")
-        
-        # Vérification spécifique pour paho.mqtt
-        if module_name == "paho.mqtt.client":
-            print(f"   - API versions disponibles: {dir(module.CallbackAPIVersion)}")
+        import orjson
     except ImportError:
-        print(f"❌ {module_name} - ÉCHEC: Module non trouvé")
-    except Exception as e:
-        print(f"❌ {module_name} - ÉCHEC: {str(e)}")
+        orjson = None
+
+    for nom, texte in exemples_payloads().items():
+        donnees = json.loads(texte)
+        contenu = texte.encode()
+        encodage = operations_par_seconde(lambda: json.dumps(donnees, ensure_ascii=False))
+        decodage = operations_par_seconde(lambda: json.loads(contenu.decode()))
+        bilan.comparer(f"JSON encodage {nom} ({len(contenu)} octets)", encodage, cibles["json_operations"], "op/s",
+                       maximum=False)
+        bilan.comparer(f"JSON décodage {nom}", decodage, cibles["json_operations"], "op/s", maximum=False)
+        if orjson is not None:
+            bilan.ajouter("info", f"orjson {nom}",
+                          f"encodage {operations_par_seconde(lambda: orjson.dumps(donnees)):.0f} op/s, "
+                          f"décodage {operations_par_seconde(lambda: orjson.loads(contenu)):.0f} op/s")
+
+def verifier_accelerateurs(bilan):
+    """Présence des accélérateurs optionnels et chemins de code qu'ils activent."""
+    from config import MODE_VECTORISE
+    for nom, chemins in ACCELERATEURS:
+        try:
+            module = importlib.import_module(nom)
+        except ImportError:
+            module = None
+        if chemins is None:
+            detail = "inutilisé par le projet, qui encode et décode avec le module json standard"
+        elif module is None:
+            detail = f"désactive: {chemins}"
+        else:
+            detail = f"active: {chemins}"
+            if nom == "numpy" and not MODE_VECTORISE:
+                detail += "; simulateurs vectorisés inactifs (MODE_VECTORISE = False dans config.py)"
+        if module is None:
+            bilan.ajouter("info", f"{nom} absent", detail)
+        else:
+            bilan.ajouter("info", f"{nom} {getattr(module, '__version__', 'présent')}", detail)
+
+def lire_cibles(surcharges):
+    """Objectifs de config.py, surchargés par les --cible nom=valeur."""
+    from config import CIBLES_DIAGNOSTIC
+    cibles = dict(CIBLES_DIAGNOSTIC)
+    for surcharge in surcharges:
+        nom, _, valeur = surcharge.partition("=")
+        if nom not in cibles:
+            raise ValueError(f"Objectif inconnu: {nom} (objectifs: {', '.join(cibles)})")
+        cibles[nom] = float(valeur)
+    return cibles
+
+def diagnostic_performance(arguments):
+    """Mesure les performances de l'installation. Retourne le code de sortie."""
+    from config import BROKER_ADRESSE, BROKER_PORT
+    try:
+        cibles = lire_cibles(arguments.cible)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    bilan = Bilan()
+    print("\nBroker MQTT:")
+    try:
+        mesurer_broker(BROKER_ADRESSE, BROKER_PORT, cibles, arguments.messages, bilan)
+    except ImportError as e:
+        bilan.ajouter("echec", "Broker MQTT", f"paho-mqtt indisponible ({e})")
+    print("\nAPI REST:")
+    mesurer_api(arguments.api, cibles, bilan)
+    print("\nJSON:")
+    mesurer_json(cibles, bilan)
+    print("\nAccélérateurs optionnels:")
+    verifier_accelerateurs(bilan)
+
+    avertissements, echecs = bilan.compter("avertissement"), bilan.compter("echec")
+    print(f"\nRésumé: {bilan.compter('ok')} OK, {avertissements} avertissement(s), {echecs} échec(s)")
+    return 1 if avertissements or echecs else 0
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(description="Script de diagnostic pour le projet IoT")
+    parser.add_argument("--perf", action="store_true", help="Mesurer les performances et les comparer aux objectifs")
+    parser.add_argument("--api", default="http://localhost:5000", help="URL de l'API REST mesurée par --perf")
+    parser.add_argument("--messages", type=int, default=10000, help="Messages publiés pour mesurer le débit soutenu")
+    parser.add_argument("--cible", action="append", default=[], metavar="NOM=VALEUR",
+                        help="Surcharge un objectif de CIBLES_DIAGNOSTIC (répétable)")
+    arguments = parser.parse_args()
+
+    print("== Diagnostic du projet IoT ==")
+    print(f"Python version: {sys.version}")
+    if arguments.perf:
+        return diagnostic_performance(arguments)
 
-print("\nVérification des chemins Python:")
-for path in sys.path:
-    print(f"- {path}")
+    verifier_modules()
+    print("\nTerminé.")
+    return 0
 
-print("\nTerminé.")
+if __name__ == "__main__":
+    sys.exit(main())
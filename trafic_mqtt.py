@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Enregistrement et rejeu du trafic MQTT des capteurs IoT.
+
+    python3 trafic_mqtt.py enregistrer trafic.rec [--duree 3600]
+    python3 trafic_mqtt.py rejouer trafic.rec [--vitesse 10 | --max] [--filtre iot/wifi/#] [--multiplier 5]
+
+Au rejeu, les lectures sont renumérotées (seq) par capteur et datées de leur
+republication (t_publication), sur toutes les boucles et copies de la flotte.
+
+Le fichier d'enregistrement est binaire et en ajout seul: un en-tête suivi,
+pour chaque message, de l'heure de réception (double), des longueurs du topic
+et du contenu, puis des octets du topic et du contenu.
+"""
+
+import argparse
+import json
+import struct
+import time
+import uuid
+from paho.mqtt import client as mqtt_client
+
+from config import BROKER_ADRESSE, BROKER_PORT, CLIENT_ID_BASE
+
+# Format du fichier d'enregistrement
+EN_TETE = b"IOTMQTT1"
+FORMAT_ENREGISTREMENT = struct.Struct("<dHI")  # heure de réception, taille du topic, taille du contenu
+
+# Abonnement par défaut pour l'enregistrement
+TOPIC_ENREGISTREMENT = "iot/#"
+
+def creer_client(role):
+    """Crée un client MQTT connecté au broker."""
+    id_client = f"{CLIENT_ID_BASE}{role}_{str(uuid.uuid4())[:8]}"
+    client = mqtt_client.Client(client_id=id_client, callback_api_version=mqtt_client.CallbackAPIVersion.VERSION1)
+    client.connect(BROKER_ADRESSE, BROKER_PORT)
+    return client
+
+def lire_enregistrements(chemin):
+    """Itère sur les messages (heure, topic, contenu) d'un fichier d'enregistrement."""
+    with open(chemin, "rb") as fichier:
+        if fichier.read(len(EN_TETE)) != EN_TETE:
+            raise ValueError(f"{chemin} n'est pas un fichier d'enregistrement MQTT")
+
+        while True:
+            entete = fichier.read(FORMAT_ENREGISTREMENT.size)
+            if len(entete) < FORMAT_ENREGISTREMENT.size:
+                return  # Fin de fichier (ou dernier enregistrement tronqué)
+            heure, taille_topic, taille_contenu = FORMAT_ENREGISTREMENT.unpack(entete)
+            donnees = fichier.read(taille_topic + taille_contenu)
+            if len(donnees) < taille_topic + taille_contenu:
+                return
+            yield heure, donnees[:taille_topic].decode(), donnees[taille_topic:]
+
+def enregistrer(chemin, topic, duree):
+    """Enregistre les messages reçus sur un topic jusqu'à interruption ou fin de la durée."""
+    fichier = open(chemin, "ab")
+    if fichier.tell() == 0:
+        fichier.write(EN_TETE)
+    nombre_messages = 0
+
+    def au_connexion(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(topic)
+            print(f"Enregistrement du topic {topic} dans {chemin}")
+        else:
+            print(f"Échec de connexion, code retour {rc}")
+
+    def au_message(client, userdata, msg):
+        nonlocal nombre_messages
+        topic_octets = msg.topic.encode()
+        fichier.write(FORMAT_ENREGISTREMENT.pack(time.time(), len(topic_octets), len(msg.payload)))
+        fichier.write(topic_octets)
+        fichier.write(msg.payload)
+        nombre_messages += 1
+
+    client = creer_client("enregistreur")
+    client.on_connect = au_connexion
+    client.on_message = au_message
+    client.loop_start()
+
+    debut = time.time()
+    try:
+        while duree is None or time.time() - debut < duree:
+            time.sleep(1)
+            fichier.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        fichier.close()
+
+    print(f"{nombre_messages} messages enregistrés")
+
+def remapper_identifiant(topic, payload, copie):
+    """Suffixe les identifiants d'un message pour une copie de la flotte. Retourne le topic de la copie.
+
+    payload est le contenu décodé (None s'il n'est pas du JSON); il est modifié sur place.
+    """
+    if copie == 0:
+        return topic
+
+    suffixe = f"_x{copie}"
+    base, _, capteur_id = topic.rpartition("/")
+
+    if capteur_id == "batch" and isinstance(payload, dict):
+        # Lot de lectures: remapper chaque lecture, le topic de lot reste inchangé
+        for lecture in payload.get("lectures", []):
+            lecture["id"] = f"{lecture['id']}{suffixe}"
+            if isinstance(lecture.get("donnees"), dict) and "id" in lecture["donnees"]:
+                lecture["donnees"]["id"] = f"{lecture['donnees']['id']}{suffixe}"
+        return topic
+
+    if isinstance(payload, dict) and "id" in payload:
+        payload["id"] = f"{payload['id']}{suffixe}"
+    return f"{base}/{capteur_id}{suffixe}"
+
+def restampiller(topic, payload, sequences, instant):
+    """Renumérote les lectures d'un message et les date de leur republication.
+
+    Les numéros de séquence enregistrés reculeraient à chaque boucle et seraient
+    partagés par les copies: chaque capteur rejoué (clé: topic de publication
+    individuelle) reçoit sa propre numérotation continue, tenue dans sequences.
+    t_publication reçoit l'heure du rejeu, pour que la latence mesurée par l'API
+    soit celle du transport et non l'âge de l'enregistrement.
+    """
+    base, _, capteur_id = topic.rpartition("/")
+    if capteur_id == "batch":
+        lectures = [(f"{base}/{lecture['id']}", lecture.get("donnees")) for lecture in payload.get("lectures", [])]
+    else:
+        lectures = [(topic, payload)]
+
+    for cle, donnees in lectures:
+        if not isinstance(donnees, dict):
+            continue
+        if "seq" in donnees:
+            donnees["seq"] = sequences[cle] = sequences.get(cle, 0) + 1
+        if "t_publication" in donnees:
+            donnees["t_publication"] = instant
+
+def rejouer(chemin, vitesse, filtres, multiplier, boucles):
+    """Republie un enregistrement en respectant les écarts entre messages divisés par vitesse.
+
+    Une vitesse None republie aussi vite que possible.
+    """
+    client = creer_client("rejeu")
+    client.loop_start()
+    nombre_messages = 0
+    debut_rejeu = time.time()
+    sequences = {}
+
+    try:
+        for _ in range(boucles):
+            debut_boucle = time.monotonic()
+            premiere_heure = None
+
+            for heure, topic, contenu in lire_enregistrements(chemin):
+                if filtres and not any(mqtt_client.topic_matches_sub(f, topic) for f in filtres):
+                    continue
+
+                # Respecter la structure temporelle de l'enregistrement
+                if premiere_heure is None:
+                    premiere_heure = heure
+                if vitesse is not None:
+                    attente = (heure - premiere_heure) / vitesse - (time.monotonic() - debut_boucle)
+                    if attente > 0:
+                        time.sleep(attente)
+
+                for copie in range(multiplier):
+                    try:
+                        payload = json.loads(contenu)
+                    except ValueError:
+                        payload = None
+                    topic_copie = remapper_identifiant(topic, payload, copie)
+                    if isinstance(payload, dict):
+                        restampiller(topic_copie, payload, sequences, time.time())
+                        contenu_copie = json.dumps(payload, ensure_ascii=False).encode()
+                    else:
+                        contenu_copie = contenu
+                    client.publish(topic_copie, contenu_copie)
+                    nombre_messages += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+    duree = time.time() - debut_rejeu
+    print(f"{nombre_messages} messages rejoués en {duree:.1f} s ({nombre_messages / max(duree, 1e-9):.0f} msg/s)")
+
+def main():
+    """Fonction principale."""
+    parser = argparse.ArgumentParser(description="Enregistrement et rejeu du trafic MQTT des capteurs.")
+    sous_commandes = parser.add_subparsers(dest="commande", required=True)
+
+    parser_enregistrer = sous_commandes.add_parser("enregistrer", help="Enregistre le trafic MQTT dans un fichier")
+    parser_enregistrer.add_argument("fichier")
+    parser_enregistrer.add_argument("--topic", default=TOPIC_ENREGISTREMENT)
+    parser_enregistrer.add_argument("--duree", type=float, default=None, help="Durée en secondes (défaut: jusqu'à Ctrl+C)")
+
+    parser_rejouer = sous_commandes.add_parser("rejouer", help="Republie un fichier d'enregistrement")
+    parser_rejouer.add_argument("fichier")
+    vitesses = parser_rejouer.add_mutually_exclusive_group()
+    vitesses.add_argument("--vitesse", type=float, default=1.0, help="Facteur d'accélération (défaut: 1)")
+    vitesses.add_argument("--max", action="store_true", help="Rejouer aussi vite que possible")
+    parser_rejouer.add_argument("--filtre", action="append", default=[],
+                                help="Filtre de topic MQTT (jokers + et # acceptés), répétable")
+    parser_rejouer.add_argument("--multiplier", type=int, default=1,
+                                help="Nombre de copies de la flotte (identifiants suffixés _x1, _x2...)")
+    parser_rejouer.add_argument("--boucles", type=int, default=1, help="Nombre de rejeux successifs")
+
+    arguments = parser.parse_args()
+
+    if arguments.commande == "enregistrer":
+        enregistrer(arguments.fichier, arguments.topic, arguments.duree)
+    else:
+        vitesse = None if arguments.max else arguments.vitesse
+        rejouer(arguments.fichier, vitesse, arguments.filtre, arguments.multiplier, arguments.boucles)
+
+if __name__ == "__main__":
+    main()